@@ -0,0 +1,155 @@
+"""
+Benchmark de la analítica de deriva sobre lecturas sintéticas.
+
+Genera N lecturas (por defecto 1.000.000) en memoria y mide el cálculo
+vectorizado de calibration_analytics frente a un bucle Python equivalente
+sobre una muestra. Con --mongo-url las lecturas se cargan además en una base de
+datos temporal (sensor_readings de --db, que se borra al terminar) y se mide la
+carga MongoDB → DataFrame de load_readings_frame, que es lo que paga cada
+petición sin caché.
+
+Uso (desde backend/):
+    python benchmarks/bench_analytics.py [--readings 1000000] [--seed 42]
+        [--mongo-url mongodb://localhost:27017] [--db bench_analytics]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from calibration_analytics import readings_frame, compute_drift, load_readings_frame, summarize  # noqa: E402
+from sensor_readings import READINGS_COLLECTION, ensure_sensor_readings_collection  # noqa: E402
+
+INSERT_BATCH_SIZE = 10_000
+SENSORS = ["CO", "H2S", "O2", "LEL", "SO2", "NO2"]
+MODELS = ["Altair 4X", "Altair 5X", "Altair Pro", "X-am 2500", "GasAlertMax XT"]
+
+
+def synthetic_columns(readings, seed):
+    rng = np.random.default_rng(seed)
+    sensors_per_unit = 4
+    visits = 5
+    units = max(1, readings // (sensors_per_unit * visits))
+    unit = np.repeat(np.arange(units), sensors_per_unit * visits)[:readings]
+    sensor = np.tile(np.repeat(np.arange(sensors_per_unit), visits), units)[:readings]
+    visit = np.tile(np.arange(visits), units * sensors_per_unit)[:readings]
+    base = np.datetime64("2020-01-01T00:00:00")
+    ts = base + (visit * 365 + rng.integers(0, 30, readings)).astype("timedelta64[D]")
+    drift = rng.normal(-2.0, 1.0, units)[unit]
+    span = 100 + drift * visit + rng.normal(0, 1.5, readings)
+    zero = rng.normal(0, 0.3, readings)
+    return {
+        "serial_number": np.char.add("SN", unit.astype(str)),
+        "sensor": np.array(SENSORS)[sensor],
+        "model": np.array(MODELS)[unit % len(MODELS)],
+        "ts": ts,
+        "valor_zero": zero,
+        "valor_span": span,
+        "approved": rng.random(readings) > 0.05,
+    }
+
+
+def loop_drift(columns, limit):
+    """Referencia: pendiente de SPAN por equipo/sensor con bucles Python"""
+    groups = {}
+    for i in range(limit):
+        key = (columns["serial_number"][i], columns["sensor"][i])
+        t = (columns["ts"][i] - columns["ts"][0]) / np.timedelta64(1, "D") / 365.25
+        groups.setdefault(key, []).append((t, columns["valor_span"][i]))
+    slopes = {}
+    for key, points in groups.items():
+        n = len(points)
+        st = sum(p[0] for p in points)
+        sy = sum(p[1] for p in points)
+        stt = sum(p[0] * p[0] for p in points)
+        sty = sum(p[0] * p[1] for p in points)
+        denominator = n * stt - st * st
+        slopes[key] = (n * sty - st * sy) / denominator if n >= 2 and denominator else None
+    return slopes
+
+
+def reading_documents(columns):
+    """Documentos de sensor_readings equivalentes a las columnas sintéticas"""
+    ts = columns["ts"].astype("datetime64[ms]").tolist()
+    for i in range(len(ts)):
+        yield {
+            "ts": ts[i],
+            "meta": {"serial_number": str(columns["serial_number"][i]), "sensor": str(columns["sensor"][i])},
+            "model": str(columns["model"][i]),
+            "valor_zero": float(columns["valor_zero"][i]),
+            "valor_span": float(columns["valor_span"][i]),
+            "approved": bool(columns["approved"][i]),
+        }
+
+
+async def time_database_load(mongo_url, db_name, columns):
+    """Cargar las lecturas en una base de datos temporal y medir load_readings_frame"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(mongo_url)
+    await client.drop_database(db_name)
+    db = client[db_name]
+    try:
+        await ensure_sensor_readings_collection(db)
+        start = time.perf_counter()
+        batch = []
+        for doc in reading_documents(columns):
+            batch.append(doc)
+            if len(batch) >= INSERT_BATCH_SIZE:
+                await db[READINGS_COLLECTION].insert_many(batch, ordered=False)
+                batch = []
+        if batch:
+            await db[READINGS_COLLECTION].insert_many(batch, ordered=False)
+        print(f"  {'insertar en MongoDB':<38} {time.perf_counter() - start:8.3f} s")
+
+        start = time.perf_counter()
+        df = await load_readings_frame(db)
+        print(f"  {'cargar MongoDB → DataFrame':<38} {time.perf_counter() - start:8.3f} s")
+        return df
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<38} {elapsed:8.3f} s")
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de analítica de calibraciones")
+    parser.add_argument("--readings", type=int, default=1_000_000)
+    parser.add_argument("--loop-sample", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-url", help="Medir también la carga desde MongoDB (base de datos temporal)")
+    parser.add_argument("--db", default="bench_analytics")
+    args = parser.parse_args()
+
+    print(f"Lecturas sintéticas: {args.readings:,}")
+    columns, _ = timed("generar datos", synthetic_columns, args.readings, args.seed)
+    df, _ = timed("construir DataFrame", readings_frame, columns)
+    if args.mongo_url:
+        loaded = asyncio.run(time_database_load(args.mongo_url, args.db, columns))
+        print(f"  {'lecturas cargadas':<38} {len(loaded):>8,}")
+    drift, vectorized = timed("deriva vectorizada", compute_drift, df)
+    summary, _ = timed("resumen completo (deriva+APTO+atípicos)", summarize, df)
+
+    sample = min(args.loop_sample, args.readings)
+    _, loop = timed(f"deriva con bucle Python ({sample:,})", loop_drift, columns, sample)
+    projected = loop * args.readings / sample
+
+    print(f"\nGrupos equipo/sensor: {len(drift):,}  Atípicos: {len(summary['outliers'])}")
+    print(f"Bucle Python proyectado a {args.readings:,}: {projected:.2f} s "
+          f"({projected / vectorized:.0f}x más lento que la versión vectorizada)")
+
+
+if __name__ == "__main__":
+    main()
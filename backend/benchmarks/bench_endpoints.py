@@ -0,0 +1,229 @@
+"""
+Micro-benchmark de los endpoints de lectura según el tamaño de las colecciones.
+
+Para cada tamaño de --sizes (por defecto 1.000, 10.000 y 100.000 documentos)
+carga con el generador de generate_dataset.py una base de datos propia
+(bench_endpoints_<tamaño>: ese número de equipos en equipment_master y de
+calibraciones en calibration_history, ~1% de visitas activas) y mide, con la
+aplicación en este mismo proceso (httpx.ASGITransport):
+
+  - get_all_equipment_master y search_equipment_master (por cliente y por
+    un fragmento de número de serie)
+  - get_all_calibration_history y search_calibration_history
+  - las listas de estado (pending, calibrated, delivered)
+
+Por endpoint se anota la mediana de --repeat llamadas, el pico de memoria
+asignada (tracemalloc, en una llamada aparte para no alterar la latencia) y
+los bytes de la respuesta sin comprimir. La tabla final muestra el exponente
+de crecimiento entre los dos tamaños mayores (1 = lineal) y marca los
+endpoints que crecen más rápido que el tamaño (--threshold). Los listados con
+límite fijo (to_list(1000), 10.000) dejan de crecer al llegar a él.
+
+Las bases de datos se reutilizan entre ejecuciones si ya tienen el tamaño y la
+semilla pedidos (--reseed para regenerarlas). El resultado se guarda en
+--results con la clave del commit actual, como load_generator.py.
+
+Uso (desde backend/):
+    python benchmarks/bench_endpoints.py [--sizes 1000,10000,100000] [--repeat 5]
+        [--seed 42] [--reseed] [--threshold 1.2]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from argparse import Namespace
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+from pymongo import MongoClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from generate_dataset import COLLECTIONS, build_chunk, catalog, chunk_tasks, serial_plan  # noqa: E402
+from load_generator import current_commit  # noqa: E402
+
+RESULTS_FILE = BACKEND_DIR / "benchmarks" / "results" / "bench_endpoints.json"
+DB_PREFIX = "bench_endpoints"
+END_DATE = "2025-06-30"
+USERNAME = "tecnico1"
+PASSWORD = "benchmark"
+BIGGEST_CLIENT = "CLIENTE 00001"  # el de más equipos con el sesgo Zipf
+ENDPOINTS = [
+    ("get_all_equipment_master", "/api/equipment-master", {}),
+    ("search_equipment_master (cliente)", "/api/equipment-master/search", {"cliente": BIGGEST_CLIENT}),
+    ("search_equipment_master (serial)", "/api/equipment-master/search", {"serial": "12"}),
+    ("get_all_calibration_history", "/api/calibration-history/all", {}),
+    ("search_calibration_history", "/api/calibration-history/search", {"cliente": BIGGEST_CLIENT}),
+    ("equipment/pending", "/api/equipment/pending", {}),
+    ("equipment/calibrated", "/api/equipment/calibrated", {}),
+    ("equipment/delivered", "/api/equipment/delivered", {}),
+]
+
+
+def seed_database(mongo_url, size, seed):
+    """Cargar (o reutilizar) la base de datos de un tamaño; devuelve su nombre"""
+    db_name = f"{DB_PREFIX}_{size}"
+    database = MongoClient(mongo_url)[db_name]
+    marker = {"_id": "seed", "size": size, "seed": seed, "end_date": END_DATE}
+    if database.bench_meta.find_one(marker):
+        print(f"✓ {db_name} ya cargada")
+        return db_name
+
+    for name in [*COLLECTIONS, "bench_meta"]:
+        database.drop_collection(name)
+    args = Namespace(clients=max(10, size // 40), serials=size, history=size, zipf=1.1, seed=seed, end_date=END_DATE)
+    start = time.perf_counter()
+    small = catalog(args)
+    for name, docs in small.items():
+        database[name].insert_many(docs, ordered=False)
+    for task in chunk_tasks(args, small, serial_plan(args)):
+        for name, batch in build_chunk(task).items():
+            if batch:
+                database[name].insert_many(batch, ordered=False, bypass_document_validation=True)
+    database.bench_meta.insert_one(marker)
+    print(f"✓ {db_name} cargada en {time.perf_counter() - start:.1f} s")
+    return db_name
+
+
+async def measure(client, path, params, repeat):
+    """Mediana de latencia, pico de memoria asignada y bytes de la respuesta"""
+    response = await client.get(path, params=params)  # calentamiento (cachés de collStats, índices)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path, params=params)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        await client.get(path, params=params)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "latency_ms": round(statistics.median(latencies) * 1000, 2),
+        "peak_alloc_mb": round(peak / 1048576, 2),
+        "response_bytes": len(response.content),
+    }
+
+
+async def run(args, databases):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = databases[args.sizes[0]]
+    import server
+
+    results = {}
+    try:
+        for size, db_name in databases.items():
+            server.db = server.client[db_name]
+            await server.create_indexes()
+            transport = httpx.ASGITransport(app=server.app)
+            # Sin compresión: se mide el tamaño real de la respuesta serializada
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300,
+                                         headers={"Accept-Encoding": "identity"}) as client:
+                response = await client.post("/api/auth/login", json={"username": USERNAME, "password": PASSWORD})
+                response.raise_for_status()
+                client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+                results[size] = {}
+                for label, path, params in ENDPOINTS:
+                    results[size][label] = await measure(client, path, params, args.repeat)
+                    print(f"  {size:>7} {label:<36} {results[size][label]['latency_ms']:>9} ms")
+    finally:
+        await server.app.router.shutdown()
+    return results
+
+
+def growth_exponent(small_size, small_value, large_size, large_value):
+    """Exponente k de valor ∝ tamaño^k entre dos tamaños (1 = lineal)"""
+    if not small_value or not large_value:
+        return None
+    return math.log(large_value / small_value) / math.log(large_size / small_size)
+
+
+def scaling(results, sizes, threshold):
+    """Exponentes de crecimiento por endpoint entre los dos tamaños mayores"""
+    small, large = sizes[-2], sizes[-1]
+    table = {}
+    for label, *_ in ENDPOINTS:
+        exponents = {
+            metric: growth_exponent(small, results[small][label][metric], large, results[large][label][metric])
+            for metric in ("latency_ms", "peak_alloc_mb", "response_bytes")
+        }
+        table[label] = {
+            **{f"{metric}_exponent": round(value, 2) if value is not None else None for metric, value in exponents.items()},
+            "super_linear": any(value is not None and value > threshold for value in exponents.values()),
+        }
+    return table
+
+
+def print_report(results, sizes, table):
+    size_columns = "".join(f" | {f'{size} ms':>11} | {f'{size} MB':>9} | {f'{size} KB':>10}" for size in sizes)
+    header = f"{'endpoint':<36}{size_columns} | {'k lat':>5} | {'k mem':>5} | {'k bytes':>7} |"
+    print(f"\n{header}")
+    print("-" * len(header))
+    for label, *_ in ENDPOINTS:
+        line = f"{label:<36}"
+        for size in sizes:
+            m = results[size][label]
+            status = "" if m["status"] < 400 else f" ({m['status']})"
+            line += f" | {str(m['latency_ms']) + status:>11} | {m['peak_alloc_mb']:>9} | {m['response_bytes'] / 1024:>10.1f}"
+        row = table.get(label)
+        if row:
+            exponents = [row["latency_ms_exponent"], row["peak_alloc_mb_exponent"], row["response_bytes_exponent"]]
+            line += "".join(f" | {'-' if value is None else value:>{width}}" for value, width in zip(exponents, (5, 5, 7)))
+            line += " | SUPERLINEAL" if row["super_linear"] else " |"
+        print(line)
+    if len(sizes) > 1:
+        print(f"\nk: exponente de crecimiento entre {sizes[-2]} y {sizes[-1]} documentos (1 = lineal)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--sizes", type=lambda value: sorted({int(size) for size in value.split(",")}),
+                        default=[1000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="Regenerar las bases de datos aunque ya existan")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Exponente a partir del cual se marca SUPERLINEAL")
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE)
+    args = parser.parse_args()
+
+    # Sin muestreo de memoria ni trazas: su coste no debe sumarse a las latencias medidas
+    os.environ.setdefault("MEMORY_SAMPLE_RATE", "0")
+    os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+
+    if args.reseed:
+        for size in args.sizes:
+            MongoClient(args.mongo_url)[f"{DB_PREFIX}_{size}"].drop_collection("bench_meta")
+    databases = {size: seed_database(args.mongo_url, size, args.seed) for size in args.sizes}
+
+    results = asyncio.run(run(args, databases))
+    table = scaling(results, args.sizes, args.threshold) if len(args.sizes) > 1 else {}
+    print_report(results, args.sizes, table)
+
+    saved = json.loads(args.results.read_text()) if args.results.exists() else {}
+    commit = current_commit()
+    saved[commit] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "sizes": args.sizes,
+        "repeat": args.repeat,
+        "results": {str(size): endpoints for size, endpoints in results.items()},
+        "scaling": table,
+    }
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    args.results.write_text(json.dumps(saved, indent=2, ensure_ascii=False))
+    print(f"\nResultados guardados en {args.results} ({commit})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark de serialización y compresión de los listados grandes.
+
+Genera N entradas sintéticas de calibration_history (por defecto 1.000,
+10.000 y 50.000) y compara, sin base de datos ni servidor:
+
+  - camino por defecto de FastAPI: validación contra response_model,
+    serialización del modelo y json.dumps (JSONResponse)
+  - camino rápido (fast_list): valores por defecto + orjson
+
+y el tamaño en la red sin comprimir, con gzip y con brotli, con los mismos
+niveles que el middleware de compresión.
+
+Uso (desde backend/):
+    python benchmarks/bench_serialization.py [--sizes 1000 10000 50000] [--seed 42]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from server import CalibrationHistory  # noqa: E402
+from fast_responses import model_defaults  # noqa: E402
+from compression import GZIP_LEVEL, BROTLI_QUALITY, brotli  # noqa: E402
+
+SENSORS = ["CO", "H2S", "O2", "LEL", "SO2", "NO2"]
+MODELS = ["Altair 4X", "Altair 5X", "Altair Pro", "X-am 2500", "GasAlertMax XT"]
+CLIENTS = ["REPSOL PETRÓLEO", "IBERDROLA", "CEPSA", "AYUNTAMIENTO DE MADRID", "ENDESA", "NATURGY"]
+
+
+def synthetic_history(count, seed):
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        day = f"202{rng.randint(0, 5)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        docs.append({
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "serial_number": f"SN{i // 3:07d}",
+            "brand": "MSA",
+            "model": rng.choice(MODELS),
+            "client_name": rng.choice(CLIENTS),
+            "client_cif": f"A{rng.randint(10000000, 99999999)}",
+            "client_departamento": "",
+            "observations": "",
+            "entry_date": day,
+            "calibration_data": [{
+                "sensor": sensor,
+                "pre_alarm": str(rng.randint(10, 50)),
+                "alarm": str(rng.randint(50, 100)),
+                "calibration_value": str(rng.randint(10, 100)),
+                "valor_zero": "0",
+                "valor_span": f"{rng.uniform(90, 110):.1f}",
+                "calibration_bottle": f"B{rng.randint(1000, 9999)}",
+                "approved": rng.random() > 0.05
+            } for sensor in rng.sample(SENSORS, 4)],
+            "spare_parts": [],
+            "calibration_date": day,
+            "technician": rng.choice(["Juan", "Ana", "Luis"]),
+            "internal_notes": "",
+            "use_department_as_client": False,
+            "delivery_note": f"ALB-{i:06d}",
+            "certificate_number": f"{i:06d}",
+            "next_due_date": day,
+            "created_at": f"{day}T10:00:00+00:00"
+        })
+    return docs
+
+
+def timed(function, repeat=3):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def gzip_body(body):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(body) + compressor.flush()
+
+
+def default_path(adapter, docs):
+    validated = adapter.validate_python(docs)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(docs):
+    defaults = model_defaults(CalibrationHistory)
+    return orjson.dumps([{**defaults, **doc} for doc in docs])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(List[CalibrationHistory])
+    print(f"{'docs':>7} | {'default (s)':>11} | {'fast (s)':>9} | {'speedup':>7} | "
+          f"{'raw KB':>8} | {'gzip KB':>8} | {'gzip (s)':>8} | {'br KB':>8} | {'br (s)':>7}")
+    print("-" * 98)
+    for size in args.sizes:
+        docs = synthetic_history(size, args.seed)
+        default_time, default_body = timed(lambda: default_path(adapter, docs))
+        fast_time, fast_body = timed(lambda: fast_path(docs))
+        assert orjson.loads(fast_body) == json.loads(default_body), "fast path output differs"
+
+        gzip_time, gzipped = timed(lambda: gzip_body(fast_body))
+        if brotli is not None:
+            br_time, brotlied = timed(lambda: brotli.compress(fast_body, quality=BROTLI_QUALITY))
+            br_kb, br_s = f"{len(brotlied) / 1024:8.0f}", f"{br_time:7.3f}"
+        else:
+            br_kb, br_s = f"{'n/a':>8}", f"{'n/a':>7}"
+
+        print(f"{size:>7} | {default_time:>11.3f} | {fast_time:>9.3f} | {default_time / fast_time:>6.1f}x | "
+              f"{len(fast_body) / 1024:>8.0f} | {len(gzipped) / 1024:>8.0f} | {gzip_time:>8.3f} | {br_kb} | {br_s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Generador de un dataset sintético del taller a tamaño de producción.
+
+Rellena users, clients (con departamentos), brands, models, technicians,
+equipment_master, equipment (visitas activas), equipment_delivered y
+calibration_history con distribuciones realistas:
+
+  - clientes con sesgo Zipf: unos pocos grandes clientes concentran la
+    mayor parte de los equipos (--zipf, por defecto 1.1)
+  - de 1 a 6 sensores por calibración, repuestos en ~20% de las visitas
+    y un ~5% de sensores no aptos
+  - visitas de cada equipo espaciadas ~1 año hacia atrás desde el último año
+
+equipment_catalog ya no existe como colección aparte: su contenido (última
+entrada y últimos sensores calibrados) va en equipment_master. La última
+visita de cada equipo se guarda además como entregada en equipment_delivered.
+
+Todo es reproducible a partir de --seed y --end-date, con independencia del
+número de procesos: los equipos se reparten en bloques y cada bloque se genera con su
+propia semilla y se inserta con insert_many desordenado desde un pool de
+--workers procesos. Al terminar se crean los índices del servidor y se
+reconstruyen equipment_summary y workshop_stats (salvo --no-derived). Para
+pasar el historial antiguo al archivo: python manage.py tier-history.
+
+Uso (desde backend/; por defecto 5.000 clientes, 200.000 equipos y
+2.000.000 de calibraciones, --scale 0.01 para una prueba rápida):
+    python benchmarks/generate_dataset.py [--db benchmark] [--scale 1] [--seed 42]
+        [--workers 8] [--drop] [--no-derived]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+from pymongo import MongoClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+load_dotenv(BACKEND_DIR / ".env")
+
+from dates import with_datetimes  # noqa: E402
+
+CHUNK_SERIALS = 2000
+ACTIVE_FRACTION = 0.01
+TECHNICIANS = ["Juan Pérez", "Ana García", "Luis Martín", "Marta López", "Carlos Ruiz", "Elena Sanz"]
+SENSORS = ["CO", "H2S", "O2", "LEL", "SO2", "NO2", "NH3", "CL2", "PID"]
+BRANDS = {
+    "MSA": ["Altair 4X", "Altair 5X", "Altair Pro", "Altair 4XR"],
+    "Dräger": ["X-am 2500", "X-am 5600", "Pac 6500", "Pac 8000"],
+    "Honeywell": ["GasAlertMax XT", "BW Clip", "MicroClip XL"],
+    "Industrial Scientific": ["MX4", "Ventis Pro5", "Tango TX1"],
+}
+DEPARTAMENTOS = ["Mantenimiento", "Seguridad", "Producción", "Laboratorio", "Almacén", "Calidad"]
+SPARE_PARTS = [("Filtro hidrofóbico", "F-100"), ("Sensor CO", "S-CO"), ("Sensor O2", "S-O2"),
+               ("Batería", "BAT-01"), ("Clip", "CL-02"), ("Carcasa", "CAR-03")]
+DOCUMENTS = ["equipment_master", "equipment", "equipment_delivered", "calibration_history"]
+COLLECTIONS = ["users", "clients", "brands", "models", "technicians", *DOCUMENTS,
+               "equipment_summary", "workshop_stats"]
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _day(date):
+    return date.strftime("%Y-%m-%d")
+
+
+def _timestamp(date):
+    return date.replace(tzinfo=timezone.utc).isoformat()
+
+
+def catalog(args):
+    """Clientes, marcas, modelos, técnicos y usuarios (documentos pequeños, en el proceso principal)"""
+    rng = random.Random(args.seed)
+    clients = []
+    for i in range(args.clients):
+        departamentos = rng.sample(DEPARTAMENTOS, rng.choice([0, 0, 1, 2, 3]))
+        clients.append({
+            "id": _uuid(rng),
+            "name": f"CLIENTE {i + 1:05d} S.L.",
+            "cif": f"B{rng.randint(10000000, 99999999)}",
+            "departamentos": departamentos,
+        })
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash("benchmark")
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        "clients": clients,
+        "brands": [{"id": _uuid(rng), "name": name} for name in BRANDS],
+        "models": [{"id": _uuid(rng), "name": name} for models in BRANDS.values() for name in models],
+        "technicians": [{"id": _uuid(rng), "name": name} for name in TECHNICIANS],
+        "users": [{
+            "id": _uuid(rng),
+            "username": f"tecnico{i + 1}",
+            "full_name": name,
+            "hashed_password": hashed,
+            "created_at": now,
+        } for i, name in enumerate(TECHNICIANS)],
+    }
+
+
+def serial_plan(args):
+    """Cliente, modelo y número de visitas de cada equipo (vectorizado con numpy)"""
+    rng = np.random.default_rng(args.seed)
+    ranks = np.arange(1, args.clients + 1)
+    weights = 1.0 / ranks ** args.zipf
+    client_index = rng.choice(args.clients, size=args.serials, p=weights / weights.sum())
+    model_count = sum(len(models) for models in BRANDS.values())
+    model_index = rng.integers(0, model_count, size=args.serials)
+    if args.history >= args.serials:
+        visits = 1 + rng.multinomial(args.history - args.serials, np.full(args.serials, 1 / args.serials))
+    else:
+        visits = rng.multinomial(args.history, np.full(args.serials, 1 / args.serials))
+    return client_index, model_index, visits
+
+
+def calibration_data(rng):
+    return [{
+        "sensor": sensor,
+        "pre_alarm": str(rng.randint(10, 50)),
+        "alarm": str(rng.randint(50, 100)),
+        "calibration_value": str(rng.randint(10, 100)),
+        "valor_zero": f"{rng.gauss(0, 0.3):.1f}",
+        "valor_span": f"{rng.gauss(100, 3):.1f}",
+        "calibration_bottle": f"B{rng.randint(1000, 1400)}",
+        "approved": rng.random() > 0.05,
+    } for sensor in rng.sample(SENSORS, rng.choice([1, 2, 4, 4, 4, 5, 6]))]
+
+
+def spare_parts(rng):
+    if rng.random() >= 0.2:
+        return []
+    return [{"descripcion": d, "referencia": r, "garantia": rng.random() < 0.15}
+            for d, r in rng.sample(SPARE_PARTS, rng.randint(1, 2))]
+
+
+def build_chunk(task):
+    """Documentos de un bloque de equipos (determinista para cada semilla y bloque)"""
+    seed, end_date, chunk, first_serial, history_offset, clients, models, client_index, model_index, visits = task
+    rng = random.Random(seed * 1_000_003 + chunk)
+    today = datetime.fromisoformat(end_date)
+    docs = {name: [] for name in DOCUMENTS}
+    history_number = history_offset
+
+    for i, (client_i, model_i, count) in enumerate(zip(client_index, model_index, visits)):
+        serial = f"SN{first_serial + i:07d}"
+        client = clients[client_i]
+        brand, model = models[model_i]
+        departamento = rng.choice(client["departamentos"]) if client["departamentos"] else ""
+        owner = {
+            "brand": brand, "model": model, "client_name": client["name"],
+            "client_cif": client["cif"], "client_departamento": departamento,
+        }
+        last_entry = today - timedelta(days=rng.randint(15, 380))
+        last_visit = None
+        last_data = None
+        for v in range(count):
+            entry = last_entry - timedelta(days=365 * (count - 1 - v) + rng.randint(-30, 30))
+            calibrated = entry + timedelta(days=rng.randint(0, 10))
+            delivered = calibrated + timedelta(days=rng.randint(0, 5))
+            history_number += 1
+            last_data = calibration_data(rng)
+            last_visit = {
+                "id": _uuid(rng),
+                "serial_number": serial,
+                **owner,
+                "observations": "",
+                "entry_date": _day(entry),
+                "calibration_data": last_data,
+                "spare_parts": spare_parts(rng),
+                "calibration_date": _day(calibrated),
+                "technician": rng.choice(TECHNICIANS),
+                "internal_notes": "",
+                "use_department_as_client": bool(departamento) and rng.random() < 0.3,
+                "delivery_note": f"ALB-{history_number:08d}",
+                "certificate_number": f"{str(calibrated.year)[-2:]}-{history_number:05d}",
+                "next_due_date": _day(calibrated + timedelta(days=365)),
+                "created_at": _timestamp(delivered),
+            }
+            docs["calibration_history"].append(with_datetimes(last_visit))
+
+        if last_visit is not None:
+            docs["equipment_delivered"].append(with_datetimes({
+                **{k: last_visit[k] for k in ("serial_number", "entry_date", "calibration_data", "spare_parts",
+                                              "calibration_date", "technician", "internal_notes",
+                                              "use_department_as_client", "delivery_note", "certificate_number")},
+                **owner,
+                "id": _uuid(rng),
+                "observations": "",
+                "status": "delivered",
+                "delivery_location": "Taller",
+                "delivery_date": _day(datetime.fromisoformat(last_visit["created_at"])),
+            }))
+
+        if rng.random() < ACTIVE_FRACTION:
+            entry = today - timedelta(days=rng.randint(0, 14))
+            visit = {
+                "id": _uuid(rng), **owner, "serial_number": serial, "observations": "",
+                "entry_date": _day(entry), "status": "pending",
+            }
+            if rng.random() < 0.5:
+                visit.update({
+                    "status": "calibrated", "calibration_data": calibration_data(rng),
+                    "spare_parts": spare_parts(rng), "calibration_date": _day(entry + timedelta(days=1)),
+                    "technician": rng.choice(TECHNICIANS), "internal_notes": "", "use_department_as_client": False,
+                })
+            docs["equipment"].append(with_datetimes(visit))
+            last_entry = entry
+
+        created = _timestamp(today - timedelta(days=365 * max(count, 1)))
+        docs["equipment_master"].append(with_datetimes({
+            "id": _uuid(rng),
+            "serial_number": serial,
+            "brand": brand,
+            "model": model,
+            "current_client_name": client["name"],
+            "current_client_cif": client["cif"],
+            "current_client_departamento": departamento,
+            "default_sensors": [{"sensor": s["sensor"], "pre_alarm": s["pre_alarm"], "alarm": s["alarm"],
+                                 "calibration_value": s["calibration_value"]} for s in (last_data or [])],
+            "general_observations": "",
+            "created_at": created,
+            "updated_at": created,
+            "last_workshop_entry": _day(last_entry),
+            "last_calibration_data": last_data,
+        }))
+    return docs
+
+
+_worker_db = None
+
+
+def _init_worker(mongo_url, db_name):
+    global _worker_db
+    _worker_db = MongoClient(mongo_url)[db_name]
+
+
+def insert_chunk(task):
+    docs = build_chunk(task)
+    for name, batch in docs.items():
+        if batch:
+            _worker_db[name].insert_many(batch, ordered=False, bypass_document_validation=True)
+    return {name: len(batch) for name, batch in docs.items()}
+
+
+def chunk_tasks(args, small, plan):
+    clients = [{"name": c["name"], "cif": c["cif"], "departamentos": c["departamentos"]} for c in small["clients"]]
+    models = [(brand, model) for brand, names in BRANDS.items() for model in names]
+    client_index, model_index, visits = plan
+    offsets = np.concatenate(([0], np.cumsum(visits)))
+    for chunk, start in enumerate(range(0, args.serials, CHUNK_SERIALS)):
+        end = min(start + CHUNK_SERIALS, args.serials)
+        yield (args.seed, args.end_date, chunk, start + 1, int(offsets[start]), clients, models,
+               client_index[start:end].tolist(), model_index[start:end].tolist(), visits[start:end].tolist())
+
+
+async def build_derived(mongo_url, db_name):
+    """Índices del servidor y colecciones derivadas (equipment_summary, workshop_stats)"""
+    os.environ["MONGO_URL"] = mongo_url
+    os.environ["DB_NAME"] = db_name
+    from server import db, client, create_indexes
+    from equipment_summary import rebuild_equipment_summary
+    from workshop_stats import rebuild_workshop_stats
+    try:
+        await create_indexes()
+        print("✓ índices creados")
+        print(f"✓ equipment_summary: {await rebuild_equipment_summary(db)} equipos")
+        print(f"✓ workshop_stats: {await rebuild_workshop_stats(db)} documentos")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="benchmark", help="Base de datos de destino")
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--serials", type=int, default=200_000)
+    parser.add_argument("--history", type=int, default=2_000_000)
+    parser.add_argument("--scale", type=float, default=1.0, help="Factor sobre clientes, equipos e historial")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Exponente del sesgo de clientes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", default=datetime.now().strftime("%Y-%m-%d"),
+                        help="Fecha de referencia de las visitas (YYYY-MM-DD); fijarla para repetir el mismo dataset")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--drop", action="store_true", help="Vaciar las colecciones antes de generar")
+    parser.add_argument("--no-derived", action="store_true", help="No crear índices ni colecciones derivadas")
+    args = parser.parse_args()
+    args.clients = max(1, int(args.clients * args.scale))
+    args.serials = max(1, int(args.serials * args.scale))
+    args.history = int(args.history * args.scale)
+
+    database = MongoClient(args.mongo_url)[args.db]
+    if args.drop:
+        for name in COLLECTIONS:
+            database.drop_collection(name)
+
+    start = time.perf_counter()
+    small = catalog(args)
+    for name, docs in small.items():
+        database[name].insert_many(docs, ordered=False)
+    plan = serial_plan(args)
+    print(f"Generando {args.clients} clientes, {args.serials} equipos y {int(plan[2].sum())} calibraciones "
+          f"con {args.workers} procesos (semilla {args.seed})")
+
+    totals = {name: 0 for name in DOCUMENTS}
+    with Pool(args.workers, initializer=_init_worker, initargs=(args.mongo_url, args.db)) as pool:
+        for counts in pool.imap_unordered(insert_chunk, chunk_tasks(args, small, plan)):
+            for name, count in counts.items():
+                totals[name] += count
+            elapsed = time.perf_counter() - start
+            print(f"  {totals['calibration_history']:>9} calibraciones  "
+                  f"{totals['calibration_history'] / elapsed:>8.0f}/s", end="\r", flush=True)
+    print()
+
+    for name, count in totals.items():
+        print(f"✓ {name}: {count}")
+    print(f"✓ datos insertados en {time.perf_counter() - start:.1f} s")
+
+    if not args.no_derived:
+        asyncio.run(build_derived(args.mongo_url, args.db))
+
+
+if __name__ == "__main__":
+    main()
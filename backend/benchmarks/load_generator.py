@@ -0,0 +1,287 @@
+"""
+Generador de carga del flujo del taller contra una instancia local.
+
+Cada usuario virtual repite, con la proporción de --mix, dos escenarios:
+
+  - workflow: pantalla de entrada (/intake), entrada al taller, calibración,
+    entrega y certificado PDF de un número de serie nuevo
+  - reads: una de las consultas habituales (colas del taller, historial de
+    los últimos 30 días, historial de un equipo, búsqueda, resumen)
+
+con --concurrency usuarios a la vez durante --duration segundos. Sin --url la
+aplicación se ejecuta en este mismo proceso (httpx.ASGITransport) contra
+MONGO_URL/DB_NAME (por defecto mongodb://localhost:27017 y `benchmark`); con
+--url se ataca un uvicorn local. Conviene cargar antes un dataset con
+generate_dataset.py.
+
+Se muestra el throughput y p50/p95/p99 por endpoint, y el resultado se guarda
+en --results con la clave del commit actual (git rev-parse) para comparar
+entre commits con --compare <commit>.
+
+Uso (desde backend/):
+    python benchmarks/load_generator.py [--url http://localhost:8001] [--concurrency 16]
+        [--duration 30] [--mix workflow=1,reads=4] [--seed 42] [--compare <commit>]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+RESULTS_FILE = BACKEND_DIR / "benchmarks" / "results" / "load_generator.json"
+SENSORS = ["CO", "H2S", "O2", "LEL", "SO2", "NO2"]
+BRANDS = {"MSA": ["Altair 4X", "Altair 5X"], "Dräger": ["X-am 2500", "Pac 6500"], "Honeywell": ["GasAlertMax XT"]}
+CLIENTS = [("REPSOL PETRÓLEO", "A28047223"), ("IBERDROLA", "A48010615"), ("CEPSA", "A28003119"),
+           ("AYUNTAMIENTO DE MADRID", "P2807900B"), ("ENDESA", "A81948077"), ("NATURGY", "A08015497")]
+TECHNICIANS = ["Juan", "Ana", "Luis"]
+USERNAME = "loadgen"
+PASSWORD = "loadgen"
+
+
+class Recorder:
+    """Latencias y errores por endpoint"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client, label, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.latencies[label].append(time.perf_counter() - start)
+        if not ok:
+            self.errors[label] += 1
+        return response
+
+
+def percentile(values, p):
+    """Percentil por rango más cercano de una lista ordenada"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def calibration_payload(rng):
+    return {
+        "calibration_data": [{
+            "sensor": sensor,
+            "pre_alarm": str(rng.randint(10, 50)),
+            "alarm": str(rng.randint(50, 100)),
+            "calibration_value": str(rng.randint(10, 100)),
+            "valor_zero": "0",
+            "valor_span": f"{rng.uniform(90, 110):.1f}",
+            "calibration_bottle": f"B{rng.randint(1000, 9999)}",
+            "approved": rng.random() > 0.05
+        } for sensor in rng.sample(SENSORS, 4)],
+        "spare_parts": [{"descripcion": "Filtro", "referencia": "F-100", "garantia": False}] if rng.random() < 0.2 else [],
+        "calibration_date": datetime.now().strftime("%Y-%m-%d"),
+        "technician": rng.choice(TECHNICIANS),
+    }
+
+
+async def workflow(client, recorder, rng, serial, serials):
+    """Entrada → calibración → entrega → certificado de un equipo nuevo"""
+    brand = rng.choice(list(BRANDS))
+    client_name, client_cif = rng.choice(CLIENTS)
+    today = datetime.now().strftime("%Y-%m-%d")
+    await recorder.request(client, "GET /api/intake/{serial}", "GET", f"/api/intake/{serial}")
+    await recorder.request(client, "POST /api/equipment", "POST", "/api/equipment", json={
+        "brand": brand, "model": rng.choice(BRANDS[brand]), "client_name": client_name,
+        "client_cif": client_cif, "serial_number": serial, "entry_date": today
+    })
+    await recorder.request(client, "PUT /api/equipment/{serial}/calibrate", "PUT",
+                           f"/api/equipment/{serial}/calibrate", json=calibration_payload(rng))
+    await recorder.request(client, "PUT /api/equipment/deliver", "PUT", "/api/equipment/deliver", json={
+        "serial_numbers": [serial], "delivery_note": f"ALB-{serial}", "delivery_location": "Taller",
+        "delivery_date": today
+    })
+    await recorder.request(client, "GET /api/equipment/{serial}/certificate", "GET",
+                           f"/api/equipment/{serial}/certificate")
+    serials.append(serial)
+
+
+async def reads(client, recorder, rng, serials):
+    """Una consulta de lectura de las pantallas del taller"""
+    since = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d")
+    serial = rng.choice(serials) if serials else "SN0000001"
+    choice = rng.choices(
+        ["pending", "calibrated", "history", "equipment_history", "search", "summary"],
+        weights=[3, 3, 1, 3, 1, 2]
+    )[0]
+    if choice == "pending":
+        await recorder.request(client, "GET /api/equipment/pending", "GET", "/api/equipment/pending")
+    elif choice == "calibrated":
+        await recorder.request(client, "GET /api/equipment/calibrated", "GET", "/api/equipment/calibrated")
+    elif choice == "history":
+        await recorder.request(client, "GET /api/calibration-history/all", "GET",
+                               "/api/calibration-history/all", params={"from": since})
+    elif choice == "equipment_history":
+        await recorder.request(client, "GET /api/equipment/{serial}/history", "GET",
+                               f"/api/equipment/{serial}/history")
+    elif choice == "search":
+        await recorder.request(client, "GET /api/calibration-history/search", "GET",
+                               "/api/calibration-history/search", params={"serial": serial, "from": since})
+    else:
+        await recorder.request(client, "GET /api/equipment-summary", "GET",
+                               "/api/equipment-summary", params={"cliente": rng.choice(CLIENTS)[0]})
+
+
+async def user(worker, client, recorder, args, run_id, deadline, serials):
+    rng = random.Random(args.seed * 1000 + worker)
+    names = list(args.mix)
+    weights = [args.mix[name] for name in names]
+    iteration = 0
+    while time.perf_counter() < deadline:
+        if rng.choices(names, weights=weights)[0] == "workflow":
+            await workflow(client, recorder, rng, f"LG{run_id}-{worker}-{iteration}", serials)
+        else:
+            await reads(client, recorder, rng, serials)
+        iteration += 1
+
+
+async def authenticate(client):
+    await client.post("/api/auth/register", json={"username": USERNAME, "password": PASSWORD, "full_name": "Load generator"})
+    response = await client.post("/api/auth/login", json={"username": USERNAME, "password": PASSWORD})
+    response.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+
+async def run(args):
+    app = None
+    if args.url:
+        transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.concurrency))
+        base_url = args.url
+    else:
+        os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        os.environ.setdefault("DB_NAME", "benchmark")
+        from server import app
+        await app.router.startup()
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://loadgen"
+
+    run_id = datetime.now().strftime("%H%M%S")
+    recorder = Recorder()
+    serials = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+            await authenticate(client)
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(
+                user(worker, client, recorder, args, run_id, deadline, serials)
+                for worker in range(args.concurrency)
+            ))
+            elapsed = time.perf_counter() - start
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+    return recorder, elapsed
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for label, latencies in sorted(recorder.latencies.items()):
+        latencies.sort()
+        endpoints[label] = {
+            "count": len(latencies),
+            "errors": recorder.errors[label],
+            "rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=BACKEND_DIR).returncode != 0
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(summary, baseline=None):
+    print(f"\n{summary['requests']} peticiones en {summary['duration_s']} s: "
+          f"{summary['throughput_rps']} req/s, {summary['errors']} errores\n")
+    header = f"{'endpoint':<44} | {'n':>6} | {'err':>4} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}"
+    if baseline:
+        header += f" | {'Δp95':>7}"
+    print(header)
+    print("-" * len(header))
+    for label, e in summary["endpoints"].items():
+        line = (f"{label:<44} | {e['count']:>6} | {e['errors']:>4} | {e['rps']:>7} | "
+                f"{e['p50_ms']:>8} | {e['p95_ms']:>8} | {e['p99_ms']:>8}")
+        if baseline:
+            previous = baseline["endpoints"].get(label)
+            line += f" | {(e['p95_ms'] / previous['p95_ms'] - 1) * 100:>+6.0f}%" if previous else f" | {'-':>7}"
+        print(line)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("workflow", "reads"):
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL de un uvicorn local; sin ella, la app en este proceso")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", type=parse_mix, default="workflow=1,reads=4")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE)
+    parser.add_argument("--compare", help="commit guardado en --results con el que comparar el p95")
+    args = parser.parse_args()
+
+    recorder, elapsed = asyncio.run(run(args))
+    summary = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or "in-process",
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        **summarize(recorder, elapsed),
+    }
+
+    results = json.loads(args.results.read_text()) if args.results.exists() else {}
+    print_report(summary, results.get(args.compare) if args.compare else None)
+    commit = current_commit()
+    results[commit] = summary
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    args.results.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"\nResultados guardados en {args.results} ({commit})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Búsqueda de certificados por botella de calibración (retirada de botellas).
+
+Si una botella de gas patrón resulta estar fuera de especificación hay que
+localizar todas las calibraciones que la usaron. El número de botella está
+dentro del array calibration_data, así que la consulta se apoya en un índice
+multikey sobre `calibration_data.calibration_bottle`.
+"""
+RECALL_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "serial_number": 1,
+    "brand": 1,
+    "model": 1,
+    "client_name": 1,
+    "client_cif": 1,
+    "client_departamento": 1,
+    "calibration_date": 1,
+    "certificate_number": 1,
+    "delivery_note": 1,
+    "calibration_data.sensor": 1,
+    "calibration_data.calibration_bottle": 1
+}
+
+RECALL_HEADER = [
+    "Nº CERTIFICADO", "FECHA CALIBRACIÓN", "Nº SERIE", "MARCA", "MODELO",
+    "CLIENTE", "CIF", "DEPARTAMENTO", "Nº ALBARÁN", "SENSORES"
+]
+
+
+def bottle_query(bottle):
+    return {"calibration_data.calibration_bottle": bottle}
+
+
+def recall_record(entry, bottle):
+    """Certificado afectado con los sensores calibrados con la botella"""
+    sensors = [
+        item.get("sensor", "")
+        for item in entry.get("calibration_data") or []
+        if item.get("calibration_bottle") == bottle
+    ]
+    return {
+        "history_id": entry.get("id"),
+        "certificate_number": entry.get("certificate_number"),
+        "calibration_date": entry.get("calibration_date"),
+        "serial_number": entry.get("serial_number"),
+        "brand": entry.get("brand"),
+        "model": entry.get("model"),
+        "client_name": entry.get("client_name"),
+        "client_cif": entry.get("client_cif"),
+        "client_departamento": entry.get("client_departamento", ""),
+        "delivery_note": entry.get("delivery_note"),
+        "sensors": sensors
+    }
+
+
+def recall_rows(bottle):
+    """Función de filas CSV para iter_csv"""
+    def to_rows(entry):
+        record = recall_record(entry, bottle)
+        return [[
+            record["certificate_number"] or "",
+            record["calibration_date"] or "",
+            record["serial_number"] or "",
+            record["brand"] or "",
+            record["model"] or "",
+            record["client_name"] or "",
+            record["client_cif"] or "",
+            record["client_departamento"] or "",
+            record["delivery_note"] or "",
+            ", ".join(record["sensors"])
+        ]]
+    return to_rows
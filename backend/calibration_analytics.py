@@ -0,0 +1,187 @@
+"""
+Analítica de deriva y fallos de sensores sobre las lecturas de calibración.
+
+Las lecturas de sensor_readings se cargan por columnas en un DataFrame y
+todos los cálculos son vectorizados (groupby de pandas / NumPy):
+
+  - deriva: pendiente por mínimos cuadrados de ZERO y SPAN frente al tiempo,
+    por equipo y sensor, expresada en unidades por año
+  - tasa de aprobación (APTO) por modelo y por modelo/sensor
+  - equipos atípicos: pendientes de SPAN con |z| > OUTLIER_Z dentro de su
+    modelo y tipo de sensor
+
+Los resultados se guardan por modelo en analytics_cache y se reutilizan
+durante ANALYTICS_CACHE_MINUTES. La construcción del DataFrame y los cálculos
+se ejecutan en un hilo (asyncio.to_thread) para no bloquear el event loop.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone, timedelta
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from sensor_readings import READINGS_COLLECTION
+
+ANALYTICS_CACHE_MINUTES = int(os.environ.get("ANALYTICS_CACHE_MINUTES", "60"))
+OUTLIER_Z = 3.0
+ALL_MODELS = "__all__"
+FETCH_BATCH_SIZE = 5000
+
+_COLUMNS = ["serial_number", "sensor", "model", "ts", "valor_zero", "valor_span", "approved"]
+
+
+async def fetch_readings(db, model=None):
+    """
+    Lecturas (opcionalmente de un modelo) ya aplanadas por la agregación, en los
+    lotes que devuelve el cursor: en el event loop no se toca cada documento
+    """
+    pipeline = [
+        {"$match": {"model": model} if model else {}},
+        {"$project": {
+            "_id": 0,
+            "serial_number": "$meta.serial_number",
+            "sensor": "$meta.sensor",
+            "model": 1,
+            "ts": 1,
+            "valor_zero": 1,
+            "valor_span": 1,
+            "approved": {"$ifNull": ["$approved", False]}
+        }}
+    ]
+    cursor = db[READINGS_COLLECTION].aggregate(pipeline, batchSize=FETCH_BATCH_SIZE)
+    batches = []
+    while True:
+        batch = await cursor.to_list(FETCH_BATCH_SIZE)
+        if not batch:
+            return batches
+        batches.append(batch)
+
+
+def frame_from_batches(batches):
+    """DataFrame tipado a partir de los lotes de fetch_readings (CPU: fuera del event loop)"""
+    records = pd.DataFrame.from_records(chain.from_iterable(batches), columns=_COLUMNS)
+    return readings_frame({name: records[name] for name in _COLUMNS})
+
+
+async def load_readings_frame(db, model=None):
+    """Cargar las lecturas (opcionalmente de un modelo) en un DataFrame por columnas"""
+    batches = await fetch_readings(db, model)
+    return await asyncio.to_thread(frame_from_batches, batches)
+
+
+def readings_frame(columns):
+    """Construir el DataFrame tipado a partir de columnas (listas o arrays)"""
+    return pd.DataFrame({
+        "serial_number": pd.Series(columns["serial_number"], dtype="category"),
+        "sensor": pd.Series(columns["sensor"], dtype="category"),
+        "model": pd.Series(columns["model"], dtype="category"),
+        "ts": pd.to_datetime(pd.Series(columns["ts"]), utc=True),
+        "valor_zero": pd.to_numeric(pd.Series(columns["valor_zero"], dtype="object"), errors="coerce"),
+        "valor_span": pd.to_numeric(pd.Series(columns["valor_span"], dtype="object"), errors="coerce"),
+        "approved": pd.Series(columns["approved"], dtype="bool")
+    })
+
+
+def compute_drift(df):
+    """
+    Pendiente (unidades/año) de ZERO y SPAN por equipo y sensor.
+    Usa las sumas de mínimos cuadrados agrupadas, sin bucles por grupo.
+    """
+    keys = ["model", "serial_number", "sensor"]
+    if df.empty:
+        return pd.DataFrame(columns=keys + ["visits", "zero_slope", "span_slope"])
+
+    years = (df["ts"] - df["ts"].min()).dt.total_seconds().to_numpy() / (365.25 * 86400)
+    work = df[keys].copy()
+    work["visits"] = 1
+    result = None
+    for field, name in (("valor_zero", "zero_slope"), ("valor_span", "span_slope")):
+        y = df[field].to_numpy(dtype="float64")
+        valid = ~np.isnan(y)
+        t = np.where(valid, years, 0.0)
+        y = np.where(valid, y, 0.0)
+        work["n"] = valid.astype("int64")
+        work["t"] = t
+        work["y"] = y
+        work["tt"] = t * t
+        work["ty"] = t * y
+        sums = work.groupby(keys, observed=True)[["visits", "n", "t", "y", "tt", "ty"]].sum()
+        denominator = sums["n"] * sums["tt"] - sums["t"] ** 2
+        slope = (sums["n"] * sums["ty"] - sums["t"] * sums["y"]) / denominator.where(denominator > 1e-12)
+        slope = slope.where(sums["n"] >= 2)
+        if result is None:
+            result = sums[["visits"]].copy()
+        result[name] = slope
+    return result.reset_index()
+
+
+def compute_approval_rates(df):
+    """Tasa de aprobación (APTO) por modelo y por modelo/sensor"""
+    by_model = df.groupby("model", observed=True)["approved"].agg(readings="size", approval_rate="mean")
+    by_sensor = df.groupby(["model", "sensor"], observed=True)["approved"].agg(readings="size", approval_rate="mean")
+    return by_model.reset_index(), by_sensor.reset_index()
+
+
+def compute_outliers(drift, z_threshold=OUTLIER_Z):
+    """Equipos cuya pendiente de SPAN se aleja más de z_threshold desviaciones de su modelo/sensor"""
+    slopes = drift.dropna(subset=["span_slope"])
+    if slopes.empty:
+        return slopes.assign(span_z=pd.Series(dtype="float64"))
+    grouped = slopes.groupby(["model", "sensor"], observed=True)["span_slope"]
+    std = grouped.transform("std")
+    z = (slopes["span_slope"] - grouped.transform("mean")) / std.where(std > 0)
+    slopes = slopes.assign(span_z=z)
+    return slopes[slopes["span_z"].abs() > z_threshold].sort_values("span_z", key=np.abs, ascending=False)
+
+
+def _records(df):
+    """DataFrame a lista de dicts serializable (NaN -> None)"""
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+def summarize(df):
+    """Calcular todas las cifras agregadas de un conjunto de lecturas"""
+    drift = compute_drift(df)
+    by_model, by_sensor = compute_approval_rates(df)
+    outliers = compute_outliers(drift)
+
+    sensor_drift = drift.groupby(["model", "sensor"], observed=True).agg(
+        equipment=("serial_number", "nunique"),
+        mean_zero_slope=("zero_slope", "mean"),
+        mean_span_slope=("span_slope", "mean"),
+        median_span_slope=("span_slope", "median")
+    ).reset_index()
+    sensors = by_sensor.merge(sensor_drift, on=["model", "sensor"], how="left")
+
+    return {
+        "readings": int(len(df)),
+        "equipment": int(df["serial_number"].nunique()),
+        "models": _records(by_model),
+        "sensors": _records(sensors),
+        "outliers": _records(outliers.head(200))
+    }
+
+
+async def get_model_analytics(db, model=None, refresh=False):
+    """Cifras de un modelo (o de todos), desde analytics_cache si están vigentes"""
+    key = model or ALL_MODELS
+    if not refresh:
+        cached = await db.analytics_cache.find_one({"_id": key})
+        if cached:
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(cached["computed_at"])
+            if age < timedelta(minutes=ANALYTICS_CACHE_MINUTES):
+                return {"model": model, "computed_at": cached["computed_at"], **cached["result"]}
+
+    # Construir el DataFrame y agregarlo es CPU: se hace fuera del event loop
+    batches = await fetch_readings(db, model)
+    result = await asyncio.to_thread(lambda: summarize(frame_from_batches(batches)))
+    computed_at = datetime.now(timezone.utc).isoformat()
+    await db.analytics_cache.replace_one(
+        {"_id": key},
+        {"_id": key, "computed_at": computed_at, "result": result},
+        upsert=True
+    )
+    return {"model": model, "computed_at": computed_at, **result}
@@ -0,0 +1,125 @@
+"""
+Compresión de respuestas (brotli o gzip) a partir de un tamaño mínimo.
+
+Se elige brotli si el cliente lo acepta y el paquete `brotli` está instalado,
+y gzip en caso contrario. Solo se comprimen tipos de texto (JSON, CSV, HTML,
+JS...) de al menos COMPRESSION_MIN_SIZE bytes; los PDF y XLSX ya van
+comprimidos. Las respuestas por bloques (exportaciones CSV) se comprimen
+bloque a bloque, sin esperar al final.
+"""
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se usa gzip
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+class _GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, final):
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, final):
+        out = self._compressor.process(data)
+        return out + (self._compressor.finish() if final else self._compressor.flush())
+
+
+def _choose_encoder(accept_encoding):
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return _BrotliEncoder
+    if "gzip" in accepted:
+        return _GzipEncoder
+    return None
+
+
+class CompressionMiddleware:
+    """Middleware ASGI que comprime las respuestas de texto grandes"""
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoder_class = _choose_encoder(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoder_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                response_headers = dict(message.get("headers") or [])
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in response_headers
+                    or not content_type.startswith(_COMPRESSIBLE)
+                )
+                if passthrough:
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    # Respuesta pequeña: se envía tal cual
+                    await send(start_message)
+                    await send(message)
+                    passthrough = True
+                    return
+                encoder = encoder_class()
+                response_headers = [
+                    (name, value) for name, value in start_message.get("headers", [])
+                    if name.lower() != b"content-length"
+                ]
+                response_headers.append((b"content-encoding", encoder.encoding.encode()))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+                compressed = encoder.compress(body, final=not more_body)
+                if not more_body:
+                    response_headers.append((b"content-length", str(len(compressed)).encode()))
+                await send({**start_message, "headers": response_headers})
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            await send({
+                "type": "http.response.body",
+                "body": encoder.compress(body, final=not more_body),
+                "more_body": more_body
+            })
+
+        await self.app(scope, receive, send_compressed)
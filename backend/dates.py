@@ -0,0 +1,131 @@
+"""
+Fechas como datetime BSON junto a los campos de texto de la API.
+
+La API y el frontend siguen usando texto (`entry_date`, `calibration_date`...),
+con formatos mezclados: fechas simples (YYYY-MM-DD), timestamps ISO y alguna
+fecha DD/MM/YYYY. Al escribir, cada campo de texto se acompaña de su versión
+datetime (UTC) en un campo `*_dt`, que es el que usan los filtros por rango,
+la ordenación y los índices compuestos. `python manage.py migrate-dates` añade
+los campos `*_dt` a los documentos existentes.
+"""
+from datetime import datetime, timezone, timedelta
+
+from pymongo import UpdateOne
+
+# Campo de texto -> campo datetime
+DATE_FIELDS = {
+    "entry_date": "entry_dt",
+    "calibration_date": "calibration_dt",
+    "delivery_date": "delivery_dt",
+    "created_at": "created_dt",
+    "updated_at": "updated_dt",
+}
+
+# Proyección que oculta los campos datetime en las respuestas que devuelven documentos tal cual
+DATE_PROJECTION = {"_id": 0, **{field: 0 for field in DATE_FIELDS.values()}}
+
+MIGRATED_COLLECTIONS = ["equipment", "equipment_delivered", "calibration_history", "equipment_master"]
+
+# Índices sobre los campos de texto sustituidos por sus equivalentes `*_dt`
+OBSOLETE_INDEXES = {
+    "calibration_history": [
+        "calibration_date_-1",
+        "serial_number_1_calibration_date_-1",
+        "calibration_date_1_spare_parts.referencia_1",
+        "calibration_data.calibration_bottle_1_calibration_date_-1",
+    ],
+}
+
+_DATE_ONLY_FORMATS = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"]
+
+
+def parse_datetime(value):
+    """Convertir una fecha en texto (cualquiera de los formatos usados) a datetime UTC sin tzinfo"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        value = str(value).strip()
+        parsed = None
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            for fmt in _DATE_ONLY_FORMATS:
+                try:
+                    parsed = datetime.strptime(value, fmt)
+                    break
+                except ValueError:
+                    continue
+        if parsed is None:
+            return None
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def date_fields(doc: dict):
+    """Campos `*_dt` correspondientes a los campos de fecha presentes en `doc`"""
+    return {
+        dt_field: parse_datetime(doc[field])
+        for field, dt_field in DATE_FIELDS.items()
+        if field in doc
+    }
+
+
+def with_datetimes(doc: dict):
+    """Copia de `doc` con los campos `*_dt` añadidos (para insertar o para $set)"""
+    return {**doc, **date_fields(doc)}
+
+
+def date_range_filter(date_from=None, date_to=None):
+    """
+    Filtro de rango sobre un campo datetime. `to` con solo fecha incluye el día
+    completo. Lanza ValueError si alguna fecha no se puede interpretar.
+    """
+    condition = {}
+    if date_from:
+        start = parse_datetime(date_from)
+        if start is None:
+            raise ValueError(f"Invalid 'from' date: '{date_from}'")
+        condition["$gte"] = start
+    if date_to:
+        end = parse_datetime(date_to)
+        if end is None:
+            raise ValueError(f"Invalid 'to' date: '{date_to}'")
+        if len(str(date_to).strip()) <= 10:
+            condition["$lt"] = end + timedelta(days=1)
+        else:
+            condition["$lte"] = end
+    return condition
+
+
+async def migrate_dates(db, batch_size=1000):
+    """
+    Añadir o recalcular los campos `*_dt` en los documentos existentes y
+    eliminar los índices de texto que ya no se usan.
+    """
+    projection = {field: 1 for field in DATE_FIELDS}
+    totals = {}
+    for name in MIGRATED_COLLECTIONS:
+        updated = 0
+        operations = []
+        async for doc in db[name].find({}, projection).batch_size(batch_size):
+            values = date_fields(doc)
+            if values:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": values}))
+            if len(operations) >= batch_size:
+                await db[name].bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        if operations:
+            await db[name].bulk_write(operations, ordered=False)
+            updated += len(operations)
+        totals[name] = updated
+
+    for name, indexes in OBSOLETE_INDEXES.items():
+        existing = await db[name].index_information()
+        for index in indexes:
+            if index in existing:
+                await db[name].drop_index(index)
+    return totals
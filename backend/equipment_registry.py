@@ -0,0 +1,164 @@
+"""
+Registro único por número de serie (colección equipment_master).
+
+Antes cada entrada al taller actualizaba equipment_catalog y cada calibración
+guardaba allí los últimos sensores, mientras equipment_master mantenía por
+separado marca, modelo y cliente actual del mismo equipo. Ahora
+equipment_master es el único documento por equipo: la entrada al taller
+actualiza su cliente actual y `last_workshop_entry`, y la calibración guarda
+`last_calibration_data`. `/equipment-catalog/serial/{serial}` se sirve desde
+aquí con la forma antigua, y `python manage.py merge-catalog` incorpora los
+datos de equipment_catalog existentes.
+"""
+import uuid
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from dates import parse_datetime
+
+MERGE_BATCH_SIZE = 1000
+
+# Campos que mantiene el taller; no se sobrescriben al editar el catálogo maestro
+WORKSHOP_FIELDS = {"last_workshop_entry", "last_calibration_data"}
+
+
+def _new_master(now):
+    return {
+        "id": str(uuid.uuid4()),
+        "default_sensors": [],
+        "general_observations": "",
+        "created_at": now,
+        "created_dt": parse_datetime(now),
+    }
+
+
+def _entry_update(equipment: dict):
+    now = datetime.now(timezone.utc).isoformat()
+    return UpdateOne(
+        {"serial_number": equipment["serial_number"]},
+        {
+            "$set": {
+                "brand": equipment["brand"],
+                "model": equipment["model"],
+                "current_client_name": equipment["client_name"],
+                "current_client_cif": equipment["client_cif"],
+                "current_client_departamento": equipment.get("client_departamento", ""),
+                "last_workshop_entry": equipment["entry_date"],
+                "updated_at": now,
+                "updated_dt": parse_datetime(now),
+            },
+            "$setOnInsert": _new_master(now)
+        },
+        upsert=True
+    )
+
+
+async def master_on_entry(db, equipment: dict):
+    """Actualizar (o crear) el registro de un equipo que entra al taller"""
+    await master_on_entries(db, [equipment])
+
+
+async def master_on_entries(db, equipments: list):
+    """Actualizar (o crear) el registro de los equipos que entran al taller en una sola escritura"""
+    if equipments:
+        await db.equipment_master.bulk_write([_entry_update(e) for e in equipments], ordered=False)
+
+
+async def master_on_calibration(db, serial_number: str, calibration_data: list):
+    """Guardar los sensores de la última calibración"""
+    await db.equipment_master.update_one(
+        {"serial_number": serial_number},
+        {"$set": {"last_calibration_data": calibration_data}}
+    )
+
+
+def catalog_view(master: dict):
+    """Registro con la forma de la antigua colección equipment_catalog"""
+    return {
+        "id": master.get("id"),
+        "serial_number": master["serial_number"],
+        "brand": master.get("brand", ""),
+        "model": master.get("model", ""),
+        "client_name": master.get("current_client_name", ""),
+        "client_cif": master.get("current_client_cif", ""),
+        "client_departamento": master.get("current_client_departamento", ""),
+        "last_entry_date": master.get("last_workshop_entry") or "",
+        "last_calibration_data": master.get("last_calibration_data"),
+        "created_at": master.get("created_at"),
+    }
+
+
+def _client_fields(entry: dict):
+    return {
+        "current_client_name": entry.get("client_name", ""),
+        "current_client_cif": entry.get("client_cif", ""),
+        "current_client_departamento": entry.get("client_departamento", ""),
+    }
+
+
+def _merge_update(entry: dict):
+    """Incorporar una entrada de equipment_catalog a equipment_master"""
+    update = {
+        "$setOnInsert": {
+            **_new_master(entry.get("created_at") or datetime.now(timezone.utc).isoformat()),
+            "brand": entry.get("brand", ""),
+            "model": entry.get("model", ""),
+            **_client_fields(entry),
+        }
+    }
+    if entry.get("last_entry_date"):
+        update["$max"] = {"last_workshop_entry": entry["last_entry_date"]}
+    if entry.get("last_calibration_data"):
+        update["$set"] = {"last_calibration_data": entry["last_calibration_data"]}
+    return UpdateOne({"serial_number": entry["serial_number"]}, update, upsert=True)
+
+
+def _merge_client_update(entry: dict):
+    """
+    Cliente del catálogo para un equipo maestro existente cuya última entrada es
+    anterior a la del catálogo (o no tiene). Con $lte el resultado no depende
+    del orden respecto al $max de _merge_update dentro del bulk_write
+    """
+    return UpdateOne(
+        {
+            "serial_number": entry["serial_number"],
+            "$or": [
+                {"last_workshop_entry": {"$in": [None, ""]}},
+                {"last_workshop_entry": {"$lte": entry["last_entry_date"]}},
+            ]
+        },
+        {"$set": _client_fields(entry)}
+    )
+
+
+def _merge_operations(entry: dict):
+    operations = [_merge_update(entry)]
+    if entry.get("last_entry_date"):
+        operations.append(_merge_client_update(entry))
+    return operations
+
+
+async def merge_equipment_catalog(db, drop=False, batch_size=MERGE_BATCH_SIZE):
+    """
+    Incorporar equipment_catalog a equipment_master. Los equipos que ya están en
+    el catálogo maestro conservan sus datos y reciben los últimos sensores
+    calibrados y la fecha de la última entrada, y también el cliente si la
+    entrada del catálogo es más reciente; los demás se crean. Con `drop`
+    se elimina equipment_catalog al terminar.
+    """
+    merged = 0
+    operations = []
+    async for entry in db.equipment_catalog.find({}, {"_id": 0}).batch_size(batch_size):
+        if not entry.get("serial_number"):
+            continue
+        operations.extend(_merge_operations(entry))
+        merged += 1
+        if len(operations) >= batch_size:
+            await db.equipment_master.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.equipment_master.bulk_write(operations, ordered=False)
+    if drop:
+        await db.equipment_catalog.drop()
+    return merged
@@ -0,0 +1,157 @@
+"""
+Proyección desnormalizada por número de serie (colección equipment_summary).
+
+Cada documento resume el estado actual de un equipo: cliente actual, estado,
+última calibración, último certificado y número de visitas al taller. Se
+actualiza de forma incremental desde las rutas de entrada, calibración y
+entrega, y puede reconstruirse completa con `python manage.py rebuild-summary`.
+"""
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from maintenance import compute_next_due_date, next_due_date_expression
+from history_tiering import HISTORY_ARCHIVE
+from workshop_archive import UNION_ARCHIVE
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _entry_update(equipment: dict):
+    return {
+        "$set": {
+            "brand": equipment["brand"],
+            "model": equipment["model"],
+            "client_name": equipment["client_name"],
+            "client_cif": equipment["client_cif"],
+            "client_departamento": equipment.get("client_departamento", ""),
+            "status": "pending",
+            "last_entry_date": equipment["entry_date"],
+            "updated_at": _now()
+        },
+        "$inc": {"visit_count": 1},
+        "$setOnInsert": {
+            "last_certificate_number": None,
+            "last_delivery_date": None
+        }
+    }
+
+
+async def summary_on_entry(db, equipment: dict):
+    """Registrar una nueva entrada al taller (nueva visita)"""
+    await db.equipment_summary.update_one(
+        {"serial_number": equipment["serial_number"]},
+        _entry_update(equipment),
+        upsert=True
+    )
+
+
+async def summary_on_entries(db, equipments: list):
+    """Registrar varias entradas al taller en una sola escritura"""
+    if equipments:
+        await db.equipment_summary.bulk_write([
+            UpdateOne({"serial_number": e["serial_number"]}, _entry_update(e), upsert=True)
+            for e in equipments
+        ], ordered=False)
+
+
+async def summary_on_calibration(db, serial_number: str, calibration_date: str):
+    """Marcar el equipo como calibrado y registrar la fecha de calibración y del próximo mantenimiento"""
+    await db.equipment_summary.update_one(
+        {"serial_number": serial_number},
+        {
+            "$set": {"status": "calibrated", "updated_at": _now()},
+            "$max": {
+                "last_calibration_date": calibration_date,
+                "next_due_date": compute_next_due_date(calibration_date)
+            }
+        }
+    )
+
+
+async def summary_on_deliveries(db, deliveries: list, delivery_date: str):
+    """Marcar como entregados varios equipos (pares número de serie, certificado) en una sola escritura"""
+    if deliveries:
+        now = _now()
+        await db.equipment_summary.bulk_write([
+            UpdateOne({"serial_number": serial_number}, {"$set": {
+                "status": "delivered",
+                "last_certificate_number": certificate_number,
+                "last_delivery_date": delivery_date,
+                "updated_at": now
+            }})
+            for serial_number, certificate_number in deliveries
+        ], ordered=False)
+
+
+async def rebuild_equipment_summary(db):
+    """
+    Reconstruir equipment_summary desde cero a partir de equipment,
+    equipment_delivered, calibration_history y su archivo. Devuelve el número de equipos resumidos.
+    """
+    await db.equipment_summary.delete_many({})
+
+    # 1. Visitas al taller (activas y entregadas): última entrada por serie y número total de visitas
+    await db.equipment.aggregate([
+        UNION_ARCHIVE,
+        {"$sort": {"entry_dt": 1}},
+        {"$group": {
+            "_id": "$serial_number",
+            "visit_count": {"$sum": 1},
+            "last": {"$last": "$$ROOT"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "serial_number": "$_id",
+            "brand": "$last.brand",
+            "model": "$last.model",
+            "client_name": "$last.client_name",
+            "client_cif": "$last.client_cif",
+            "client_departamento": {"$ifNull": ["$last.client_departamento", ""]},
+            "status": "$last.status",
+            "last_entry_date": "$last.entry_date",
+            "last_delivery_date": {"$ifNull": ["$last.delivery_date", None]},
+            "visit_count": 1,
+            "last_calibration_date": {"$literal": None},
+            "last_certificate_number": {"$literal": None},
+            "next_due_date": {"$literal": None},
+            "updated_at": _now()
+        }},
+        {"$merge": {
+            "into": "equipment_summary",
+            "on": "serial_number",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(None)
+
+    # 2. Historial (activo y archivado): última fecha de calibración y último certificado emitido.
+    #    Se ordena por calibration_dt (los textos mezclan formatos) y el próximo
+    #    mantenimiento se calcula desde esa fecha, igual que compute_next_due_date
+    await db.calibration_history.aggregate([
+        {"$unionWith": HISTORY_ARCHIVE},
+        {"$sort": {"calibration_dt": 1}},
+        {"$group": {
+            "_id": "$serial_number",
+            "last_calibration_date": {"$last": "$calibration_date"},
+            "last_calibration_dt": {"$last": "$calibration_dt"},
+            "last_certificate_number": {"$max": "$certificate_number"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "serial_number": "$_id",
+            "last_calibration_date": 1,
+            "last_certificate_number": 1,
+            "next_due_date": next_due_date_expression("$last_calibration_dt")
+        }},
+        {"$merge": {
+            "into": "equipment_summary",
+            "on": "serial_number",
+            "whenMatched": "merge",
+            "whenNotMatched": "discard"
+        }}
+    ]).to_list(None)
+
+    return await db.equipment_summary.count_documents({})
@@ -0,0 +1,66 @@
+"""
+Respuestas JSON rápidas para los listados grandes.
+
+La aplicación usa ORJSONResponse por defecto. Además, los listados que
+devuelven documentos tal cual salen de MongoDB (historial, catálogo maestro,
+colas del taller) pueden saltarse la validación de `response_model`: esos
+documentos se escribieron a través de los mismos modelos Pydantic, así que
+basta con proyectar exactamente los campos del modelo y completar los valores
+por defecto que falten. Con FAST_RESPONSES=0 se vuelve a la validación
+completa de FastAPI.
+"""
+import os
+
+import orjson
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic_core import PydanticUndefined
+
+FAST_RESPONSES = os.environ.get("FAST_RESPONSES", "1") != "0"
+
+
+def model_projection(model):
+    """Proyección de MongoDB con exactamente los campos del modelo"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+
+def model_defaults(model):
+    """Valores por defecto de los campos opcionales del modelo"""
+    defaults = {}
+    for name, field in model.model_fields.items():
+        if field.default_factory is not None:
+            defaults[name] = field.default_factory()
+        elif field.default is not PydanticUndefined:
+            defaults[name] = field.default
+    return defaults
+
+
+def fast_list(docs, model):
+    """
+    Respuesta de un listado de documentos proyectados con model_projection, sin
+    revalidarlos. Si FAST_RESPONSES está desactivado devuelve la lista para que
+    FastAPI la valide contra el `response_model` de la ruta.
+    """
+    if not FAST_RESPONSES:
+        return docs
+    defaults = model_defaults(model)
+    return ORJSONResponse([{**defaults, **doc} for doc in docs])
+
+
+async def _iter_json_array(cursor, defaults, limit):
+    yield b"["
+    sent = 0
+    async for doc in cursor:
+        if limit is not None and sent >= limit:
+            break
+        yield (b"," if sent else b"") + orjson.dumps({**defaults, **doc})
+        sent += 1
+    yield b"]"
+
+
+def stream_list(cursor, model=None, limit=None):
+    """
+    Respuesta JSON de un listado que se escribe documento a documento desde el
+    cursor, sin cargar la lista entera en memoria (mismo formato que fast_list)
+    """
+    defaults = model_defaults(model) if model is not None else {}
+    return StreamingResponse(_iter_json_array(cursor, defaults, limit), media_type="application/json")
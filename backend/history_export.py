@@ -0,0 +1,139 @@
+"""
+Exportación del historial de calibraciones a CSV y XLSX.
+
+Cada calibración se aplana en filas: una por sensor calibrado y una por
+repuesto utilizado. Las filas se generan a medida que llegan del cursor de
+Motor, de modo que la memoria no depende del número de resultados: el CSV se
+envía por bloques y el XLSX se escribe con openpyxl en modo write_only.
+"""
+import asyncio
+import csv
+import io
+
+from openpyxl import Workbook
+
+from dates import date_range_filter
+
+CURSOR_BATCH_SIZE = 500
+CSV_FLUSH_ROWS = 500
+
+EXPORT_COLUMNS = [
+    ("tipo", "TIPO"),
+    ("certificate_number", "Nº CERTIFICADO"),
+    ("calibration_date", "FECHA CALIBRACIÓN"),
+    ("entry_date", "FECHA ENTRADA"),
+    ("serial_number", "Nº SERIE"),
+    ("brand", "MARCA"),
+    ("model", "MODELO"),
+    ("client_name", "CLIENTE"),
+    ("client_cif", "CIF"),
+    ("client_departamento", "DEPARTAMENTO"),
+    ("technician", "TÉCNICO"),
+    ("delivery_note", "Nº ALBARÁN"),
+    ("sensor", "GAS/SENSOR"),
+    ("pre_alarm", "PRE-ALARMA"),
+    ("alarm", "ALARMA"),
+    ("calibration_value", "VALOR CAL."),
+    ("valor_zero", "ZERO"),
+    ("valor_span", "SPAN"),
+    ("calibration_bottle", "Nº BOTELLA"),
+    ("approved", "APTO"),
+    ("descripcion", "DESCRIPCIÓN REPUESTO"),
+    ("referencia", "REFERENCIA"),
+    ("garantia", "GARANTÍA"),
+]
+_HEADER = [label for _, label in EXPORT_COLUMNS]
+_ENTRY_FIELDS = [
+    "certificate_number", "calibration_date", "entry_date", "serial_number", "brand", "model",
+    "client_name", "client_cif", "client_departamento", "technician", "delivery_note"
+]
+_SENSOR_FIELDS = ["sensor", "pre_alarm", "alarm", "calibration_value", "valor_zero", "valor_span", "calibration_bottle"]
+
+
+def build_history_query(cliente=None, modelo=None, serial=None, date_from=None, date_to=None):
+    """
+    Construir el filtro de calibration_history con los mismos criterios que la búsqueda.
+    El rango de fechas se aplica sobre `calibration_dt` (ValueError si no es una fecha válida).
+    """
+    query = {}
+    if cliente:
+        query["client_name"] = {"$regex": cliente, "$options": "i"}
+    if modelo:
+        query["model"] = {"$regex": modelo, "$options": "i"}
+    if serial:
+        query["serial_number"] = {"$regex": serial, "$options": "i"}
+    if date_from or date_to:
+        query["calibration_dt"] = date_range_filter(date_from, date_to)
+    return query
+
+
+def _yes_no(value):
+    return "SÍ" if value else "NO"
+
+
+def flatten_history_entry(entry):
+    """Convertir una calibración en filas (listas) con las columnas de EXPORT_COLUMNS"""
+    base = {field: entry.get(field) or "" for field in _ENTRY_FIELDS}
+    empty = dict.fromkeys(_SENSOR_FIELDS + ["approved", "descripcion", "referencia", "garantia"], "")
+    rows = []
+
+    for sensor in entry.get("calibration_data") or []:
+        row = {**base, **empty, "tipo": "SENSOR"}
+        for field in _SENSOR_FIELDS:
+            row[field] = sensor.get(field, "")
+        row["approved"] = _yes_no(sensor.get("approved", False))
+        rows.append(row)
+
+    for part in entry.get("spare_parts") or []:
+        row = {**base, **empty, "tipo": "REPUESTO"}
+        row["descripcion"] = part.get("descripcion", "")
+        row["referencia"] = part.get("referencia", "")
+        row["garantia"] = _yes_no(part.get("garantia", False))
+        rows.append(row)
+
+    if not rows:
+        rows.append({**base, **empty, "tipo": "CALIBRACIÓN"})
+
+    return [[row[key] for key, _ in EXPORT_COLUMNS] for row in rows]
+
+
+async def iter_csv(cursor, header, to_rows):
+    """Generar un CSV por bloques de texto; `to_rows` convierte cada documento en filas"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    # BOM para que Excel detecte UTF-8 (acentos y "Nº")
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    pending = 0
+
+    async for doc in cursor.batch_size(CURSOR_BATCH_SIZE):
+        rows = to_rows(doc)
+        writer.writerows(rows)
+        pending += len(rows)
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def iter_history_csv(cursor):
+    """CSV del historial de calibraciones a partir de un cursor de Motor"""
+    return iter_csv(cursor, _HEADER, flatten_history_entry)
+
+
+async def write_history_xlsx(cursor, output_path):
+    """Escribir el XLSX en disco con un libro write_only (memoria constante)"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Historial")
+    sheet.append(_HEADER)
+
+    async for entry in cursor.batch_size(CURSOR_BATCH_SIZE):
+        for row in flatten_history_entry(entry):
+            sheet.append(row)
+
+    # Comprimir el libro es CPU; se hace fuera del event loop
+    await asyncio.to_thread(workbook.save, output_path)
+    return output_path
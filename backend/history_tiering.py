@@ -0,0 +1,129 @@
+"""
+Archivo por antigüedad del historial de calibraciones.
+
+Casi todas las consultas del historial se refieren a los últimos uno o dos
+años. `python manage.py tier-history` mueve las calibraciones anteriores a
+HISTORY_HOT_DAYS días a calibration_history_archive, una colección con
+compresión zstd y menos índices, y guarda la fecha de corte en
+tiering_state. Todo lo anterior a esa fecha está en el archivo, así que:
+
+  - la búsqueda de una calibración por id consulta el archivo solo si no la
+    encuentra en la colección activa
+  - los listados (también el historial de un equipo) añaden el archivo
+    (`$unionWith`) cuando no tienen `from` o es anterior a la fecha de corte;
+    las rutas que además estiman la memoria leen la fecha de corte una vez
+    (needs_archive) y pasan el resultado a history_cursor
+"""
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from dates import parse_datetime
+
+HISTORY_COLLECTION = "calibration_history"
+HISTORY_ARCHIVE = "calibration_history_archive"
+HISTORY_HOT_DAYS = int(os.environ.get("HISTORY_HOT_DAYS", "730"))
+TIERING_BATCH_SIZE = 1000
+NAMESPACE_EXISTS = 48
+
+_STATE_ID = HISTORY_COLLECTION
+
+
+async def ensure_history_archive(db):
+    """Crear la colección de archivo (comprimida con zstd) y sus índices si no existen"""
+    try:
+        await db.create_collection(
+            HISTORY_ARCHIVE,
+            storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+        )
+    except (CollectionInvalid, OperationFailure) as e:
+        # Ya existe (p. ej. la ha creado otro worker que arrancaba a la vez)
+        if isinstance(e, OperationFailure) and e.code != NAMESPACE_EXISTS:
+            raise
+    await db[HISTORY_ARCHIVE].create_index("id", unique=True)
+    await db[HISTORY_ARCHIVE].create_index([("serial_number", 1), ("calibration_dt", -1)])
+    await db[HISTORY_ARCHIVE].create_index([("calibration_dt", -1)])
+    await db[HISTORY_ARCHIVE].create_index([("calibration_data.calibration_bottle", 1), ("calibration_dt", -1)])
+
+
+async def get_history_cutoff(db):
+    """Fecha de corte: todas las calibraciones anteriores están en el archivo (None si nunca se ha archivado)"""
+    state = await db.tiering_state.find_one({"_id": _STATE_ID})
+    return state["cutoff"] if state else None
+
+
+async def needs_archive(db, date_from=None):
+    """Si una consulta desde `date_from` (o sin límite inferior) puede encontrar calibraciones archivadas"""
+    cutoff = await get_history_cutoff(db)
+    if cutoff is None:
+        return False
+    start = parse_datetime(date_from) if date_from else None
+    return start is None or start < cutoff
+
+
+def union_archive(query):
+    """Etapa `$unionWith` que añade las calibraciones archivadas que cumplen `query`"""
+    return {"$unionWith": {"coll": HISTORY_ARCHIVE, "pipeline": [{"$match": query}]}}
+
+
+async def history_cursor(db, query, projection, date_from=None, limit=None, archive=None):
+    """
+    Cursor sobre el historial ordenado por fecha de calibración (más reciente
+    primero), que incluye el archivo solo si el rango lo necesita. `archive` es
+    el resultado de needs_archive si la ruta ya lo ha consultado.
+    """
+    if archive is None:
+        archive = await needs_archive(db, date_from)
+    if not archive:
+        cursor = db[HISTORY_COLLECTION].find(query, projection).sort("calibration_dt", -1)
+        return cursor.limit(limit) if limit else cursor
+
+    pipeline = [{"$match": query}, union_archive(query), {"$sort": {"calibration_dt": -1}}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": projection})
+    return db[HISTORY_COLLECTION].aggregate(pipeline)
+
+
+async def find_history_entry(db, query, projection):
+    """Una calibración del historial, buscándola en el archivo si no está en la colección activa"""
+    entry = await db[HISTORY_COLLECTION].find_one(query, projection)
+    if entry is None and await get_history_cutoff(db) is not None:
+        entry = await db[HISTORY_ARCHIVE].find_one(query, projection)
+    return entry
+
+
+async def tier_history(db, older_than_days=HISTORY_HOT_DAYS, batch_size=TIERING_BATCH_SIZE):
+    """
+    Mover al archivo las calibraciones con más de `older_than_days` días.
+
+    La fecha de corte se guarda antes de mover nada: mientras dura el proceso
+    las lecturas ya consultan ambas colecciones. Cada lote se copia (reemplazo
+    idempotente por id) y después se borra, así que el proceso puede repetirse
+    tras una interrupción. La fecha de corte nunca retrocede.
+    """
+    await ensure_history_archive(db)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    cutoff = today - timedelta(days=older_than_days)
+    await db.tiering_state.update_one(
+        {"_id": _STATE_ID},
+        {"$max": {"cutoff": cutoff}, "$set": {"tiered_at": datetime.utcnow()}},
+        upsert=True
+    )
+    cutoff = await get_history_cutoff(db)
+
+    moved = 0
+    while True:
+        batch = await db[HISTORY_COLLECTION].find(
+            {"calibration_dt": {"$lt": cutoff}}
+        ).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return {"cutoff": cutoff, "moved": moved}
+        await db[HISTORY_ARCHIVE].bulk_write([
+            ReplaceOne({"id": entry["id"]}, {k: v for k, v in entry.items() if k != "_id"}, upsert=True)
+            for entry in batch
+        ], ordered=False)
+        result = await db[HISTORY_COLLECTION].delete_many({"_id": {"$in": [entry["_id"] for entry in batch]}})
+        moved += result.deleted_count
@@ -0,0 +1,122 @@
+"""
+Próximos mantenimientos (recalibraciones) de los equipos.
+
+El certificado recomienda verificar el instrumento al menos una vez al año,
+así que cada calibración guarda `next_due_date` (fecha de calibración más
+CALIBRATION_INTERVAL_DAYS) en el historial y en equipment_summary. El informe
+de vencimientos consulta equipment_summary por ese campo indexado, con
+paginación por clave (next_due_date, serial_number).
+"""
+import os
+from datetime import timedelta
+
+from dates import parse_datetime
+
+CALIBRATION_INTERVAL_DAYS = int(os.environ.get("CALIBRATION_INTERVAL_DAYS", "365"))
+
+DUE_PROJECTION = {
+    "_id": 0,
+    "serial_number": 1,
+    "brand": 1,
+    "model": 1,
+    "client_name": 1,
+    "client_cif": 1,
+    "client_departamento": 1,
+    "status": 1,
+    "last_calibration_date": 1,
+    "last_certificate_number": 1,
+    "next_due_date": 1
+}
+
+
+def compute_next_due_date(calibration_date):
+    """Fecha (YYYY-MM-DD) del próximo mantenimiento a partir de la fecha de calibración"""
+    calibrated = parse_datetime(calibration_date)
+    if calibrated is None:
+        return None
+    return (calibrated + timedelta(days=CALIBRATION_INTERVAL_DAYS)).strftime("%Y-%m-%d")
+
+
+def next_due_date_expression(calibration_dt_field):
+    """
+    Expresión de agregación equivalente a compute_next_due_date, sobre el campo
+    datetime (calibration_dt = parse_datetime(calibration_date)) en lugar del texto
+    """
+    return {"$dateToString": {
+        "format": "%Y-%m-%d",
+        "date": {"$dateAdd": {
+            "startDate": calibration_dt_field,
+            "unit": "day",
+            "amount": CALIBRATION_INTERVAL_DAYS
+        }},
+        "onNull": None
+    }}
+
+
+def due_date_bound(value, name):
+    """Límite del rango como texto YYYY-MM-DD (el formato de next_due_date); ValueError si no es una fecha"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid '{name}' date: '{value}'")
+    return parsed.strftime("%Y-%m-%d")
+
+
+def encode_cursor(doc):
+    return f"{doc['next_due_date']}|{doc['serial_number']}"
+
+
+def decode_cursor(cursor):
+    due_date, _, serial_number = cursor.partition("|")
+    if not due_date or not serial_number:
+        raise ValueError("Invalid cursor")
+    return due_date, serial_number
+
+
+async def find_due_equipment(db, date_from=None, date_to=None, cliente=None, limit=100, after=None):
+    """
+    Equipos cuyo próximo mantenimiento cae en [date_from, date_to], ordenados por fecha.
+    Devuelve una página de resultados, el cursor de la siguiente página y, en la
+    primera página, el número de equipos por cliente.
+    """
+    # next_due_date se compara como texto: los límites se normalizan a YYYY-MM-DD
+    date_from = due_date_bound(date_from, "from")
+    date_to = due_date_bound(date_to, "to")
+    if date_from and date_to and date_from > date_to:
+        raise ValueError("'from' must not be after 'to'")
+    # Los límites por defecto acotan a fechas de texto (excluyen equipos sin calibrar)
+    base_query = {"next_due_date": {"$gte": date_from or "", "$lte": date_to or "9999-12-31"}}
+    if cliente:
+        base_query["client_name"] = cliente
+
+    query = dict(base_query)
+    if after:
+        due_date, serial_number = decode_cursor(after)
+        query["$or"] = [
+            {"next_due_date": {"$gt": due_date}},
+            {"next_due_date": due_date, "serial_number": {"$gt": serial_number}}
+        ]
+
+    items = await db.equipment_summary.find(query, DUE_PROJECTION).sort(
+        [("next_due_date", 1), ("serial_number", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+
+    result = {"items": items, "next_cursor": next_cursor}
+
+    if not after:
+        # Solo usa campos del índice (next_due_date, client_name): consulta cubierta
+        counts = await db.equipment_summary.aggregate([
+            {"$match": base_query},
+            {"$project": {"_id": 0, "client_name": 1}},
+            {"$group": {"_id": "$client_name", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}}
+        ]).to_list(None)
+        result["counts_by_client"] = [{"client_name": c["_id"], "count": c["count"]} for c in counts]
+
+    return result
@@ -0,0 +1,134 @@
+"""
+Comandos de mantenimiento de la base de datos.
+
+Uso (desde el directorio backend/, con el mismo .env que el servidor):
+
+    python manage.py rebuild-summary
+    python manage.py rebuild-stats
+    python manage.py backfill-readings
+    python manage.py clear-spare-parts-cache
+    python manage.py import-master equipos.xlsx [--update]
+    python manage.py migrate-dates
+    python manage.py archive-delivered
+    python manage.py tier-history [--older-than-days 730]
+    python manage.py merge-catalog [--drop]
+"""
+import argparse
+import asyncio
+import time
+
+from server import db, client
+from equipment_summary import rebuild_equipment_summary
+from workshop_stats import rebuild_workshop_stats
+from sensor_readings import backfill_sensor_readings
+from spare_parts_report import rebuild_spare_parts_cache
+from master_import import import_equipment_master, CHUNK_SIZE
+from dates import migrate_dates
+from workshop_archive import migrate_delivered_equipment
+from history_tiering import tier_history, HISTORY_HOT_DAYS
+from equipment_registry import merge_equipment_catalog
+
+
+async def rebuild_summary(args):
+    count = await rebuild_equipment_summary(db)
+    print(f"✓ equipment_summary reconstruida: {count} equipos")
+
+
+async def rebuild_stats(args):
+    count = await rebuild_workshop_stats(db)
+    print(f"✓ workshop_stats reconstruida: {count} documentos")
+
+
+async def backfill_readings(args):
+    count = await backfill_sensor_readings(db)
+    print(f"✓ sensor_readings reconstruida: {count} lecturas")
+
+
+async def clear_spare_parts_cache(args):
+    count = await rebuild_spare_parts_cache(db)
+    print(f"✓ Caché de repuestos vaciada: {count} meses se recalcularán en la próxima consulta")
+
+
+async def import_master(args):
+    start = time.perf_counter()
+    with open(args.file, "rb") as f:
+        report = await import_equipment_master(
+            db, f, args.file, update_existing=args.update, chunk_size=args.chunk_size
+        )
+    elapsed = time.perf_counter() - start
+    rate = report["rows"] / elapsed if elapsed > 0 else 0
+    print(f"✓ {report['rows']} filas en {elapsed:.2f}s ({rate:,.0f} filas/s)")
+    print(f"  Insertados: {report['inserted']}  Actualizados: {report['updated']}  Errores: {len(report['errors'])}")
+    for error in report["errors"]:
+        print(f"  ✗ Fila {error['row']} ({error['serial_number']}): {error['error']}")
+
+
+async def migrate_dates_command(args):
+    totals = await migrate_dates(db, batch_size=args.batch_size)
+    for name, count in totals.items():
+        print(f"✓ {name}: {count} documentos con fechas datetime")
+
+
+async def archive_delivered(args):
+    count = await migrate_delivered_equipment(db)
+    print(f"✓ {count} visitas entregadas movidas a equipment_delivered")
+
+
+async def tier_history_command(args):
+    result = await tier_history(db, older_than_days=args.older_than_days)
+    print(f"✓ {result['moved']} calibraciones anteriores a {result['cutoff']:%Y-%m-%d} movidas al archivo")
+
+
+async def merge_catalog(args):
+    count = await merge_equipment_catalog(db, drop=args.drop)
+    print(f"✓ {count} entradas de equipment_catalog incorporadas a equipment_master")
+    if args.drop:
+        print("  equipment_catalog eliminada")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos del taller")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cmd = subparsers.add_parser("rebuild-summary", help="Reconstruir la colección equipment_summary")
+    cmd.set_defaults(func=rebuild_summary)
+
+    cmd = subparsers.add_parser("rebuild-stats", help="Reconstruir las estadísticas del panel (workshop_stats)")
+    cmd.set_defaults(func=rebuild_stats)
+
+    cmd = subparsers.add_parser("backfill-readings", help="Reconstruir sensor_readings desde calibration_history")
+    cmd.set_defaults(func=backfill_readings)
+
+    cmd = subparsers.add_parser("clear-spare-parts-cache", help="Descartar los buckets mensuales del informe de repuestos")
+    cmd.set_defaults(func=clear_spare_parts_cache)
+
+    cmd = subparsers.add_parser("import-master", help="Importar equipos al catálogo maestro desde CSV/XLSX")
+    cmd.add_argument("file", help="Fichero .csv o .xlsx")
+    cmd.add_argument("--update", action="store_true", help="Actualizar los equipos que ya existen")
+    cmd.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Filas por bloque")
+    cmd.set_defaults(func=import_master)
+
+    cmd = subparsers.add_parser("migrate-dates", help="Añadir los campos de fecha datetime (*_dt) a los documentos existentes")
+    cmd.add_argument("--batch-size", type=int, default=1000, help="Documentos por escritura")
+    cmd.set_defaults(func=migrate_dates_command)
+
+    cmd = subparsers.add_parser("archive-delivered", help="Mover las visitas entregadas de equipment a equipment_delivered")
+    cmd.set_defaults(func=archive_delivered)
+
+    cmd = subparsers.add_parser("tier-history", help="Mover el historial antiguo a calibration_history_archive")
+    cmd.add_argument("--older-than-days", type=int, default=HISTORY_HOT_DAYS, help="Antigüedad mínima en días")
+    cmd.set_defaults(func=tier_history_command)
+
+    cmd = subparsers.add_parser("merge-catalog", help="Incorporar equipment_catalog a equipment_master")
+    cmd.add_argument("--drop", action="store_true", help="Eliminar equipment_catalog al terminar")
+    cmd.set_defaults(func=merge_catalog)
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(args.func(args))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
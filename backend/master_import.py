@@ -0,0 +1,238 @@
+"""
+Importación masiva del catálogo maestro de equipos desde CSV o XLSX.
+
+El fichero se lee por bloques (pandas para CSV, openpyxl en modo read_only
+para XLSX) y cada bloque se valida de forma vectorizada, se comprueba contra
+la base de datos con una única consulta `$in` y se escribe con un único
+`bulk_write` desordenado. El resultado es un informe con los errores por fila.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from zipfile import BadZipFile
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from dates import parse_datetime
+
+CHUNK_SIZE = 5000
+
+# Errores de lectura de un fichero mal formado (se informan como ValueError → 400)
+PARSE_ERRORS = (pd.errors.ParserError, UnicodeDecodeError, BadZipFile, InvalidFileException)
+
+# Columnas aceptadas en la cabecera del fichero (normalizadas en minúsculas y con "_")
+COLUMN_ALIASES = {
+    "serial_number": ["serial_number", "serial", "numero_serie", "nº_serie", "n_serie", "nº_de_serie"],
+    "brand": ["brand", "marca"],
+    "model": ["model", "modelo"],
+    "current_client_name": ["current_client_name", "client_name", "cliente"],
+    "current_client_cif": ["current_client_cif", "client_cif", "cif"],
+    "current_client_departamento": ["current_client_departamento", "client_departamento", "departamento"],
+    "general_observations": ["general_observations", "observaciones"],
+}
+REQUIRED_COLUMNS = ["serial_number", "brand", "model"]
+
+_ALIAS_LOOKUP = {alias: column for column, aliases in COLUMN_ALIASES.items() for alias in aliases}
+
+
+def _normalize_header(name):
+    return str(name).strip().lower().replace(" ", "_")
+
+
+def _present_columns(df):
+    """Columnas del modelo que vienen en la cabecera del fichero"""
+    return [column for column in COLUMN_ALIASES if column in {
+        _ALIAS_LOOKUP.get(_normalize_header(c), _normalize_header(c)) for c in df.columns
+    }]
+
+
+def _normalize_chunk(df):
+    """Renombrar columnas a los nombres del modelo y limpiar valores"""
+    df = df.rename(columns=lambda c: _ALIAS_LOOKUP.get(_normalize_header(c), _normalize_header(c)))
+    df = df.loc[:, ~df.columns.duplicated()]
+    for column in COLUMN_ALIASES:
+        if column not in df.columns:
+            df[column] = ""
+    df = df[list(COLUMN_ALIASES)].fillna("").astype(str)
+    for column in df.columns:
+        df[column] = df[column].str.strip()
+    return df
+
+
+def _iter_csv_chunks(fileobj, chunk_size):
+    head = fileobj.read(4096)
+    fileobj.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode("utf-8-sig", errors="ignore")
+    first_line = head.splitlines()[0] if head else ""
+    # Excel en español exporta CSV separados por ";"
+    separator = ";" if first_line.count(";") > first_line.count(",") else ","
+    yield from pd.read_csv(
+        fileobj,
+        sep=separator,
+        dtype=str,
+        keep_default_na=False,
+        chunksize=chunk_size,
+        encoding="utf-8-sig"
+    )
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        # Números de serie numéricos que Excel guarda como float
+        return str(int(value))
+    return str(value)
+
+
+def _iter_xlsx_chunks(fileobj, chunk_size):
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(h) if h is not None else "" for h in header]
+        buffer = []
+        for row in rows:
+            buffer.append([_cell_text(value) for value in row])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_spreadsheet_chunks(fileobj, filename, chunk_size=CHUNK_SIZE):
+    """Leer un CSV o XLSX por bloques de `chunk_size` filas como DataFrames"""
+    suffix = Path(filename or "").suffix.lower()
+    if suffix == ".csv":
+        return _iter_csv_chunks(fileobj, chunk_size)
+    if suffix in (".xlsx", ".xlsm"):
+        return _iter_xlsx_chunks(fileobj, chunk_size)
+    raise ValueError(f"Formato de fichero no soportado: '{suffix or filename}'. Use CSV o XLSX")
+
+
+async def import_equipment_master(db, fileobj, filename, update_existing=False, chunk_size=CHUNK_SIZE):
+    """
+    Importar equipos al catálogo maestro.
+
+    Los equipos nuevos se insertan con `$setOnInsert` (upsert). Los que ya
+    existen se actualizan solo si `update_existing` es True, y solo con las
+    columnas del fichero que traen valor; en caso contrario se informan como
+    error de fila. Un fichero que no se puede leer lanza ValueError con el error
+    de lectura (los bloques anteriores ya se han importado).
+    """
+    report = {"rows": 0, "inserted": 0, "updated": 0, "errors": []}
+    errors = report["errors"]
+    seen = set()
+    first_row = 2  # La fila 1 es la cabecera
+
+    chunks = iter_spreadsheet_chunks(fileobj, filename, chunk_size)
+    while True:
+        # El parseo es CPU; se hace fuera del event loop
+        try:
+            raw = await asyncio.to_thread(next, chunks, None)
+        except PARSE_ERRORS as e:
+            raise ValueError(f"No se puede leer el fichero a partir de la fila {first_row}: {e}") from e
+        if raw is None:
+            break
+        present = _present_columns(raw)
+        df = _normalize_chunk(raw)
+        row_numbers = range(first_row, first_row + len(df))
+        first_row += len(df)
+        report["rows"] += len(df)
+
+        missing = (df[REQUIRED_COLUMNS] == "").any(axis=1)
+        duplicated = df["serial_number"].duplicated(keep="first") | df["serial_number"].isin(seen)
+
+        candidates = []
+        for row_number, record, is_missing, is_duplicated in zip(
+            row_numbers, df.to_dict("records"), missing, duplicated
+        ):
+            serial = record["serial_number"]
+            if is_missing:
+                empty = [c for c in REQUIRED_COLUMNS if not record[c]]
+                errors.append({"row": row_number, "serial_number": serial, "error": f"Campos obligatorios vacíos: {', '.join(empty)}"})
+            elif is_duplicated:
+                errors.append({"row": row_number, "serial_number": serial, "error": "Número de serie duplicado en el fichero"})
+            else:
+                candidates.append((row_number, record))
+        seen.update(df["serial_number"])
+
+        if not candidates:
+            continue
+
+        existing_docs = await db.equipment_master.find(
+            {"serial_number": {"$in": [record["serial_number"] for _, record in candidates]}},
+            {"_id": 0, "serial_number": 1}
+        ).to_list(None)
+        existing = {doc["serial_number"] for doc in existing_docs}
+
+        now = datetime.now(timezone.utc).isoformat()
+        now_dt = parse_datetime(now)
+        operations = []
+        operation_rows = []
+        for row_number, record in candidates:
+            serial = record["serial_number"]
+            if serial in existing:
+                if not update_existing:
+                    errors.append({"row": row_number, "serial_number": serial, "error": "Ya existe en el catálogo maestro"})
+                    continue
+                # Solo las columnas presentes en el fichero y con valor: una hoja parcial
+                # o una celda vacía no borra lo que ya hay en el catálogo
+                changes = {column: record[column] for column in present if record[column]}
+                operations.append(UpdateOne(
+                    {"serial_number": serial},
+                    {"$set": {**changes, "updated_at": now, "updated_dt": now_dt}}
+                ))
+            else:
+                operations.append(UpdateOne(
+                    {"serial_number": serial},
+                    {"$setOnInsert": {
+                        **record,
+                        "id": str(uuid.uuid4()),
+                        "default_sensors": [],
+                        "created_at": now,
+                        "updated_at": now,
+                        "created_dt": now_dt,
+                        "updated_dt": now_dt,
+                        "last_workshop_entry": None
+                    }},
+                    upsert=True
+                ))
+            operation_rows.append((row_number, serial, serial in existing))
+
+        if not operations:
+            continue
+
+        try:
+            details = (await db.equipment_master.bulk_write(operations, ordered=False)).bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details.get("writeErrors", []):
+                row_number, serial, _ = operation_rows[write_error["index"]]
+                errors.append({"row": row_number, "serial_number": serial, "error": write_error.get("errmsg", "Error de escritura")})
+
+        # Los contadores salen del resultado de la escritura: un alta cuyo número de
+        # serie ha creado otro entretanto coincide (sin cambios) en lugar de insertarse
+        upserted = {item["index"] for item in details.get("upserted", [])}
+        failed = {write_error["index"] for write_error in details.get("writeErrors", [])}
+        raced = 0
+        for index, (row_number, serial, was_existing) in enumerate(operation_rows):
+            if not was_existing and index not in upserted and index not in failed:
+                raced += 1
+                errors.append({"row": row_number, "serial_number": serial, "error": "Ya existe en el catálogo maestro"})
+        report["inserted"] += len(upserted)
+        report["updated"] += details.get("nMatched", 0) - raced
+
+    errors.sort(key=lambda e: e["row"])
+    return report
@@ -0,0 +1,174 @@
+"""
+Control de memoria de los listados grandes y las exportaciones.
+
+  - MemoryMiddleware mide con tracemalloc el pico de memoria asignada de una
+    fracción MEMORY_SAMPLE_RATE de las peticiones y lo añade a las métricas
+    (http_request_peak_memory_bytes). tracemalloc es global al proceso: se
+    mide una petición cada vez y el pico incluye lo que asignen a la vez las
+    demás peticiones del worker, así que es una cota superior. Si tracemalloc
+    ya estaba activo (lo ha arrancado otro) la petición no se muestrea.
+  - within_budget estima, antes de leer nada, la memoria que ocupará un
+    listado: documentos × tamaño medio en MongoDB (collStats) ×
+    PY_MEMORY_FACTOR (diccionarios de Python más la respuesta serializada;
+    medido ≈ 8 con bench_serialization). Si supera el presupuesto de la ruta
+    (MEMORY_BUDGETS, o MEMORY_BUDGET_MB por defecto) la ruta responde por
+    streaming desde el cursor o, con MEMORY_BUDGET_ACTION=reject o si no
+    puede hacer streaming, con un 413 inmediato en lugar de crecer el worker.
+
+MEMORY_BUDGETS tiene la forma `ruta=MB,ruta=MB`, con la plantilla de la ruta:
+    /api/calibration-history/all=128,/api/calibration-history/search=64
+"""
+import os
+import random
+import time
+import tracemalloc
+
+from fastapi import HTTPException
+
+from fast_responses import stream_list
+from metrics import current_route, registry, route_template
+
+MEMORY_SAMPLE_RATE = float(os.environ.get("MEMORY_SAMPLE_RATE", "0.01"))
+MEMORY_BUDGET_MB = float(os.environ.get("MEMORY_BUDGET_MB", "256"))
+MEMORY_BUDGET_ACTION = os.environ.get("MEMORY_BUDGET_ACTION", "stream")
+PY_MEMORY_FACTOR = 8
+DEFAULT_OBJECT_SIZE = 2048
+OBJECT_SIZE_TTL = 600
+MB = 1048576
+
+
+def _parse_budgets(value):
+    budgets = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, megabytes = item.rpartition("=")
+        budgets[route.strip()] = float(megabytes) * MB
+    return budgets
+
+
+MEMORY_BUDGETS = _parse_budgets(os.environ.get("MEMORY_BUDGETS", ""))
+
+_object_sizes = {}  # colección -> (tamaño medio, instante)
+_usage = {}         # ruta -> {"samples", "max_bytes", "total_bytes", "streamed", "rejected"}
+_sampling = False
+
+
+def route_budget(route):
+    """Presupuesto de memoria en bytes de una ruta"""
+    return MEMORY_BUDGETS.get(route, MEMORY_BUDGET_MB * MB)
+
+
+def _route_usage(route):
+    usage = _usage.get(route)
+    if usage is None:
+        usage = _usage[route] = {"samples": 0, "max_bytes": 0, "total_bytes": 0, "streamed": 0, "rejected": 0}
+    return usage
+
+
+async def average_object_size(db, collection):
+    """Tamaño medio de los documentos de una colección (collStats, en caché)"""
+    cached = _object_sizes.get(collection)
+    if cached and time.monotonic() - cached[1] < OBJECT_SIZE_TTL:
+        return cached[0]
+    try:
+        stats = await db.command({"collStats": collection})
+        size = stats.get("avgObjSize") or DEFAULT_OBJECT_SIZE
+    except Exception:
+        size = DEFAULT_OBJECT_SIZE
+    _object_sizes[collection] = (size, time.monotonic())
+    return size
+
+
+async def estimate_list_memory(db, collections, query, limit):
+    """Memoria estimada de cargar hasta `limit` documentos de `collections` que cumplen `query`"""
+    sizes = [await average_object_size(db, name) for name in collections]
+    per_doc = max(sizes) * PY_MEMORY_FACTOR
+    upper_bound = limit * per_doc
+    if upper_bound <= route_budget(current_route()):
+        return upper_bound  # Ni llenando el límite se supera: no hace falta contar
+    count = 0
+    for name in collections:
+        count += await db[name].count_documents(query, limit=limit - count)
+        if count >= limit:
+            break
+    return count * per_doc
+
+
+async def within_budget(db, collections, query, limit):
+    """True si el listado cabe en el presupuesto de memoria de la ruta en curso"""
+    return await estimate_list_memory(db, collections, query, limit) <= route_budget(current_route())
+
+
+def reject_over_budget():
+    """Cortar la petición antes de cargar un resultado que no cabe en memoria"""
+    route = current_route() or "unmatched"
+    _route_usage(route)["rejected"] += 1
+    registry.record_budget_exceeded(route, "reject")
+    raise HTTPException(
+        status_code=413,
+        detail="Result too large for this request; narrow the filters or the date range (or use the export)"
+    )
+
+
+def over_budget_response(cursor, model=None, limit=None):
+    """Respuesta para un listado que supera el presupuesto: streaming desde el cursor o 413"""
+    if MEMORY_BUDGET_ACTION == "reject":
+        reject_over_budget()
+    route = current_route() or "unmatched"
+    _route_usage(route)["streamed"] += 1
+    registry.record_budget_exceeded(route, "stream")
+    return stream_list(cursor, model, limit)
+
+
+def memory_report(limit=20):
+    """Rutas con mayor pico de memoria muestreado y sus cortes por presupuesto"""
+    routes = [{
+        "route": route,
+        "samples": usage["samples"],
+        "max_mb": round(usage["max_bytes"] / MB, 1),
+        "avg_mb": round(usage["total_bytes"] / usage["samples"] / MB, 1) if usage["samples"] else None,
+        "budget_mb": round(route_budget(route) / MB, 1),
+        "streamed": usage["streamed"],
+        "rejected": usage["rejected"],
+    } for route, usage in _usage.items()]
+    routes.sort(key=lambda r: (r["max_mb"], r["streamed"] + r["rejected"]), reverse=True)
+    return {
+        "sample_rate": MEMORY_SAMPLE_RATE,
+        "default_budget_mb": MEMORY_BUDGET_MB,
+        "budget_action": MEMORY_BUDGET_ACTION,
+        "routes": routes[:limit],
+    }
+
+
+class MemoryMiddleware:
+    """Middleware ASGI que mide el pico de memoria de las peticiones muestreadas"""
+
+    def __init__(self, app, sample_rate=MEMORY_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        global _sampling
+        if (
+            scope["type"] != "http" or _sampling
+            or self.sample_rate <= 0 or random.random() >= self.sample_rate
+            # tracemalloc ya lo usa otro (un benchmark, un diagnóstico): ni se
+            # reinicia su pico ni se para al terminar
+            or tracemalloc.is_tracing()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        _sampling = True
+        tracemalloc.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            _sampling = False
+            route = route_template(scope)
+            usage = _route_usage(route)
+            usage["samples"] += 1
+            usage["total_bytes"] += peak
+            usage["max_bytes"] = max(usage["max_bytes"], peak)
+            registry.record_memory(route, peak)
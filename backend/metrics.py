@@ -0,0 +1,235 @@
+"""
+Métricas por ruta y por comando de MongoDB en formato de texto de Prometheus.
+
+  - MetricsMiddleware (ASGI) mide cada petición: latencia, peticiones en
+    curso, tamaño de la respuesta y número y tiempo de comandos de MongoDB.
+  - MongoCommandMetrics (pymongo CommandListener) cuenta cada comando. Motor
+    ejecuta pymongo en un pool de hilos copiando el contexto, así que el
+    listener encuentra en un ContextVar las cifras de la petición que lo lanzó.
+
+Todo se guarda en memoria del proceso con contadores e histogramas simples;
+`/api/metrics` los expone para que Prometheus los recoja.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+MEMORY_BUCKETS = tuple(mb * 1048576 for mb in (1, 4, 16, 32, 64, 128, 256, 512, 1024))
+
+_lock = threading.Lock()
+
+
+class RequestStats:
+    """Cifras de MongoDB de una petición (se modifica desde los hilos de Motor)"""
+    __slots__ = ("scope", "commands", "command_seconds")
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.commands = 0
+        self.command_seconds = 0.0
+
+
+current_request: ContextVar = ContextVar("current_request", default=None)
+
+_route_templates = None
+
+
+def route_template(scope):
+    """Plantilla de la ruta (p. ej. /api/equipment/{serial_number}/history) para no multiplicar etiquetas"""
+    global _route_templates
+    if _route_templates is None:
+        routes = scope["app"].router.routes
+        _route_templates = {route.endpoint: route.path for route in routes if hasattr(route, "endpoint")}
+    return _route_templates.get(scope.get("endpoint"), "unmatched")
+
+
+def current_route():
+    """Ruta de la petición en curso, o None fuera de una petición HTTP"""
+    stats = current_request.get()
+    if stats is None or stats.scope is None:
+        return None
+    return route_template(stats.scope)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+class _Registry:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = {}           # (method, route, status) -> count
+        self.latency = {}            # route -> Histogram
+        self.response_size = {}      # route -> Histogram
+        self.request_commands = {}   # route -> Histogram
+        self.request_command_seconds = {}  # route -> seconds
+        self.commands = {}           # command -> [count, failures, seconds]
+        self.peak_memory = {}        # route -> Histogram (peticiones muestreadas)
+        self.budget_exceeded = {}    # (route, action) -> count
+
+    def _histogram(self, table, key, buckets):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def record_request(self, method, route, status, seconds, size, stats):
+        with _lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._histogram(self.latency, route, LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.response_size, route, SIZE_BUCKETS).observe(size)
+            self._histogram(self.request_commands, route, COMMAND_COUNT_BUCKETS).observe(stats.commands)
+            self.request_command_seconds[route] = self.request_command_seconds.get(route, 0.0) + stats.command_seconds
+
+    def record_memory(self, route, peak_bytes):
+        with _lock:
+            self._histogram(self.peak_memory, route, MEMORY_BUCKETS).observe(peak_bytes)
+
+    def record_budget_exceeded(self, route, action):
+        with _lock:
+            key = (route, action)
+            self.budget_exceeded[key] = self.budget_exceeded.get(key, 0) + 1
+
+    def record_command(self, name, seconds, failed):
+        with _lock:
+            totals = self.commands.get(name)
+            if totals is None:
+                totals = self.commands[name] = [0, 0, 0.0]
+            totals[0] += 1
+            totals[1] += 1 if failed else 0
+            totals[2] += seconds
+            stats = current_request.get()
+            if stats is not None:
+                stats.commands += 1
+                stats.command_seconds += seconds
+
+
+registry = _Registry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """Todas las métricas en formato de texto de Prometheus"""
+    with _lock:
+        lines = [
+            "# HELP http_requests_in_flight Peticiones HTTP en curso",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {registry.in_flight}",
+            "# HELP http_requests_total Peticiones HTTP por ruta y estado",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(registry.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        for name, help_text, table in (
+            ("http_request_duration_seconds", "Latencia de las peticiones HTTP", registry.latency),
+            ("http_response_size_bytes", "Tamaño de las respuestas HTTP (tras la compresión)", registry.response_size),
+            ("http_request_mongo_commands", "Comandos de MongoDB por petición", registry.request_commands),
+            ("http_request_peak_memory_bytes", "Pico de memoria asignada por petición (muestreo)", registry.peak_memory),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for route, histogram in sorted(table.items()):
+                lines.extend(histogram.lines(name, f'route="{_escape(route)}"'))
+
+        lines.append("# HELP http_request_mongo_seconds_total Tiempo en comandos de MongoDB por ruta")
+        lines.append("# TYPE http_request_mongo_seconds_total counter")
+        for route, seconds in sorted(registry.request_command_seconds.items()):
+            lines.append(f'http_request_mongo_seconds_total{{route="{_escape(route)}"}} {seconds}')
+
+        lines.append("# HELP http_memory_budget_exceeded_total Peticiones que superan el presupuesto de memoria")
+        lines.append("# TYPE http_memory_budget_exceeded_total counter")
+        for (route, action), count in sorted(registry.budget_exceeded.items()):
+            lines.append(f'http_memory_budget_exceeded_total{{route="{_escape(route)}",action="{action}"}} {count}')
+
+        lines.append("# HELP mongo_commands_total Comandos de MongoDB ejecutados")
+        lines.append("# TYPE mongo_commands_total counter")
+        for name, (count, _, _) in sorted(registry.commands.items()):
+            lines.append(f'mongo_commands_total{{command="{name}"}} {count}')
+        lines.append("# HELP mongo_command_failures_total Comandos de MongoDB fallidos")
+        lines.append("# TYPE mongo_command_failures_total counter")
+        for name, (_, failures, _) in sorted(registry.commands.items()):
+            lines.append(f'mongo_command_failures_total{{command="{name}"}} {failures}')
+        lines.append("# HELP mongo_command_seconds_total Tiempo total en comandos de MongoDB")
+        lines.append("# TYPE mongo_command_seconds_total counter")
+        for name, (_, _, seconds) in sorted(registry.commands.items()):
+            lines.append(f'mongo_command_seconds_total{{command="{name}"}} {seconds}')
+    return "\n".join(lines) + "\n"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Cuenta los comandos de MongoDB y los atribuye a la petición en curso"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        registry.record_command(event.command_name, event.duration_micros / 1e6, failed=False)
+
+    def failed(self, event):
+        registry.record_command(event.command_name, event.duration_micros / 1e6, failed=True)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status = 500
+        size = 0
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        with _lock:
+            registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _lock:
+                registry.in_flight -= 1
+            current_request.reset(token)
+            registry.record_request(scope["method"], route_template(scope), status, elapsed, size, stats)
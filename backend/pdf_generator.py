@@ -9,11 +9,23 @@ from pathlib import Path
 import os
 from datetime import datetime
 
+from tracing import span
+
 def generate_certificate_pdf(equipment_data, output_path):
     """
     Genera un certificado PDF similar al formato ASCONSA original.
     Diseño basado en el certificado de ejemplo con logo, tablas y estructura específica.
     """
+    with span("pdf.flowables"):
+        doc, elements = _certificate_flowables(equipment_data, output_path)
+    # Maquetación y escritura del fichero
+    with span("pdf.doc_build"):
+        doc.build(elements)
+    return output_path
+
+
+def _certificate_flowables(equipment_data, output_path):
+    """Documento y elementos (tablas, párrafos, imágenes) del certificado"""
     # Crear el documento
     doc = SimpleDocTemplate(
         output_path,
@@ -288,6 +300,4 @@ def generate_certificate_pdf(equipment_data, output_path):
     footer_text = f"Fecha de emisión: {datetime.now().strftime('%d/%m/%Y')}"
     elements.append(Paragraph(footer_text, footer_style))
     
-    # Construir el PDF
-    doc.build(elements)
-    return output_path
+    return doc, elements
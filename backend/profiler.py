@@ -0,0 +1,248 @@
+"""
+Perfilado bajo demanda de peticiones reales (muestreo de pilas).
+
+Desde `/api/admin/profile` se arma el perfilador para las N peticiones
+siguientes, opcionalmente solo las de una ruta (plantilla, p. ej.
+/api/equipment/{serial_number}/certificate). Mientras hay peticiones
+perfiladas, un hilo toma cada PROFILE_INTERVAL_MS la pila del hilo del
+event loop y la atribuye a la tarea asyncio de la petición que se está
+ejecutando, así que incluye generate_certificate_pdf, la validación de
+Pydantic y la serialización de la respuesta:
+
+  - modo `wall`: tiempo real; cuando la petición está esperando (MongoDB,
+    disco) se cuenta la pila de corutinas suspendidas terminada en <await>
+  - modo `cpu`: solo las muestras en las que el hilo del event loop ha
+    consumido CPU, ponderadas por ella
+
+Cada petición se guarda en PROFILE_DIR en formato de pilas colapsadas
+(`marco;marco;marco muestras`), que leen flamegraph.pl y speedscope. Sin
+perfilado armado el middleware solo comprueba un contador.
+
+Armar el perfilador y descargar perfiles está reservado a los usuarios de
+ADMIN_USERS (los perfiles exponen código y tiempos internos del servidor).
+"""
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.routing import Match
+
+from metrics import route_template
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(__file__).parent / "profiles"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MODES = ("wall", "cpu")
+MAX_PROFILED_REQUESTS = 100
+HISTORY_SIZE = 50
+
+
+def _frame_name(code):
+    return f"{Path(code.co_filename).stem}:{code.co_qualname}"
+
+
+def _thread_stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return names[::-1]
+
+
+def _await_stack(task):
+    """Pila de corutinas de una tarea suspendida, de fuera hacia dentro"""
+    names = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        names.append(_frame_name(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None)
+    names.append("<await>")
+    return names
+
+
+def _write_profile(path, stacks):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks:
+            f.write(f"{stack} {count}\n")
+
+
+class _Session:
+    """Muestras de una petición perfilada"""
+
+    def __init__(self, task, mode, path):
+        self.task = task
+        self.mode = mode
+        self.path = path
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+
+
+class Profiler:
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.remaining = 0
+        self.route = None
+        self.mode = "wall"
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._loop = None
+        self._loop_thread = None
+
+    # --- control -----------------------------------------------------------
+
+    def arm(self, requests=1, route=None, mode="wall"):
+        """Perfilar las `requests` peticiones siguientes (de `route`, si se indica)"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Invalid mode '{mode}': use one of {', '.join(PROFILE_MODES)}")
+        if not 1 <= requests <= MAX_PROFILED_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_PROFILED_REQUESTS}")
+        with self._lock:
+            self.route = route
+            self.mode = mode
+            self.remaining = requests
+        return self.status()
+
+    def disarm(self):
+        with self._lock:
+            self.remaining = 0
+        return self.status()
+
+    def status(self):
+        return {
+            "armed": self.remaining > 0,
+            "remaining": self.remaining,
+            "route": self.route,
+            "mode": self.mode,
+            "interval_ms": self.interval * 1000,
+            "active": len(self._sessions),
+            "profiles": list(self.history),
+        }
+
+    def profile_path(self, name):
+        """Ruta de un perfil guardado (solo los que aparecen en el historial)"""
+        if not any(entry["file"] == name for entry in self.history):
+            return None
+        return PROFILE_DIR / name
+
+    # --- peticiones --------------------------------------------------------
+
+    def _claim(self, scope):
+        """Reservar la petición si el perfilador está armado y la ruta coincide"""
+        if self.route is not None and not any(
+            getattr(route, "path", None) == self.route and route.matches(scope)[0] == Match.FULL
+            for route in scope["app"].router.routes
+        ):
+            return False
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def start(self, scope):
+        task = asyncio.current_task()
+        session = _Session(task, self.mode, scope["path"])
+        with self._lock:
+            self._sessions[task] = session
+            if self._sampler is None or not self._sampler.is_alive():
+                self._loop = asyncio.get_running_loop()
+                self._loop_thread = threading.get_ident()
+                self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self._sampler.start()
+        return session
+
+    async def finish(self, session, scope, status):
+        with self._lock:
+            self._sessions.pop(session.task, None)
+        route = route_template(scope)
+        created = datetime.now(timezone.utc)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = f"{created.strftime('%Y%m%dT%H%M%S_%f')}_{slug}_{session.mode}.collapsed"
+        # Escritura en disco fuera del event loop
+        await asyncio.to_thread(_write_profile, PROFILE_DIR / name, session.stacks.most_common())
+        self.history.appendleft({
+            "file": name,
+            "route": route,
+            "path": session.path,
+            "status": status,
+            "mode": session.mode,
+            "samples": session.samples,
+            "duration_ms": round((time.perf_counter() - session.started) * 1000, 1),
+            "created_at": created.isoformat(),
+        })
+
+    # --- muestreo ----------------------------------------------------------
+
+    def _sample(self):
+        current_tasks = asyncio.tasks._current_tasks
+        cpu_clock = time.pthread_getcpuclockid(self._loop_thread) if hasattr(time, "pthread_getcpuclockid") else None
+        last_cpu = time.clock_gettime(cpu_clock) if cpu_clock is not None else 0.0
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._sessions:
+                    self._sampler = None
+                    return
+                sessions = list(self._sessions.values())
+            cpu_used = 0.0
+            if cpu_clock is not None:
+                now_cpu = time.clock_gettime(cpu_clock)
+                cpu_used, last_cpu = now_cpu - last_cpu, now_cpu
+            running = current_tasks.get(self._loop)
+            frame = sys._current_frames().get(self._loop_thread)
+            for session in sessions:
+                if session.task is running and frame is not None:
+                    stack = _thread_stack(frame)
+                    if session.mode == "cpu":
+                        weight = max(1, round(cpu_used / self.interval)) if cpu_used > 0 else 0
+                    else:
+                        weight = 1
+                elif session.mode == "wall":
+                    stack = _await_stack(session.task)
+                    weight = 1
+                else:
+                    continue
+                if weight:
+                    session.stacks[";".join(stack)] += weight
+                    session.samples += weight
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila las peticiones reservadas por el perfilador armado"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or profiler.remaining <= 0 or not profiler._claim(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_profiled(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        session = profiler.start(scope)
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            await profiler.finish(session, scope, status)
@@ -0,0 +1,166 @@
+"""
+Lecturas de sensores en una colección time-series (sensor_readings).
+
+En calibration_history los valores de cada sensor se guardan como texto
+("100 ppm", "20,9"...). Aquí cada sensor calibrado se guarda además como una
+medición con los valores numéricos ya interpretados, con metaField
+(serial, sensor, botella) y timeField la fecha de calibración, para poder
+filtrar por rango e indexar. `python manage.py backfill-readings` la
+reconstruye a partir del historial existente.
+"""
+import re
+from datetime import timezone
+
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from dates import parse_datetime
+from history_tiering import NAMESPACE_EXISTS
+
+READINGS_COLLECTION = "sensor_readings"
+NUMERIC_FIELDS = ["pre_alarm", "alarm", "calibration_value", "valor_zero", "valor_span"]
+DRIFT_FIELDS = ["valor_span", "valor_zero"]
+BACKFILL_BATCH_SIZE = 1000
+
+_NUMBER = re.compile(r"[-+]?\d+(?:[.,]\d+)?")
+
+
+def parse_reading(value):
+    """Extraer el valor numérico de un texto como '100 ppm' o '20,9 %'"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    return float(match.group().replace(",", "."))
+
+
+def _reading_time(entry):
+    for field in ("calibration_date", "created_at"):
+        parsed = parse_datetime(entry.get(field))
+        if parsed is not None:
+            return parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+def build_readings(entry):
+    """Convertir una entrada de calibration_history en mediciones de sensor"""
+    ts = _reading_time(entry)
+    if ts is None:
+        return []
+    readings = []
+    for sensor in entry.get("calibration_data") or []:
+        reading = {
+            "ts": ts,
+            "meta": {
+                "serial_number": entry["serial_number"],
+                "sensor": sensor.get("sensor", ""),
+                "calibration_bottle": sensor.get("calibration_bottle", "")
+            },
+            "history_id": entry.get("id"),
+            "brand": entry.get("brand"),
+            "model": entry.get("model"),
+            "client_name": entry.get("client_name"),
+            "approved": bool(sensor.get("approved", False))
+        }
+        for field in NUMERIC_FIELDS:
+            reading[field] = parse_reading(sensor.get(field))
+        readings.append(reading)
+    return readings
+
+
+async def ensure_sensor_readings_collection(db):
+    """Crear la colección time-series y sus índices secundarios si no existen"""
+    try:
+        await db.create_collection(
+            READINGS_COLLECTION,
+            timeseries={"timeField": "ts", "metaField": "meta", "granularity": "hours"}
+        )
+    except (CollectionInvalid, OperationFailure) as e:
+        # Ya existe (p. ej. la ha creado otro worker que arrancaba a la vez)
+        if isinstance(e, OperationFailure) and e.code != NAMESPACE_EXISTS:
+            raise
+    await db[READINGS_COLLECTION].create_index([("meta.sensor", 1), ("meta.serial_number", 1), ("ts", 1)])
+    await db[READINGS_COLLECTION].create_index([("meta.serial_number", 1), ("ts", -1)])
+    await db[READINGS_COLLECTION].create_index([("model", 1), ("ts", 1)])
+
+
+async def record_sensor_readings(db, entry):
+    """Guardar las mediciones de una calibración recién registrada"""
+    readings = build_readings(entry)
+    if readings:
+        await db[READINGS_COLLECTION].insert_many(readings, ordered=False)
+
+
+async def backfill_sensor_readings(db, sources=("calibration_history", "calibration_history_archive")):
+    """
+    Reconstruir sensor_readings desde el historial (activo y archivado). Las
+    colecciones time-series no admiten bien borrados selectivos, así que se
+    elimina y se vuelve a crear.
+    """
+    await db[READINGS_COLLECTION].drop()
+    await ensure_sensor_readings_collection(db)
+
+    total = 0
+    batch = []
+    for source in sources:
+        cursor = db[source].find(
+            {"calibration_data.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "serial_number": 1, "brand": 1, "model": 1, "client_name": 1,
+             "calibration_date": 1, "created_at": 1, "calibration_data": 1}
+        ).batch_size(BACKFILL_BATCH_SIZE)
+        async for entry in cursor:
+            batch.extend(build_readings(entry))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                await db[READINGS_COLLECTION].insert_many(batch, ordered=False)
+                total += len(batch)
+                batch = []
+    if batch:
+        await db[READINGS_COLLECTION].insert_many(batch, ordered=False)
+        total += len(batch)
+    return total
+
+
+async def find_sensor_drift(db, sensor, field="valor_span", threshold=0.1, limit=500):
+    """
+    Calibraciones en las que `field` de un tipo de sensor cambió más de `threshold`
+    (fracción, 0.1 = 10%) respecto a la visita anterior del mismo equipo.
+    """
+    if field not in DRIFT_FIELDS:
+        raise ValueError(f"Field must be one of: {', '.join(DRIFT_FIELDS)}")
+
+    pipeline = [
+        {"$match": {"meta.sensor": sensor, field: {"$ne": None}}},
+        {"$setWindowFields": {
+            "partitionBy": "$meta.serial_number",
+            "sortBy": {"ts": 1},
+            "output": {
+                "previous_value": {"$shift": {"output": f"${field}", "by": -1}},
+                "previous_ts": {"$shift": {"output": "$ts", "by": -1}}
+            }
+        }},
+        {"$match": {"previous_value": {"$nin": [None, 0]}}},
+        {"$addFields": {"drift": {"$divide": [
+            {"$subtract": [f"${field}", "$previous_value"]},
+            {"$abs": "$previous_value"}
+        ]}}},
+        {"$match": {"$expr": {"$gt": [{"$abs": "$drift"}, threshold]}}},
+        {"$sort": {"ts": -1}},
+        {"$limit": limit},
+        {"$project": {
+            "_id": 0,
+            "serial_number": "$meta.serial_number",
+            "sensor": "$meta.sensor",
+            "calibration_bottle": "$meta.calibration_bottle",
+            "model": 1,
+            "client_name": 1,
+            "history_id": 1,
+            "calibration_date": "$ts",
+            "previous_calibration_date": "$previous_ts",
+            "value": f"${field}",
+            "previous_value": 1,
+            "drift": 1
+        }}
+    ]
+    return await db[READINGS_COLLECTION].aggregate(pipeline).to_list(limit)
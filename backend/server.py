@@ -1,11 +1,16 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, ORJSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import BulkWriteError
 import os
+import asyncio
 import logging
+import tempfile
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional
@@ -14,22 +19,47 @@ from datetime import datetime, timezone, timedelta
 from passlib.context import CryptContext
 import jwt
 from pdf_generator import generate_certificate_pdf
+from equipment_summary import summary_on_entry, summary_on_entries, summary_on_calibration, summary_on_deliveries
+from master_import import import_equipment_master
+from history_export import build_history_query, iter_csv, iter_history_csv, write_history_xlsx
+from bottle_recall import RECALL_PROJECTION, RECALL_HEADER, bottle_query, recall_record, recall_rows
+from maintenance import compute_next_due_date, find_due_equipment
+from sensor_readings import ensure_sensor_readings_collection, record_sensor_readings, find_sensor_drift
+from calibration_analytics import get_model_analytics
+from spare_parts_report import spare_parts_report, spare_parts_on_calibration, ensure_spare_parts_indexes
+from workshop_stats import stats_on_entry, stats_on_calibration, stats_on_deliveries, get_workshop_stats
+from dates import DATE_PROJECTION, date_fields, date_range_filter, with_datetimes
+from history_tiering import HISTORY_ARCHIVE, ensure_history_archive, history_cursor, find_history_entry, needs_archive
+from equipment_registry import WORKSHOP_FIELDS, master_on_entry, master_on_entries, master_on_calibration, catalog_view
+from fast_responses import model_projection, fast_list
+from compression import CompressionMiddleware
+from workshop_archive import ARCHIVE_COLLECTION, ACTIVE_STATUSES, ensure_archive_indexes, archive_visits, find_equipment_visit
+from metrics import MetricsMiddleware, MongoCommandMetrics, render_metrics
+from slow_queries import SlowQueryMonitor
+from tracing import TracingMiddleware, MongoTracing, span
+from profiler import ProfilingMiddleware, profiler
+from memory_budget import MemoryMiddleware, within_budget, over_budget_response, reject_over_budget, memory_report
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+slow_query_monitor = SlowQueryMonitor(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics(), slow_query_monitor, MongoTracing()])
 db = client[os.environ['DB_NAME']]
 
 # Security
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
+# Token opcional para /api/metrics (Prometheus); sin él el endpoint es público
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Usuarios con acceso a /api/admin/* (perfilador, consultas lentas y memoria); sin ellos quedan desactivados
+ADMIN_USERS = {u.strip() for u in os.environ.get('ADMIN_USERS', '').split(',') if u.strip()}
 ALGORITHM = "HS256"
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -100,8 +130,10 @@ class EquipmentMaster(BaseModel):
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     updated_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     last_workshop_entry: Optional[str] = None
+    last_calibration_data: Optional[List['SensorCalibration']] = None
 
 class EquipmentCatalog(BaseModel):
+    """Forma de la antigua colección equipment_catalog (se sirve desde equipment_master)"""
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     serial_number: str
@@ -114,6 +146,23 @@ class EquipmentCatalog(BaseModel):
     last_calibration_data: Optional[List['SensorCalibration']] = None
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
+class EquipmentSummary(BaseModel):
+    """Resumen desnormalizado del estado actual de un equipo (uno por número de serie)"""
+    model_config = ConfigDict(extra="ignore")
+    serial_number: str
+    brand: str
+    model: str
+    client_name: str
+    client_cif: str
+    client_departamento: str = ""
+    status: str
+    last_entry_date: Optional[str] = None
+    last_calibration_date: Optional[str] = None
+    last_certificate_number: Optional[str] = None
+    last_delivery_date: Optional[str] = None
+    next_due_date: Optional[str] = None
+    visit_count: int = 0
+
 class CalibrationHistory(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -133,6 +182,7 @@ class CalibrationHistory(BaseModel):
     use_department_as_client: bool = False  # Si true, usar departamento como cliente en certificado
     delivery_note: Optional[str] = None
     certificate_number: Optional[str] = None
+    next_due_date: Optional[str] = None  # Próximo mantenimiento recomendado
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class SensorCalibration(BaseModel):
@@ -183,6 +233,23 @@ class EquipmentCreate(BaseModel):
     observations: str = ""
     entry_date: str
 
+# Máximo de equipos en una entrada por lotes (una sola escritura por colección)
+MAX_EQUIPMENT_BATCH = 500
+
+class EquipmentBatchCreate(BaseModel):
+    """Entrada al taller de varios equipos en una sola petición"""
+    equipment: List[EquipmentCreate]
+
+class IntakeInfo(BaseModel):
+    """Todo lo que necesita la pantalla de entrada al taller para un número de serie"""
+    serial_number: str
+    master: Optional[EquipmentMaster] = None
+    catalog: Optional[EquipmentCatalog] = None
+    in_workshop: Optional[Equipment] = None
+    last_calibration_date: Optional[str] = None
+    last_calibration_data: List[SensorCalibration] = Field(default_factory=list)
+    client_departamentos: List[str] = Field(default_factory=list)
+
 class CalibrationUpdate(BaseModel):
     calibration_data: List[SensorCalibration]
     spare_parts: List[SparePart] = []
@@ -197,6 +264,11 @@ class DeliveryUpdate(BaseModel):
     delivery_location: str
     delivery_date: str
 
+class ProfileRequest(BaseModel):
+    requests: int = 1
+    route: Optional[str] = None  # Plantilla de ruta, p. ej. /api/equipment/{serial_number}/certificate
+    mode: str = "wall"  # wall | cpu
+
 # Auth functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -213,54 +285,46 @@ def create_access_token(data: dict):
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"username": username}, {"_id": 0})
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        with span("auth.get_current_user"):
+            token = credentials.credentials
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise HTTPException(status_code=401, detail="Invalid token")
+            user = await db.users.find_one({"username": username}, {"_id": 0})
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            return user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except (jwt.DecodeError, jwt.InvalidTokenError, Exception):
         raise HTTPException(status_code=401, detail="Invalid token")
 
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user["username"] not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
 # Certificate number generation
-async def generate_certificate_number():
+async def generate_certificate_numbers(count: int) -> List[str]:
     """
-    Genera un número de certificado correlativo en formato YY-NNNNN
+    Reserva `count` números de certificado correlativos en formato YY-NNNNN
     donde YY son los dos últimos dígitos del año actual
-    y NNNNN es un número correlativo de 5 dígitos (00001-99999)
+    y NNNNN es un número correlativo de 5 dígitos (00001-99999).
+    Un único $inc atómico reserva todo el bloque, sin carreras entre entregas simultáneas.
     """
     current_year = datetime.now().year
     year_suffix = str(current_year)[-2:]  # Últimos 2 dígitos del año
-    
-    # Buscar el último certificado del año actual
-    counter_doc = await db.certificate_counters.find_one({"year": current_year})
-    
-    if counter_doc:
-        # Incrementar el contador existente
-        new_counter = counter_doc['counter'] + 1
-        if new_counter > 99999:
-            raise HTTPException(status_code=500, detail="Se ha alcanzado el límite de certificados para este año")
-        
-        await db.certificate_counters.update_one(
-            {"year": current_year},
-            {"$set": {"counter": new_counter}}
-        )
-    else:
-        # Crear nuevo contador para el año
-        new_counter = 1
-        await db.certificate_counters.insert_one({
-            "year": current_year,
-            "counter": new_counter
-        })
-    
-    # Formatear el número: YY-NNNNN
-    certificate_number = f"{year_suffix}-{new_counter:05d}"
-    return certificate_number
+    counter_doc = await db.certificate_counters.find_one_and_update(
+        {"year": current_year},
+        {"$inc": {"counter": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    last = counter_doc["counter"]
+    if last > 99999:
+        raise HTTPException(status_code=500, detail="Se ha alcanzado el límite de certificados para este año")
+    return [f"{year_suffix}-{number:05d}" for number in range(last - count + 1, last + 1)]
 
 # Auth routes
 @api_router.post("/auth/register", response_model=User)
@@ -383,8 +447,11 @@ async def create_technician(technician: Technician, current_user: dict = Depends
 @api_router.get("/equipment-master", response_model=List[EquipmentMaster])
 async def get_all_equipment_master(current_user: dict = Depends(get_current_user)):
     """Obtener todos los equipos del catálogo maestro"""
-    equipment = await db.equipment_master.find({}, {"_id": 0}).sort("serial_number", 1).to_list(10000)
-    return equipment
+    cursor = db.equipment_master.find({}, model_projection(EquipmentMaster)).sort("serial_number", 1)
+    if not await within_budget(db, ["equipment_master"], {}, 10000):
+        return over_budget_response(cursor, EquipmentMaster, 10000)
+    equipment = await cursor.to_list(10000)
+    return fast_list(equipment, EquipmentMaster)
 
 @api_router.get("/equipment-master/search")
 async def search_equipment_master(
@@ -405,13 +472,16 @@ async def search_equipment_master(
     if cliente:
         query["current_client_name"] = {"$regex": cliente, "$options": "i"}
     
-    equipment = await db.equipment_master.find(query, {"_id": 0}).sort("serial_number", 1).to_list(10000)
+    cursor = db.equipment_master.find(query, DATE_PROJECTION).sort("serial_number", 1)
+    if not await within_budget(db, ["equipment_master"], query, 10000):
+        return over_budget_response(cursor, limit=10000)
+    equipment = await cursor.to_list(10000)
     return equipment
 
 @api_router.get("/equipment-master/{serial_number}", response_model=Optional[EquipmentMaster])
 async def get_equipment_master_by_serial(serial_number: str, current_user: dict = Depends(get_current_user)):
     """Obtener equipo del catálogo maestro por número de serie"""
-    equipment = await db.equipment_master.find_one({"serial_number": serial_number}, {"_id": 0})
+    equipment = await db.equipment_master.find_one({"serial_number": serial_number}, DATE_PROJECTION)
     if not equipment:
         return None
     return equipment
@@ -428,9 +498,24 @@ async def create_equipment_master(equipment: EquipmentMaster, current_user: dict
     # Convertir objetos SensorDefault a dict
     equipment_dict['default_sensors'] = [sensor.model_dump() if hasattr(sensor, 'model_dump') else sensor for sensor in equipment.default_sensors]
     
-    await db.equipment_master.insert_one(equipment_dict)
+    await db.equipment_master.insert_one(with_datetimes(equipment_dict))
     return equipment
 
+@api_router.post("/equipment-master/import")
+async def import_equipment_master_file(
+    file: UploadFile = File(...),
+    update_existing: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Importar equipos al catálogo maestro desde un fichero CSV o XLSX.
+    Devuelve el número de filas procesadas, insertadas y actualizadas, y los errores por fila.
+    """
+    try:
+        return await import_equipment_master(db, file.file, file.filename, update_existing=update_existing)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @api_router.put("/equipment-master/{serial_number}", response_model=EquipmentMaster)
 async def update_equipment_master(serial_number: str, equipment: EquipmentMaster, current_user: dict = Depends(get_current_user)):
     """Actualizar equipo en catálogo maestro"""
@@ -438,17 +523,18 @@ async def update_equipment_master(serial_number: str, equipment: EquipmentMaster
     if not existing:
         raise HTTPException(status_code=404, detail="Equipment not found in master catalog")
     
-    equipment_dict = equipment.model_dump()
+    # Los campos que mantiene el taller (última entrada y sensores calibrados) no se editan aquí
+    equipment_dict = equipment.model_dump(exclude=WORKSHOP_FIELDS)
     # Convertir objetos SensorDefault a dict
     equipment_dict['default_sensors'] = [sensor.model_dump() if hasattr(sensor, 'model_dump') else sensor for sensor in equipment.default_sensors]
     equipment_dict['updated_at'] = datetime.now(timezone.utc).isoformat()
     
     await db.equipment_master.update_one(
         {"serial_number": serial_number},
-        {"$set": equipment_dict}
+        {"$set": with_datetimes(equipment_dict)}
     )
     
-    updated = await db.equipment_master.find_one({"serial_number": serial_number}, {"_id": 0})
+    updated = await db.equipment_master.find_one({"serial_number": serial_number}, DATE_PROJECTION)
     return updated
 
 @api_router.delete("/equipment-master/{serial_number}")
@@ -462,17 +548,18 @@ async def delete_equipment_master(serial_number: str, current_user: dict = Depen
 # Equipment routes
 @api_router.get("/equipment-catalog/serial/{serial_number}", response_model=Optional[EquipmentCatalog])
 async def get_equipment_catalog_by_serial(serial_number: str, current_user: dict = Depends(get_current_user)):
-    catalog_entry = await db.equipment_catalog.find_one({"serial_number": serial_number}, {"_id": 0})
-    if not catalog_entry:
+    """Compatibilidad: el catálogo de equipos ahora forma parte de equipment_master"""
+    master = await db.equipment_master.find_one({"serial_number": serial_number}, DATE_PROJECTION)
+    if not master:
         return None
-    return catalog_entry
+    return catalog_view(master)
 
 @api_router.post("/equipment", response_model=Equipment)
 async def create_equipment(equipment_data: EquipmentCreate, current_user: dict = Depends(get_current_user)):
     # Validación más estricta: buscar cualquier equipo con el mismo serial que no esté delivered
     existing = await db.equipment.find_one({
         "serial_number": equipment_data.serial_number, 
-        "status": {"$in": ["pending", "calibrated"]}
+        "status": {"$in": ACTIVE_STATUSES}
     })
     if existing:
         status_msg = existing.get('status', 'unknown')
@@ -482,30 +569,134 @@ async def create_equipment(equipment_data: EquipmentCreate, current_user: dict =
         )
     
     equipment = Equipment(**equipment_data.model_dump())
-    await db.equipment.insert_one(equipment.model_dump())
-    
-    # Update or create equipment catalog entry
-    catalog_entry = EquipmentCatalog(
-        serial_number=equipment_data.serial_number,
-        brand=equipment_data.brand,
-        model=equipment_data.model,
-        client_name=equipment_data.client_name,
-        client_cif=equipment_data.client_cif,
-        client_departamento=equipment_data.client_departamento,
-        last_entry_date=equipment_data.entry_date
-    )
+    await db.equipment.insert_one(with_datetimes(equipment.model_dump()))
     
-    await db.equipment_catalog.update_one(
-        {"serial_number": equipment_data.serial_number},
-        {"$set": catalog_entry.model_dump()},
-        upsert=True
-    )
+    # Actualizar (o crear) el registro del equipo con el cliente actual y la fecha de entrada
+    await master_on_entry(db, equipment.model_dump())
+    await summary_on_entry(db, equipment.model_dump())
+    await stats_on_entry(db)
     
     return equipment
 
+@api_router.post("/equipment/batch")
+async def create_equipment_batch(batch: EquipmentBatchCreate, current_user: dict = Depends(get_current_user)):
+    """
+    Registrar la entrada al taller de varios equipos a la vez.
+    Devuelve un resultado por número de serie; los equipos rechazados no impiden la entrada del resto.
+    """
+    if len(batch.equipment) > MAX_EQUIPMENT_BATCH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many equipment in one batch ({len(batch.equipment)}); the maximum is {MAX_EQUIPMENT_BATCH}"
+        )
+    
+    results = []
+    accepted = []
+    seen = set()
+    
+    # Una única consulta para detectar equipos que ya están en el taller
+    serials = [item.serial_number for item in batch.equipment]
+    active = await db.equipment.find(
+        {"serial_number": {"$in": serials}, "status": {"$in": ACTIVE_STATUSES}},
+        {"_id": 0, "serial_number": 1, "status": 1}
+    ).to_list(None)
+    active_status = {doc["serial_number"]: doc.get("status", "unknown") for doc in active}
+    
+    for item in batch.equipment:
+        serial = item.serial_number
+        if serial in seen:
+            results.append({"serial_number": serial, "status": "error", "detail": "Duplicated serial number in request"})
+            continue
+        seen.add(serial)
+        if serial in active_status:
+            results.append({
+                "serial_number": serial,
+                "status": "error",
+                "detail": f"Equipment with serial number '{serial}' already exists in workshop with status '{active_status[serial]}'"
+            })
+            continue
+        equipment = Equipment(**item.model_dump())
+        accepted.append(with_datetimes(equipment.model_dump()))
+        results.append({"serial_number": serial, "status": "created", "id": equipment.id})
+    
+    if accepted:
+        try:
+            await db.equipment.insert_many(accepted, ordered=False)
+        except BulkWriteError as e:
+            # ordered=False: se insertan los demás; los fallidos se marcan como rechazados
+            failed = {error["index"]: error.get("errmsg", "Insert failed") for error in e.details.get("writeErrors", [])}
+            by_id = {result.get("id"): result for result in results}
+            for index, detail in failed.items():
+                result = by_id[accepted[index]["id"]]
+                result.pop("id")
+                result.update({"status": "error", "detail": detail})
+            accepted = [doc for index, doc in enumerate(accepted) if index not in failed]
+        for doc in accepted:
+            doc.pop("_id", None)
+        
+        # Actualizar o crear el registro de los equipos en una sola escritura
+        await master_on_entries(db, accepted)
+        
+        await summary_on_entries(db, accepted)
+        if accepted:
+            await stats_on_entry(db, len(accepted))
+    
+    return {
+        "created": len(accepted),
+        "errors": len(results) - len(accepted),
+        "results": results
+    }
+
+@api_router.get("/intake/{serial_number}", response_model=IntakeInfo)
+async def get_intake_info(serial_number: str, current_user: dict = Depends(get_current_user)):
+    """
+    Datos para registrar la entrada de un equipo en una sola petición: registro del equipo
+    (catálogo maestro), visita activa en taller, sensores de la última calibración y
+    departamentos del cliente. Las consultas independientes se lanzan en paralelo.
+    """
+    async def find_last_calibration():
+        cursor = await history_cursor(
+            db,
+            {"serial_number": serial_number},
+            {"_id": 0, "calibration_date": 1, "calibration_data": 1},
+            limit=1
+        )
+        return await cursor.to_list(1)
+    
+    master, in_workshop, last_calibration = await asyncio.gather(
+        db.equipment_master.find_one({"serial_number": serial_number}, DATE_PROJECTION),
+        db.equipment.find_one({"serial_number": serial_number, "status": {"$in": ACTIVE_STATUSES}}, DATE_PROJECTION),
+        find_last_calibration()
+    )
+    
+    # El cliente actual: el de la visita en curso o, si no hay, el del catálogo
+    client_cif, client_name = None, None
+    if in_workshop:
+        client_cif, client_name = in_workshop.get("client_cif"), in_workshop.get("client_name")
+    elif master:
+        client_cif, client_name = master.get("current_client_cif"), master.get("current_client_name")
+    client_query = {"cif": client_cif} if client_cif else ({"name": client_name} if client_name else None)
+    
+    departamentos = []
+    if client_query:
+        client_doc = await db.clients.find_one(client_query, {"_id": 0, "departamentos": 1})
+        if client_doc:
+            departamentos = [d for d in client_doc.get("departamentos", []) if d and d.strip()]
+    
+    last = last_calibration[0] if last_calibration else {}
+    return IntakeInfo(
+        serial_number=serial_number,
+        master=master,
+        catalog=catalog_view(master) if master else None,
+        in_workshop=in_workshop,
+        last_calibration_date=last.get("calibration_date"),
+        last_calibration_data=last.get("calibration_data") or [],
+        client_departamentos=departamentos
+    )
+
 @api_router.get("/equipment/serial/{serial_number}", response_model=Equipment)
 async def get_equipment_by_serial(serial_number: str, current_user: dict = Depends(get_current_user)):
-    equipment = await db.equipment.find_one({"serial_number": serial_number, "status": {"$ne": "delivered"}}, {"_id": 0})
+    equipment = await db.equipment.find_one({"serial_number": serial_number, "status": {"$in": ACTIVE_STATUSES}}, DATE_PROJECTION)
     if not equipment:
         raise HTTPException(status_code=404, detail="Equipment not found")
     return equipment
@@ -515,7 +706,7 @@ async def calibrate_equipment(serial_number: str, calibration: CalibrationUpdate
     # Buscar el equipo que NO está delivered (el que está actualmente en el taller)
     equipment = await db.equipment.find_one({
         "serial_number": serial_number,
-        "status": {"$ne": "delivered"}
+        "status": {"$in": ACTIVE_STATUSES}
     })
     if not equipment:
         raise HTTPException(status_code=404, detail="Equipment not found or already delivered")
@@ -531,8 +722,8 @@ async def calibrate_equipment(serial_number: str, calibration: CalibrationUpdate
     }
     
     # Actualizar usando el ID específico del equipo, no solo el serial_number
-    await db.equipment.update_one({"id": equipment['id']}, {"$set": update_data})
-    updated = await db.equipment.find_one({"id": equipment['id']}, {"_id": 0})
+    await db.equipment.update_one({"id": equipment['id']}, {"$set": with_datetimes(update_data)})
+    updated = await db.equipment.find_one({"id": equipment['id']}, DATE_PROJECTION)
     
     # Guardar en historial de calibraciones
     history_entry = CalibrationHistory(
@@ -549,29 +740,35 @@ async def calibrate_equipment(serial_number: str, calibration: CalibrationUpdate
         calibration_date=calibration.calibration_date,
         technician=calibration.technician,
         internal_notes=calibration.internal_notes,
-        use_department_as_client=calibration.use_department_as_client
+        use_department_as_client=calibration.use_department_as_client,
+        next_due_date=compute_next_due_date(calibration.calibration_date)
     )
     history_dict = history_entry.model_dump()
-    await db.calibration_history.insert_one(history_dict)
+    await db.calibration_history.insert_one(with_datetimes(history_dict))
+    await record_sensor_readings(db, history_dict)
     
-    # Actualizar catálogo con última calibración
-    await db.equipment_catalog.update_one(
-        {"serial_number": serial_number},
-        {"$set": {"last_calibration_data": [item.model_dump() for item in calibration.calibration_data]}},
-        upsert=False
-    )
+    # Guardar los sensores de la última calibración en el registro del equipo
+    await master_on_calibration(db, serial_number, [item.model_dump() for item in calibration.calibration_data])
+    
+    await summary_on_calibration(db, serial_number, calibration.calibration_date)
+    await stats_on_calibration(db, equipment['status'], calibration.technician, calibration.calibration_date)
+    await spare_parts_on_calibration(db, calibration.calibration_date, history_dict["spare_parts"])
     
     return updated
 
 @api_router.get("/equipment/pending", response_model=List[Equipment])
 async def get_pending_equipment(current_user: dict = Depends(get_current_user)):
-    equipment = await db.equipment.find({"status": "pending"}, {"_id": 0}).to_list(1000)
-    return equipment
+    equipment = await db.equipment.find({"status": "pending"}, model_projection(Equipment)).to_list(1000)
+    return fast_list(equipment, Equipment)
 
 @api_router.get("/equipment/{serial_number}/certificate")
 async def download_certificate(serial_number: str, current_user: dict = Depends(get_current_user)):
     """Generar y descargar certificado PDF de calibración"""
-    equipment = await db.equipment.find_one({"serial_number": serial_number}, {"_id": 0})
+    # Visita calibrada en taller, última entrega o, si no hay ninguna, la visita pendiente
+    equipment = (
+        await find_equipment_visit(db, serial_number, DATE_PROJECTION, statuses=["calibrated"])
+        or await db.equipment.find_one({"serial_number": serial_number}, DATE_PROJECTION)
+    )
     if not equipment:
         raise HTTPException(status_code=404, detail="Equipment not found")
     
@@ -596,20 +793,88 @@ async def download_certificate(serial_number: str, current_user: dict = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
+def history_date_query(date_from: str = None, date_to: str = None) -> dict:
+    """Filtro por fecha de calibración (`from`/`to`) sobre calibration_dt"""
+    if not date_from and not date_to:
+        return {}
+    try:
+        return {"calibration_dt": date_range_filter(date_from, date_to)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def history_collections(archive: bool) -> list:
+    """Colecciones que lee una consulta del historial (para estimar su memoria)"""
+    if archive:
+        return ["calibration_history", HISTORY_ARCHIVE]
+    return ["calibration_history"]
+
 @api_router.get("/calibration-history/all", response_model=List[CalibrationHistory])
-async def get_all_calibration_history(current_user: dict = Depends(get_current_user)):
-    """Obtener todo el historial de calibraciones"""
-    history = await db.calibration_history.find(
-        {}, 
-        {"_id": 0}
-    ).sort("calibration_date", -1).to_list(10000)
-    return history
+async def get_all_calibration_history(
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Obtener todo el historial de calibraciones, opcionalmente entre las fechas `from`/`to`"""
+    query = history_date_query(date_from, date_to)
+    archive = await needs_archive(db, date_from)
+    cursor = await history_cursor(db, query, model_projection(CalibrationHistory), limit=10000, archive=archive)
+    if not await within_budget(db, history_collections(archive), query, 10000):
+        return over_budget_response(cursor, CalibrationHistory, 10000)
+    history = await cursor.to_list(10000)
+    return fast_list(history, CalibrationHistory)
+
+@api_router.get("/calibration-history/export")
+async def export_calibration_history(
+    format: str = "csv",
+    cliente: str = None,
+    modelo: str = None,
+    serial: str = None,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Exportar el historial de calibraciones a CSV o XLSX, una fila por sensor y por repuesto.
+    Las fechas `from`/`to` (YYYY-MM-DD) filtran por fecha de calibración, ambas incluidas.
+    """
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'xlsx'")
+    
+    try:
+        query = build_history_query(cliente, modelo, serial, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cursor = await history_cursor(db, query, DATE_PROJECTION, date_from)
+    filename = f"historial_calibraciones_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    
+    if format == "csv":
+        return StreamingResponse(
+            iter_history_csv(cursor),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    fd, xlsx_path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await write_history_xlsx(cursor, xlsx_path)
+    except Exception as e:
+        os.unlink(xlsx_path)
+        raise HTTPException(status_code=500, detail=f"Error generating XLSX: {str(e)}")
+    return FileResponse(
+        path=xlsx_path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=filename,
+        background=BackgroundTask(os.unlink, xlsx_path)
+    )
 
 @api_router.get("/calibration-history/search")
 async def search_calibration_history(
     cliente: str = None,
     modelo: str = None,
     serial: str = None,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
     current_user: dict = Depends(get_current_user)
 ):
     """
@@ -617,7 +882,7 @@ async def search_calibration_history(
     Agrupa calibraciones por serial_number y retorna información del equipo con todas sus calibraciones.
     """
     # Construir query de búsqueda
-    query = {}
+    query = history_date_query(date_from, date_to)
     if cliente:
         query["client_name"] = {"$regex": cliente, "$options": "i"}
     if modelo:
@@ -625,11 +890,12 @@ async def search_calibration_history(
     if serial:
         query["serial_number"] = {"$regex": serial, "$options": "i"}
     
-    # Obtener todas las calibraciones que coincidan
-    all_calibrations = await db.calibration_history.find(
-        query,
-        {"_id": 0}
-    ).sort("calibration_date", -1).to_list(10000)
+    # Obtener todas las calibraciones que coincidan (la agrupación necesita todas en memoria)
+    archive = await needs_archive(db, date_from)
+    if not await within_budget(db, history_collections(archive), query, 10000):
+        reject_over_budget()
+    cursor = await history_cursor(db, query, DATE_PROJECTION, limit=10000, archive=archive)
+    all_calibrations = await cursor.to_list(10000)
     
     # Agrupar por serial_number
     equipments = {}
@@ -665,18 +931,27 @@ async def search_calibration_history(
     return result
 
 @api_router.get("/equipment/{serial_number}/history", response_model=List[CalibrationHistory])
-async def get_equipment_history(serial_number: str, current_user: dict = Depends(get_current_user)):
-    """Obtener historial de calibraciones de un equipo"""
-    history = await db.calibration_history.find(
-        {"serial_number": serial_number}, 
-        {"_id": 0}
-    ).sort("calibration_date", -1).to_list(1000)
-    return history
+async def get_equipment_history(
+    serial_number: str,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Obtener historial de calibraciones de un equipo, opcionalmente entre las fechas `from`/`to`"""
+    cursor = await history_cursor(
+        db,
+        {"serial_number": serial_number, **history_date_query(date_from, date_to)},
+        model_projection(CalibrationHistory),
+        date_from,
+        limit=1000
+    )
+    history = await cursor.to_list(1000)
+    return fast_list(history, CalibrationHistory)
 
 @api_router.get("/equipment/history/{history_id}/certificate")
 async def download_history_certificate(history_id: str, current_user: dict = Depends(get_current_user)):
     """Generar y descargar certificado PDF de una calibración histórica"""
-    history_entry = await db.calibration_history.find_one({"id": history_id}, {"_id": 0})
+    history_entry = await find_history_entry(db, {"id": history_id}, DATE_PROJECTION)
     if not history_entry:
         raise HTTPException(status_code=404, detail="Calibration history not found")
     
@@ -699,53 +974,282 @@ async def download_history_certificate(history_id: str, current_user: dict = Dep
 
 @api_router.get("/equipment/calibrated", response_model=List[Equipment])
 async def get_calibrated_equipment(current_user: dict = Depends(get_current_user)):
-    equipment = await db.equipment.find({"status": "calibrated"}, {"_id": 0}).to_list(1000)
-    return equipment
+    equipment = await db.equipment.find({"status": "calibrated"}, model_projection(Equipment)).to_list(1000)
+    return fast_list(equipment, Equipment)
 
 @api_router.put("/equipment/deliver")
 async def deliver_equipment(delivery: DeliveryUpdate, current_user: dict = Depends(get_current_user)):
-    for serial in delivery.serial_numbers:
-        # Buscar el equipo calibrado específico (no delivered)
-        equipment = await db.equipment.find_one({
-            "serial_number": serial,
-            "status": "calibrated"
-        })
-        if not equipment:
-            continue  # Skip if not found or not calibrated
-            
-        # Generar número de certificado único para cada equipo
-        certificate_number = await generate_certificate_number()
-        
-        # Actualizar equipo con datos de entrega y certificado usando ID específico
-        await db.equipment.update_one(
-            {"id": equipment['id']},
-            {"$set": {
-                "status": "delivered",
-                "delivery_note": delivery.delivery_note,
-                "delivery_location": delivery.delivery_location,
-                "delivery_date": delivery.delivery_date,
-                "certificate_number": certificate_number
-            }}
-        )
-        
-        # Actualizar historial con número de certificado y albarán
-        await db.calibration_history.update_many(
-            {"serial_number": serial, "certificate_number": None},
-            {"$set": {
-                "delivery_note": delivery.delivery_note,
-                "certificate_number": certificate_number
-            }}
+    # Equipos calibrados (no entregados) de la entrega, en una sola consulta
+    calibrated = {}
+    async for equipment in db.equipment.find({
+        "serial_number": {"$in": delivery.serial_numbers},
+        "status": "calibrated"
+    }):
+        calibrated.setdefault(equipment["serial_number"], equipment)
+    # Los que no están calibrados se omiten; se respeta el orden de la entrega
+    delivered = [calibrated.pop(serial) for serial in delivery.serial_numbers if serial in calibrated]
+    if not delivered:
+        return {"message": f"{len(delivery.serial_numbers)} equipment delivered"}
+
+    # Número de certificado único para cada equipo, reservados en bloque
+    certificate_numbers = await generate_certificate_numbers(len(delivered))
+    delivery_fields = {
+        "status": "delivered",
+        "delivery_note": delivery.delivery_note,
+        "delivery_location": delivery.delivery_location,
+        "delivery_date": delivery.delivery_date,
+        **date_fields({"delivery_date": delivery.delivery_date})
+    }
+
+    # Actualizar equipos con datos de entrega y certificado usando ID específico
+    await db.equipment.bulk_write([
+        UpdateOne({"id": equipment["id"]}, {"$set": {**delivery_fields, "certificate_number": certificate_number}})
+        for equipment, certificate_number in zip(delivered, certificate_numbers)
+    ], ordered=False)
+
+    # Actualizar historial con número de certificado y albarán
+    await db.calibration_history.bulk_write([
+        UpdateMany(
+            {"serial_number": equipment["serial_number"], "certificate_number": None},
+            {"$set": {"delivery_note": delivery.delivery_note, "certificate_number": certificate_number}}
         )
-        
+        for equipment, certificate_number in zip(delivered, certificate_numbers)
+    ], ordered=False)
+
+    await summary_on_deliveries(
+        db, [(e["serial_number"], number) for e, number in zip(delivered, certificate_numbers)], delivery.delivery_date
+    )
+    await stats_on_deliveries(db, [e["entry_date"] for e in delivered], delivery.delivery_date)
+
+    # Las visitas entregadas salen del conjunto activo del taller
+    await archive_visits(db, [
+        {**equipment, **delivery_fields, "certificate_number": certificate_number}
+        for equipment, certificate_number in zip(delivered, certificate_numbers)
+    ])
+
     return {"message": f"{len(delivery.serial_numbers)} equipment delivered"}
 
 @api_router.get("/equipment/delivered", response_model=List[Equipment])
 async def get_delivered_equipment(current_user: dict = Depends(get_current_user)):
-    equipment = await db.equipment.find({"status": "delivered"}, {"_id": 0}).to_list(1000)
-    return equipment
+    equipment = await db[ARCHIVE_COLLECTION].find({}, model_projection(Equipment)).sort("delivery_dt", -1).to_list(1000)
+    return fast_list(equipment, Equipment)
+
+# Dashboard statistics
+@api_router.get("/stats")
+async def get_stats(weeks: int = 12, months: int = 12, current_user: dict = Depends(get_current_user)):
+    """
+    Estadísticas del panel de control: equipos por estado, calibraciones por técnico y semana,
+    entregas por mes y tiempo medio en taller (días desde la entrada hasta la entrega).
+    """
+    return await get_workshop_stats(db, weeks=weeks, months=months)
+
+# Calibration bottle routes
+@api_router.get("/bottles/{bottle}/certificates")
+async def get_bottle_certificates(
+    bottle: str,
+    format: str = "json",
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Certificados de las calibraciones que usaron una botella de calibración, los más recientes primero.
+    En JSON se devuelven como máximo `limit`; con `format=csv` se descarga el listado completo como CSV.
+    """
+    if format not in ("json", "csv"):
+        raise HTTPException(status_code=400, detail="Format must be 'json' or 'csv'")
+    
+    query = {**bottle_query(bottle), **history_date_query(date_from, date_to)}
+    
+    if format == "csv":
+        cursor = await history_cursor(db, query, RECALL_PROJECTION, date_from)
+        filename = f"botella_{bottle}_certificados.csv"
+        return StreamingResponse(
+            iter_csv(cursor, RECALL_HEADER, recall_rows(bottle)),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    
+    archive = await needs_archive(db, date_from)
+    if not await within_budget(db, history_collections(archive), query, limit):
+        reject_over_budget()
+    cursor = await history_cursor(db, query, RECALL_PROJECTION, limit=limit, archive=archive)
+    return [recall_record(entry, bottle) async for entry in cursor]
+
+# Sensor readings routes
+@api_router.get("/sensor-readings/drift")
+async def get_sensor_drift(
+    sensor: str,
+    field: str = "valor_span",
+    threshold: float = 0.1,
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Sensores de un tipo (p. ej. CO) cuyo SPAN o ZERO varió más de `threshold`
+    (0.1 = 10%) respecto a la calibración anterior del mismo equipo.
+    """
+    try:
+        return await find_sensor_drift(db, sensor, field=field, threshold=threshold, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Analytics routes
+@api_router.get("/analytics/models")
+async def get_analytics_all_models(refresh: bool = False, current_user: dict = Depends(get_current_user)):
+    """Tasas de aprobación, deriva media por sensor y equipos atípicos de todos los modelos"""
+    return await get_model_analytics(db, None, refresh=refresh)
+
+@api_router.get("/analytics/models/{model}")
+async def get_analytics_model(model: str, refresh: bool = False, current_user: dict = Depends(get_current_user)):
+    """Tasas de aprobación, deriva media por sensor y equipos atípicos de un modelo"""
+    return await get_model_analytics(db, model, refresh=refresh)
+
+# Report routes
+@api_router.get("/reports/spare-parts")
+async def get_spare_parts_report(
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Consumo mensual de repuestos por referencia y ratio de garantía por modelo y cliente.
+    `from`/`to` son meses (YYYY-MM); por defecto, los últimos 12 meses.
+    """
+    try:
+        return await spare_parts_report(db, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Maintenance routes
+@api_router.get("/maintenance/due")
+async def get_maintenance_due(
+    days: int = 30,
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    cliente: str = None,
+    limit: int = Query(100, ge=1, le=1000),
+    after: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Equipos con mantenimiento vencido o que vence en los próximos `days` días.
+    `from`/`to` (YYYY-MM-DD) sustituyen al rango por defecto; `cliente` es el nombre exacto del cliente.
+    Paginación por clave: pasar `next_cursor` de la respuesta como `after`.
+    """
+    if date_to is None:
+        date_to = (datetime.now(timezone.utc) + timedelta(days=days)).strftime("%Y-%m-%d")
+    try:
+        return await find_due_equipment(
+            db, date_from=date_from, date_to=date_to, cliente=cliente, limit=limit, after=after
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Equipment summary routes
+@api_router.get("/equipment-summary", response_model=List[EquipmentSummary])
+async def search_equipment_summary(
+    cliente: str = None,
+    serial: str = None,
+    status: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Resumen del estado actual de los equipos, ordenado por última calibración"""
+    query = {}
+    if cliente:
+        query["client_name"] = {"$regex": cliente, "$options": "i"}
+    if serial:
+        query["serial_number"] = {"$regex": serial, "$options": "i"}
+    if status:
+        query["status"] = status
+    
+    cursor = db.equipment_summary.find(query, model_projection(EquipmentSummary)).sort("last_calibration_date", -1)
+    if not await within_budget(db, ["equipment_summary"], query, 10000):
+        return over_budget_response(cursor, EquipmentSummary, 10000)
+    summary = await cursor.to_list(10000)
+    return summary
+
+@api_router.get("/equipment-summary/{serial_number}", response_model=Optional[EquipmentSummary])
+async def get_equipment_summary(serial_number: str, current_user: dict = Depends(get_current_user)):
+    """Estado actual de un equipo en una única lectura indexada"""
+    summary = await db.equipment_summary.find_one({"serial_number": serial_number}, {"_id": 0})
+    if not summary:
+        return None
+    return summary
+
+@api_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """Métricas por ruta y por comando de MongoDB en formato de texto de Prometheus"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Admin routes
+@api_router.get("/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=500),
+    current_user: dict = Depends(get_admin_user)
+):
+    """
+    Formas de consulta de MongoDB más lentas (por tiempo total) con las rutas que
+    las lanzan y, en modo diagnóstico (QUERY_DIAGNOSTICS=1), el resultado de explain.
+    """
+    return {
+        "threshold_ms": slow_query_monitor.threshold_ms,
+        "diagnostics": slow_query_monitor.diagnostics,
+        "queries": slow_query_monitor.top(limit),
+        "flagged_plans": slow_query_monitor.flagged_plans(),
+    }
+
+@api_router.delete("/admin/slow-queries")
+async def reset_slow_queries(current_user: dict = Depends(get_admin_user)):
+    """Vaciar el registro de consultas lentas"""
+    slow_query_monitor.reset()
+    return {"message": "Slow query log cleared"}
+
+@api_router.get("/admin/memory")
+async def get_memory_report(
+    limit: int = Query(20, ge=1, le=500),
+    current_user: dict = Depends(get_admin_user)
+):
+    """Rutas con mayor pico de memoria (peticiones muestreadas) y listados cortados por presupuesto"""
+    return memory_report(limit)
+
+@api_router.post("/admin/profile")
+async def arm_profiler(request: ProfileRequest, current_user: dict = Depends(get_admin_user)):
+    """
+    Perfilar las `requests` peticiones siguientes (solo las de `route`, plantilla
+    de ruta, si se indica) en modo `wall` o `cpu`
+    """
+    try:
+        return profiler.arm(request.requests, request.route, request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/admin/profile")
+async def get_profiler_status(current_user: dict = Depends(get_admin_user)):
+    """Estado del perfilador y últimos perfiles guardados"""
+    return profiler.status()
+
+@api_router.delete("/admin/profile")
+async def disarm_profiler(current_user: dict = Depends(get_admin_user)):
+    """Cancelar el perfilado pendiente"""
+    return profiler.disarm()
+
+@api_router.get("/admin/profile/{name}")
+async def download_profile(name: str, current_user: dict = Depends(get_admin_user)):
+    """Perfil en formato de pilas colapsadas (flamegraph.pl, speedscope)"""
+    path = profiler.profile_path(name)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path=str(path), media_type="text/plain", filename=name)
 
 app.include_router(api_router)
 
+# Compresión brotli/gzip de las respuestas de texto grandes
+app.add_middleware(CompressionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -754,12 +1258,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Métricas por petición (el último middleware añadido es el más externo)
+app.add_middleware(MetricsMiddleware)
+
+# Trazas de las peticiones muestreadas (TRACE_SAMPLE_RATE)
+app.add_middleware(TracingMiddleware)
+
+# Perfilado bajo demanda (/api/admin/profile)
+app.add_middleware(ProfilingMiddleware)
+
+# Pico de memoria de una muestra de las peticiones (MEMORY_SAMPLE_RATE)
+app.add_middleware(MemoryMiddleware)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    # Lecturas de sensores (colección time-series)
+    await ensure_sensor_readings_collection(db)
+    # Resumen por número de serie (necesario como clave única para $merge)
+    await db.equipment_summary.create_index("serial_number", unique=True)
+    await db.equipment_summary.create_index([("client_name", 1), ("last_calibration_date", -1)])
+    await db.equipment_summary.create_index([("status", 1), ("last_calibration_date", -1)])
+    # Próximos mantenimientos: listado paginado y recuento por cliente (cubierto por el índice)
+    await db.equipment_summary.create_index([("next_due_date", 1), ("serial_number", 1)])
+    await db.equipment_summary.create_index([("next_due_date", 1), ("client_name", 1)])
+    await db.equipment_summary.create_index([("client_name", 1), ("next_due_date", 1), ("serial_number", 1)])
+    # Equipos en taller (solo visitas activas): duplicados por número de serie y colas por estado
+    await db.equipment.create_index([("serial_number", 1), ("status", 1)])
+    await db.equipment.create_index([("status", 1), ("entry_dt", -1)])
+    # Visitas entregadas
+    await ensure_archive_indexes(db)
+    # Historial: rangos y orden por fecha de calibración (datetime) y consultas por equipo
+    await db.calibration_history.create_index([("calibration_dt", -1)])
+    await db.calibration_history.create_index([("serial_number", 1), ("calibration_dt", -1)])
+    await db.calibration_history.create_index([("client_name", 1), ("calibration_dt", -1)])
+    # Informe de repuestos: rango de fechas + referencia, y buckets mensuales
+    await db.calibration_history.create_index([("calibration_dt", 1), ("spare_parts.referencia", 1)])
+    await ensure_spare_parts_indexes(db)
+    # Retirada de botellas: índice multikey sobre el array calibration_data
+    await db.calibration_history.create_index([("calibration_data.calibration_bottle", 1), ("calibration_dt", -1)])
+    # Archivo del historial antiguo (comprimido)
+    await ensure_history_archive(db)
+    # Catálogo maestro: comprobación de duplicados por lotes ($in) en importaciones
+    await db.equipment_master.create_index("serial_number")
+    # Contador de certificados: un documento por año (upsert atómico al reservar números)
+    await db.certificate_counters.create_index("year", unique=True)
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    slow_query_monitor.close()
\ No newline at end of file
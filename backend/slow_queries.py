@@ -0,0 +1,239 @@
+"""
+Registro de consultas lentas de MongoDB y captura automática de `explain`.
+
+SlowQueryMonitor es un CommandListener de pymongo registrado en el cliente de
+Motor:
+
+  - todo comando que tarda más de SLOW_QUERY_MS se escribe en el log con la
+    ruta HTTP que lo lanzó (metrics.current_route) y se acumula por forma de
+    consulta (comando, colección y estructura del filtro sin valores);
+  - con QUERY_DIAGNOSTICS=1 se ejecuta `explain` (executionStats) la primera
+    vez que aparece cada forma, en un hilo aparte y con un cliente síncrono
+    sin listeners, y se marcan los COLLSCAN y los ratios
+    docsExamined/nReturned de al menos SLOW_QUERY_SCAN_RATIO;
+  - las SLOW_QUERY_TOP formas más lentas (por tiempo total) se consultan en
+    `/api/admin/slow-queries`.
+
+Solo se guarda la forma de la consulta, nunca los valores de los filtros.
+"""
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient, monitoring
+
+from metrics import current_route
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+QUERY_DIAGNOSTICS = os.environ.get("QUERY_DIAGNOSTICS", "0") == "1"
+SLOW_QUERY_SCAN_RATIO = float(os.environ.get("SLOW_QUERY_SCAN_RATIO", "100"))
+SLOW_QUERY_TOP = int(os.environ.get("SLOW_QUERY_TOP", "20"))
+MAX_SHAPES = 500
+
+# Comandos que admiten explain con executionStats sin modificar datos
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Partes de cada comando que definen su forma
+SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+}
+# Campos de sesión y de protocolo que no se reenvían en el explain
+_SESSION_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "signature"}
+
+logger = logging.getLogger(__name__)
+
+
+def _shape(value):
+    """Estructura de un filtro o pipeline con los valores sustituidos por '?'"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+        return [_shape(item) for item in value]
+    return "?"
+
+
+def query_shape(command_name, command):
+    """Forma de un comando: nombre, colección y estructura de sus filtros"""
+    collection = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    if command_name in ("update", "delete"):
+        statements = command.get(f"{command_name}s") or [{}]
+        parts = {"q": _shape(statements[0].get("q", {}))}
+    else:
+        parts = {
+            field: command[field] if field in ("sort", "projection") else _shape(command[field])
+            for field in SHAPE_FIELDS.get(command_name, ()) if field in command
+        }
+    return f"{command_name} {collection} {json.dumps(parts, separators=(',', ':'))}" if parts else f"{command_name} {collection}"
+
+
+def explain_flags(explain):
+    """COLLSCAN y documentos examinados frente a devueltos de un resultado de explain"""
+    collscan = False
+    docs_examined = 0
+    n_returned = 0
+    stack = [explain]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        if node.get("stage") == "COLLSCAN":
+            collscan = True
+        stats = node.get("executionStats")
+        if isinstance(stats, dict) and "totalDocsExamined" in stats:
+            docs_examined += stats.get("totalDocsExamined", 0)
+            n_returned += stats.get("nReturned", 0)
+        stack.extend(value for key, value in node.items() if key not in ("rejectedPlans", "allPlansExecution"))
+    ratio = docs_examined / max(n_returned, 1)
+    return {
+        "collscan": collscan,
+        "docs_examined": docs_examined,
+        "n_returned": n_returned,
+        "scan_ratio": round(ratio, 1),
+        "high_scan_ratio": ratio >= SLOW_QUERY_SCAN_RATIO,
+    }
+
+
+def _explain_command(command_name, command):
+    if command_name == "aggregate" and any(
+        "$out" in stage or "$merge" in stage for stage in command.get("pipeline", [])
+    ):
+        return None
+    return {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in _SESSION_FIELDS
+    }
+
+
+class SlowQueryMonitor(monitoring.CommandListener):
+    """Registro de comandos lentos por forma de consulta"""
+
+    def __init__(self, mongo_url=None, threshold_ms=SLOW_QUERY_MS, diagnostics=QUERY_DIAGNOSTICS):
+        self.mongo_url = mongo_url
+        self.threshold_ms = threshold_ms
+        self.diagnostics = diagnostics and mongo_url is not None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._shapes = {}
+        self._explained = {}
+        self._explain_client = None
+        self._executor = None
+
+    # --- CommandListener ---------------------------------------------------
+
+    def started(self, event):
+        key = (event.connection_id, event.request_id)
+        self._pending[key] = (event.command, event.database_name)
+        if self.diagnostics and event.command_name in EXPLAINABLE:
+            shape = query_shape(event.command_name, event.command)
+            with self._lock:
+                first = shape not in self._explained
+                if first:
+                    self._explained[shape] = None
+            if first:
+                self._schedule_explain(shape, event.database_name, event.command_name, event.command, current_route())
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        elapsed_ms = event.duration_micros / 1000
+        if pending is None or elapsed_ms < self.threshold_ms:
+            return
+        command, database = pending
+        shape = query_shape(event.command_name, command)
+        route = current_route()
+        logger.warning("Slow query %.0f ms [%s] %s", elapsed_ms, route or "-", shape)
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                if len(self._shapes) >= MAX_SHAPES:
+                    del self._shapes[min(self._shapes, key=lambda s: self._shapes[s]["total_ms"])]
+                entry = self._shapes[shape] = {
+                    "shape": shape,
+                    "command": event.command_name,
+                    "database": database,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": set(),
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            if route:
+                entry["routes"].add(route)
+
+    # --- explain -----------------------------------------------------------
+
+    def _schedule_explain(self, shape, database, command_name, command, route):
+        explain = _explain_command(command_name, command)
+        if explain is None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+        self._executor.submit(self._run_explain, shape, database, explain, route)
+
+    def _run_explain(self, shape, database, command, route):
+        try:
+            if self._explain_client is None:
+                self._explain_client = MongoClient(self.mongo_url)
+            result = self._explain_client[database].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+        except Exception as e:
+            logger.info("Explain failed for %s: %s", shape, e)
+            return
+        flags = explain_flags(result)
+        with self._lock:
+            self._explained[shape] = {**flags, "route": route}
+        if flags["collscan"] or flags["high_scan_ratio"]:
+            logger.warning(
+                "Query plan [%s] %s: collscan=%s docsExamined=%d nReturned=%d",
+                route or "-", shape, flags["collscan"], flags["docs_examined"], flags["n_returned"]
+            )
+
+    # --- informe -----------------------------------------------------------
+
+    def top(self, limit=SLOW_QUERY_TOP):
+        """Formas de consulta lentas ordenadas por tiempo total"""
+        with self._lock:
+            entries = sorted(self._shapes.values(), key=lambda e: e["total_ms"], reverse=True)[:limit]
+            return [{
+                **entry,
+                "total_ms": round(entry["total_ms"], 1),
+                "max_ms": round(entry["max_ms"], 1),
+                "avg_ms": round(entry["total_ms"] / entry["count"], 1),
+                "routes": sorted(entry["routes"]),
+                "explain": self._explained.get(entry["shape"]),
+            } for entry in entries]
+
+    def flagged_plans(self):
+        """Formas explicadas con COLLSCAN o ratio de examinados alto"""
+        with self._lock:
+            return [
+                {"shape": shape, **flags} for shape, flags in self._explained.items()
+                if flags and (flags["collscan"] or flags["high_scan_ratio"])
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._explained.clear()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._explain_client is not None:
+            self._explain_client.close()
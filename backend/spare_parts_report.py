@@ -0,0 +1,196 @@
+"""
+Informe de consumo de repuestos y garantías.
+
+El consumo se agrega por meses con `$unwind` sobre los spare_parts de
+calibration_history y se guarda en spare_parts_monthly (un documento por mes,
+referencia, modelo y cliente). Los meses cerrados se calculan una sola vez;
+el mes en curso se recalcula en cada consulta. Ninguna consulta recorre el
+historial completo: cada mes se obtiene con un rango sobre calibration_dt.
+
+Los buckets se escriben con upserts sobre un índice único, así que dos
+cálculos simultáneos del mismo mes no duplican nada. Una calibración con
+repuestos marca su mes como invalidado (spare_parts_on_calibration), también
+si la fecha es atrasada, y el mes se recalcula en la siguiente consulta.
+"""
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from history_tiering import needs_archive, union_archive
+
+BUCKET_KEY = ["month", "referencia", "model", "client_name"]
+
+MAX_MONTHS = 120
+
+
+def _month_key(year, month):
+    return f"{year:04d}-{month:02d}"
+
+
+def _month_index(key):
+    year, month = int(key[:4]), int(key[5:7])
+    return year * 12 + month - 1
+
+
+def _month_from_index(index):
+    return _month_key(index // 12, index % 12 + 1)
+
+
+def parse_month(value):
+    """Mes (YYYY-MM) a partir de 'YYYY-MM' o 'YYYY-MM-DD'"""
+    try:
+        parsed = datetime.strptime(value[:7], "%Y-%m")
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid month '{value}', expected YYYY-MM")
+    return _month_key(parsed.year, parsed.month)
+
+
+def month_range(date_from=None, date_to=None):
+    """Lista de meses entre date_from y date_to (por defecto, los últimos 12 meses)"""
+    now = datetime.now(timezone.utc)
+    current = _month_key(now.year, now.month)
+    last = parse_month(date_to) if date_to else current
+    first = parse_month(date_from) if date_from else _month_from_index(_month_index(last) - 11)
+    start, end = _month_index(first), _month_index(last)
+    if start > end:
+        raise ValueError("'from' must not be after 'to'")
+    if end - start + 1 > MAX_MONTHS:
+        raise ValueError(f"The range cannot exceed {MAX_MONTHS} months")
+    return [_month_from_index(i) for i in range(start, end + 1)], current
+
+
+async def compute_month(db, month):
+    """Agregar el consumo de un mes y sustituir sus buckets en spare_parts_monthly"""
+    next_month = _month_from_index(_month_index(month) + 1)
+    match = {
+        "calibration_dt": {
+            "$gte": datetime.strptime(month, "%Y-%m"),
+            "$lt": datetime.strptime(next_month, "%Y-%m")
+        },
+        "spare_parts.0": {"$exists": True}
+    }
+    # Antes de leer: una calibración guardada después invalida este cálculo
+    started = datetime.now(timezone.utc)
+    pipeline = [{"$match": match}]
+    if await needs_archive(db, f"{month}-01"):
+        pipeline.append(union_archive(match))
+    buckets = await db.calibration_history.aggregate(pipeline + [
+        {"$unwind": "$spare_parts"},
+        {"$group": {
+            "_id": {
+                "referencia": "$spare_parts.referencia",
+                "model": "$model",
+                "client_name": "$client_name"
+            },
+            "descripcion": {"$first": "$spare_parts.descripcion"},
+            "count": {"$sum": 1},
+            "warranty_count": {"$sum": {"$cond": ["$spare_parts.garantia", 1, 0]}}
+        }}
+    ]).to_list(None)
+
+    # Cada bucket se marca con el inicio de este cálculo y solo se sobrescribe
+    # si lo escribió un cálculo anterior; al final se borran los buckets del mes
+    # con una marca anterior (los que ya no existen en el historial)
+    newer = {"$gt": ["$computed_dt", started]}
+    operations = [UpdateOne(
+        {"month": month, **b["_id"]},
+        [{"$set": {
+            "descripcion": {"$cond": [newer, "$descripcion", {"$literal": b["descripcion"]}]},
+            "count": {"$cond": [newer, "$count", {"$literal": b["count"]}]},
+            "warranty_count": {"$cond": [newer, "$warranty_count", {"$literal": b["warranty_count"]}]},
+            "computed_dt": {"$max": ["$computed_dt", started]}
+        }}],
+        upsert=True
+    ) for b in buckets]
+    if operations:
+        await db.spare_parts_monthly.bulk_write(operations, ordered=False)
+    await db.spare_parts_monthly.delete_many({"month": month, "computed_dt": {"$not": {"$gte": started}}})
+    await db.spare_parts_months.update_one(
+        {"_id": month},
+        {"$max": {"computed_dt": started}, "$set": {"buckets": len(operations)}},
+        upsert=True
+    )
+
+
+async def spare_parts_on_calibration(db, calibration_date, spare_parts):
+    """Invalidar el mes de una calibración con repuestos (aunque sea un mes cerrado)"""
+    if not spare_parts:
+        return
+    try:
+        month = parse_month(calibration_date)
+    except ValueError:
+        return
+    await db.spare_parts_months.update_one(
+        {"_id": month},
+        {"$set": {"invalidated_dt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+
+def _is_fresh(meta):
+    """Mes calculado después de su última invalidación"""
+    computed = meta.get("computed_dt")
+    invalidated = meta.get("invalidated_dt")
+    return computed is not None and (invalidated is None or computed > invalidated)
+
+
+async def ensure_spare_parts_indexes(db):
+    """Índice único de los buckets; si hay duplicados de versiones anteriores se descarta la caché"""
+    try:
+        await db.spare_parts_monthly.create_index([(field, 1) for field in BUCKET_KEY], unique=True)
+    except OperationFailure:
+        await rebuild_spare_parts_cache(db)
+        await db.spare_parts_monthly.create_index([(field, 1) for field in BUCKET_KEY], unique=True)
+    if "month_1_referencia_1" in await db.spare_parts_monthly.index_information():
+        await db.spare_parts_monthly.drop_index("month_1_referencia_1")
+
+
+def _ratio(bucket):
+    bucket["warranty_ratio"] = round(bucket["warranty_count"] / bucket["count"], 4) if bucket["count"] else None
+    return bucket
+
+
+async def spare_parts_report(db, date_from=None, date_to=None):
+    """Consumo mensual por referencia y ratios de garantía por modelo y cliente"""
+    months, current = month_range(date_from, date_to)
+
+    computed = await db.spare_parts_months.find({"_id": {"$in": months}}).to_list(None)
+    cached = {doc["_id"] for doc in computed if _is_fresh(doc)}
+    for month in months:
+        if month >= current or month not in cached:
+            await compute_month(db, month)
+
+    buckets = await db.spare_parts_monthly.find({"month": {"$in": months}}, {"_id": 0}).to_list(None)
+
+    by_reference = {}
+    by_model = {}
+    by_client = {}
+    for b in buckets:
+        reference = by_reference.setdefault((b["month"], b["referencia"]), {
+            "month": b["month"], "referencia": b["referencia"], "descripcion": b["descripcion"],
+            "count": 0, "warranty_count": 0
+        })
+        model = by_model.setdefault(b["model"], {"model": b["model"], "count": 0, "warranty_count": 0})
+        client = by_client.setdefault(b["client_name"], {"client_name": b["client_name"], "count": 0, "warranty_count": 0})
+        for target in (reference, model, client):
+            target["count"] += b["count"]
+            target["warranty_count"] += b["warranty_count"]
+
+    return {
+        "from": months[0],
+        "to": months[-1],
+        "monthly_consumption": sorted(
+            (_ratio(r) for r in by_reference.values()),
+            key=lambda r: (r["month"], -r["count"])
+        ),
+        "warranty_by_model": sorted((_ratio(m) for m in by_model.values()), key=lambda m: -m["count"]),
+        "warranty_by_client": sorted((_ratio(c) for c in by_client.values()), key=lambda c: -c["count"])
+    }
+
+
+async def rebuild_spare_parts_cache(db):
+    """Descartar los buckets guardados; se recalculan en la siguiente consulta"""
+    await db.spare_parts_monthly.delete_many({})
+    result = await db.spare_parts_months.delete_many({})
+    return result.deleted_count
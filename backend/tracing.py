@@ -0,0 +1,299 @@
+"""
+Trazas de peticiones (spans) para ver dónde se va la latencia en producción.
+
+  - TracingMiddleware (ASGI) abre el span raíz de cada petición muestreada,
+    con el nombre de la ruta. Se muestrea una fracción TRACE_SAMPLE_RATE de
+    las peticiones (0 = desactivado). Una cabecera W3C `traceparent`
+    entrante aporta el trace id y el span padre, pero su marca de muestreo
+    solo decide si TRACE_TRUST_PARENT=1 (p. ej. detrás de un proxy propio que
+    ya muestrea); si no, cualquier cliente podría forzar trazas.
+  - span(nombre) abre un span hijo del span activo; fuera de una traza
+    muestreada no hace nada. Se usa en get_current_user y en las fases de
+    generate_certificate_pdf.
+  - MongoTracing (pymongo CommandListener) crea un span por comando de
+    MongoDB. Motor ejecuta pymongo en hilos copiando el contexto, así que
+    el span activo de la petición se ve desde el listener.
+
+Al cerrar el span raíz la traza completa se exporta en un hilo aparte, en
+formato OTLP/JSON: una línea por traza en TRACE_FILE (TRACE_EXPORTER=file,
+por defecto; al pasar de TRACE_FILE_MAX_MB se rota a TRACE_FILE.1, así que
+ocupa como mucho el doble) o un POST a TRACE_OTLP_ENDPOINT (TRACE_EXPORTER=otlp, p. ej.
+http://collector:4318/v1/traces).
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from metrics import route_template
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "file")
+TRACE_TRUST_PARENT = os.environ.get("TRACE_TRUST_PARENT", "0") == "1"
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_FILE_MAX_MB = float(os.environ.get("TRACE_FILE_MAX_MB", "100"))
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "detectores-backend")
+MAX_SPANS_PER_TRACE = 1000
+EXPORT_QUEUE_SIZE = 1000
+
+# Tipos de span de OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+logger = logging.getLogger(__name__)
+
+
+class Trace:
+    """Spans terminados de una petición muestreada"""
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace, name, parent_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        if len(self.trace.spans) < MAX_SPANS_PER_TRACE:
+            self.trace.spans.append(self)
+
+
+current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Span hijo del span activo (no hace nada si la petición no se está trazando)"""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = repr(e)
+        raise
+    finally:
+        current_span.reset(token)
+        child.end()
+
+
+# --- exportación -------------------------------------------------------------
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def otlp_payload(traces):
+    """Documento OTLP/JSON (ExportTraceServiceRequest) con los spans de varias trazas"""
+    spans = []
+    for trace in traces:
+        for s in trace.spans:
+            encoded = {
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "name": s.name,
+                "kind": s.kind,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [_attribute(k, v) for k, v in s.attributes.items() if v is not None],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 0},
+            }
+            if s.parent_id:
+                encoded["parentSpanId"] = s.parent_id
+            spans.append(encoded)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+        "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+    }]}
+
+
+class _Exporter:
+    """Hilo que exporta las trazas terminadas sin bloquear las peticiones"""
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, trace):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            pass  # Mejor perder trazas que retener memoria o bloquear
+
+    def _run(self):
+        while True:
+            traces = [self._queue.get()]
+            while len(traces) < 100:
+                try:
+                    traces.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._export(traces)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+
+    def _export(self, traces):
+        if TRACE_EXPORTER == "otlp":
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT,
+                data=json.dumps(otlp_payload(traces)).encode(),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+        else:
+            _rotate_trace_file()
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                for trace in traces:
+                    f.write(json.dumps(otlp_payload([trace]), separators=(",", ":")) + "\n")
+
+
+def _rotate_trace_file():
+    """Rotar TRACE_FILE a TRACE_FILE.1 (sustituyendo la anterior) al pasar de TRACE_FILE_MAX_MB"""
+    try:
+        if os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_MB * 1048576:
+            os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+    except FileNotFoundError:
+        pass
+
+
+exporter = _Exporter()
+
+
+# --- fuentes de spans --------------------------------------------------------
+
+def _parse_traceparent(value):
+    """(trace_id, parent_id, sampled) de una cabecera W3C traceparent"""
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class TracingMiddleware:
+    """Middleware ASGI que abre el span raíz de las peticiones muestreadas"""
+
+    def __init__(self, app, sample_rate=TRACE_SAMPLE_RATE, trust_parent=TRACE_TRUST_PARENT):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.trust_parent = trust_parent
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        traceparent = dict(scope.get("headers") or []).get(b"traceparent")
+        if traceparent:
+            parent = _parse_traceparent(traceparent.decode("latin-1"))
+        if parent is not None and self.trust_parent:
+            sampled = parent[2]
+        else:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(parent[0] if parent else os.urandom(16).hex())
+        root = Span(trace, scope["method"], parent[1] if parent else None, kind=SPAN_KIND_SERVER, attributes={
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            current_span.reset(token)
+            route = route_template(scope)
+            root.name = f"{scope['method']} {route}"
+            root.attributes["http.route"] = route
+            root.attributes["http.status_code"] = status
+            if status >= 500:
+                root.error = f"HTTP {status}"
+            root.end()
+            exporter.submit(trace)
+
+
+class MongoTracing(monitoring.CommandListener):
+    """Un span por comando de MongoDB, hijo del span activo de la petición"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        parent = current_span.get()
+        if parent is None:
+            return
+        self._pending[(event.connection_id, event.request_id)] = Span(
+            parent.trace, f"mongo.{event.command_name}", parent.span_id, kind=SPAN_KIND_CLIENT, attributes={
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": event.command.get(event.command_name) if event.command_name != "getMore"
+                else event.command.get("collection"),
+            }
+        )
+
+    def succeeded(self, event):
+        s = self._pending.pop((event.connection_id, event.request_id), None)
+        if s is not None:
+            s.end()
+
+    def failed(self, event):
+        s = self._pending.pop((event.connection_id, event.request_id), None)
+        if s is not None:
+            s.error = str(event.failure.get("errmsg", "")) if isinstance(event.failure, dict) else str(event.failure)
+            s.end()
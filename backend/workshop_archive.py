@@ -0,0 +1,82 @@
+"""
+Separación entre equipos en taller y visitas entregadas.
+
+La colección equipment solo contiene las visitas activas (pending y
+calibrated), así que las pantallas de cola consultan un conjunto pequeño que
+no crece con los años. Al entregar un equipo, su visita se mueve a
+equipment_delivered. Las lecturas que necesitan todas las visitas (certificado
+de un equipo ya entregado, listado de entregados, estadísticas y resumen)
+consultan ambas colecciones. `python manage.py archive-delivered` mueve las
+visitas entregadas que ya existían.
+"""
+from pymongo import ReplaceOne
+
+ARCHIVE_COLLECTION = "equipment_delivered"
+ACTIVE_STATUSES = ["pending", "calibrated"]
+ARCHIVE_BATCH_SIZE = 1000
+
+# Etapa de agregación que añade las visitas entregadas a una consulta sobre equipment
+UNION_ARCHIVE = {"$unionWith": ARCHIVE_COLLECTION}
+
+
+async def ensure_archive_indexes(db):
+    await db[ARCHIVE_COLLECTION].create_index("id", unique=True)
+    await db[ARCHIVE_COLLECTION].create_index([("serial_number", 1), ("delivery_dt", -1)])
+    await db[ARCHIVE_COLLECTION].create_index([("delivery_dt", -1)])
+
+
+async def archive_delivered(db, equipment_ids):
+    """
+    Mover a equipment_delivered las visitas entregadas indicadas. Primero se
+    copian (reemplazo idempotente por id) y después se borran de equipment, de
+    modo que una interrupción nunca deja una visita fuera de ambas colecciones.
+    """
+    if not equipment_ids:
+        return 0
+    delivered = await db.equipment.find(
+        {"id": {"$in": list(equipment_ids)}, "status": "delivered"}
+    ).to_list(None)
+    return await archive_visits(db, delivered)
+
+
+async def archive_visits(db, delivered):
+    """
+    Mover a equipment_delivered visitas ya marcadas como entregadas en
+    equipment, a partir de los documentos completos (con `_id`) que ya tiene
+    quien llama, sin volver a leerlos
+    """
+    if not delivered:
+        return 0
+    await db[ARCHIVE_COLLECTION].bulk_write([
+        ReplaceOne({"id": doc["id"]}, {k: v for k, v in doc.items() if k != "_id"}, upsert=True)
+        for doc in delivered
+    ], ordered=False)
+    result = await db.equipment.delete_many({"_id": {"$in": [doc["_id"] for doc in delivered]}})
+    return result.deleted_count
+
+
+async def find_equipment_visit(db, serial_number, projection, statuses=ACTIVE_STATUSES):
+    """Visita activa de un equipo (con uno de `statuses`) o, si no la hay, su última entrega"""
+    equipment = await db.equipment.find_one(
+        {"serial_number": serial_number, "status": {"$in": statuses}}, projection
+    )
+    if equipment:
+        return equipment
+    archived = await db[ARCHIVE_COLLECTION].find(
+        {"serial_number": serial_number}, projection
+    ).sort("delivery_dt", -1).limit(1).to_list(1)
+    return archived[0] if archived else None
+
+
+async def migrate_delivered_equipment(db, batch_size=ARCHIVE_BATCH_SIZE):
+    """Mover todas las visitas entregadas que aún estén en equipment"""
+    await ensure_archive_indexes(db)
+    moved = 0
+    while True:
+        batch = await db.equipment.find({"status": "delivered"}, {"_id": 0, "id": 1}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return moved
+        count = await archive_delivered(db, [doc["id"] for doc in batch if doc.get("id")])
+        if not count:
+            return moved
+        moved += count
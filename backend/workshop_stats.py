@@ -0,0 +1,291 @@
+"""
+Estadísticas del taller para el panel de control (colección workshop_stats).
+
+La colección es un rollup pequeño con tres tipos de documento:
+  - status:           número de equipos por estado
+  - technician_week:  calibraciones por técnico y semana ISO
+  - month:            entregas por mes y tiempo total en taller (días)
+
+Se calcula completa con una agregación `$facet` sobre equipment y
+equipment_delivered (estados y entregas) y otra sobre el historial de
+calibraciones (una por calibración, igual que stats_on_calibration), y después
+se mantiene de forma incremental desde las rutas de entrada, calibración y
+entrega. `python manage.py rebuild-stats` la regenera.
+
+Cada `$inc` incremental suma también en `delta.<campo>` del mismo documento.
+La reconstrucción borra los `delta` antes de agregar y después escribe en los
+documentos vivos, con una actualización por documento, el valor recalculado
+más lo que haya acumulado su `delta` mientras tanto: los incrementos que
+llegan durante la reconstrucción se conservan. No es una instantánea: un
+cambio registrado mientras corre la agregación y que esta ya ve se cuenta dos
+veces hasta la siguiente reconstrucción. La reconstrucción perezosa de la
+primera lectura la hace un solo proceso: el que crea el documento meta como
+bloqueo.
+"""
+from datetime import datetime, timezone, timedelta
+
+from pymongo import UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from history_tiering import HISTORY_ARCHIVE
+from workshop_archive import UNION_ARCHIVE
+
+META_ID = "meta"
+# Contadores de cada tipo de documento (los que reciben `$inc`)
+COUNTERS = {
+    "status": ["count"],
+    "technician_week": ["count"],
+    "month": ["delivered", "turnaround_days_total", "turnaround_count"],
+}
+REBUILD_LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def parse_date(value):
+    """Día de una fecha guardada como texto (YYYY-MM-DD o timestamp ISO)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value[:10])
+    except ValueError:
+        return None
+
+
+def _iso_week(date):
+    year, week, _ = date.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _increments(amounts):
+    """`$inc` de los contadores y de su `delta` (lo sumado desde el inicio de la última reconstrucción)"""
+    return {**amounts, **{f"delta.{field}": amount for field, amount in amounts.items()}}
+
+
+def _status_operation(status, amount):
+    return UpdateOne(
+        {"_id": f"status:{status}"},
+        {"$set": {"kind": "status", "status": status}, "$inc": _increments({"count": amount})},
+        upsert=True
+    )
+
+
+async def stats_on_entry(db, count=1):
+    """Equipos nuevos en estado pendiente"""
+    await db.workshop_stats.bulk_write([_status_operation("pending", count)])
+
+
+async def stats_on_calibration(db, previous_status, technician, calibration_date):
+    """Un equipo pasa a calibrado; se anota la calibración en la semana del técnico"""
+    operations = []
+    if previous_status == "pending":
+        operations += [_status_operation("pending", -1), _status_operation("calibrated", 1)]
+    date = parse_date(calibration_date)
+    if date and technician:
+        week = _iso_week(date)
+        operations.append(UpdateOne(
+            {"_id": f"technician_week:{technician}:{week}"},
+            {"$set": {"kind": "technician_week", "technician": technician, "week": week},
+             "$inc": _increments({"count": 1})},
+            upsert=True
+        ))
+    if operations:
+        await db.workshop_stats.bulk_write(operations, ordered=False)
+
+
+async def stats_on_deliveries(db, entry_dates, delivery_date):
+    """Varios equipos entregados el mismo día (uno por fecha de entrada) en una sola escritura"""
+    count = len(entry_dates)
+    if not count:
+        return
+    operations = [_status_operation("calibrated", -count), _status_operation("delivered", count)]
+    delivered = parse_date(delivery_date)
+    if delivered:
+        month = delivered.strftime("%Y-%m")
+        increments = {"delivered": count}
+        turnarounds = [
+            (delivered - entered).total_seconds() / 86400
+            for entered in map(parse_date, entry_dates) if entered
+        ]
+        if turnarounds:
+            increments["turnaround_days_total"] = sum(turnarounds)
+            increments["turnaround_count"] = len(turnarounds)
+        operations.append(UpdateOne(
+            {"_id": f"month:{month}"},
+            {"$set": {"kind": "month", "month": month}, "$inc": _increments(increments)},
+            upsert=True
+        ))
+    await db.workshop_stats.bulk_write(operations, ordered=False)
+
+
+def _to_date(field):
+    return {"$dateFromString": {"dateString": field, "onError": None, "onNull": None}}
+
+
+# Calibraciones por técnico y semana: una por entrada del historial (incluido el
+# archivo), que es lo mismo que suma stats_on_calibration en cada calibración
+TECHNICIAN_WEEK_PIPELINE = [
+    {"$unionWith": HISTORY_ARCHIVE},
+    {"$match": {"technician": {"$nin": [None, ""]}, "calibration_date": {"$nin": [None, ""]}}},
+    {"$project": {"technician": 1, "calibrated": _to_date({"$substrBytes": ["$calibration_date", 0, 10]})}},
+    {"$match": {"calibrated": {"$ne": None}}},
+    {"$group": {
+        "_id": {
+            "technician": "$technician",
+            "week": {"$dateToString": {"format": "%G-W%V", "date": "$calibrated"}}
+        },
+        "count": {"$sum": 1}
+    }}
+]
+
+
+STATS_PIPELINE = [
+    UNION_ARCHIVE,
+    {"$facet": {
+        "status": [
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ],
+        "month": [
+            {"$match": {"status": "delivered"}},
+            {"$project": {
+                "entered": _to_date({"$substrBytes": ["$entry_date", 0, 10]}),
+                "delivered": _to_date({"$substrBytes": ["$delivery_date", 0, 10]})
+            }},
+            {"$match": {"delivered": {"$ne": None}}},
+            {"$group": {
+                "_id": {"$dateToString": {"format": "%Y-%m", "date": "$delivered"}},
+                "delivered": {"$sum": 1},
+                "turnaround_days_total": {"$sum": {"$cond": [
+                    {"$ne": ["$entered", None]},
+                    {"$divide": [{"$subtract": ["$delivered", "$entered"]}, 86400000]},
+                    0
+                ]}},
+                "turnaround_count": {"$sum": {"$cond": [{"$ne": ["$entered", None]}, 1, 0]}}
+            }}
+        ]
+    }}
+]
+
+
+def _rebuild_operation(document):
+    """Escribir un documento recalculado sumándole lo incrementado durante la reconstrucción"""
+    fields = {key: {"$literal": value} for key, value in document.items() if key != "_id"}
+    for field in COUNTERS[document["kind"]]:
+        fields[field] = {"$add": [document[field], {"$ifNull": [f"$delta.{field}", 0]}]}
+    return UpdateOne({"_id": document["_id"]}, [{"$set": fields}, {"$project": {"delta": 0}}], upsert=True)
+
+
+async def rebuild_workshop_stats(db):
+    """Recalcular el rollup completo desde equipment, las visitas entregadas y el historial"""
+    # Desde aquí, lo que sumen los `$inc` queda también en `delta`
+    await db.workshop_stats.update_many({"delta": {"$exists": True}}, {"$unset": {"delta": ""}})
+
+    result = await db.equipment.aggregate(STATS_PIPELINE).to_list(1)
+    facets = result[0] if result else {"status": [], "month": []}
+    facets["technician_week"] = await db.calibration_history.aggregate(TECHNICIAN_WEEK_PIPELINE).to_list(None)
+
+    documents = []
+    for row in facets["status"]:
+        documents.append({"_id": f"status:{row['_id']}", "kind": "status", "status": row["_id"], "count": row["count"]})
+    for row in facets["technician_week"]:
+        technician, week = row["_id"]["technician"], row["_id"]["week"]
+        documents.append({
+            "_id": f"technician_week:{technician}:{week}",
+            "kind": "technician_week",
+            "technician": technician,
+            "week": week,
+            "count": row["count"]
+        })
+    for row in facets["month"]:
+        documents.append({
+            "_id": f"month:{row['_id']}",
+            "kind": "month",
+            "month": row["_id"],
+            "delivered": row["delivered"],
+            "turnaround_days_total": row["turnaround_days_total"],
+            "turnaround_count": row["turnaround_count"]
+        })
+
+    operations = [_rebuild_operation(document) for document in documents]
+    # Los que ya no salen en la agregación se quedan solo con lo incrementado durante la reconstrucción
+    rebuilt_ids = [document["_id"] for document in documents]
+    for kind, fields in COUNTERS.items():
+        operations.append(UpdateMany(
+            {"kind": kind, "_id": {"$nin": rebuilt_ids}},
+            [{"$set": {field: {"$ifNull": [f"$delta.{field}", 0]} for field in fields}}, {"$project": {"delta": 0}}]
+        ))
+    operations.append(UpdateOne(
+        {"_id": META_ID},
+        [{"$set": {"kind": "meta", "rebuilt_at": datetime.now(timezone.utc).isoformat()}}, {"$project": {"locked_dt": 0}}],
+        upsert=True
+    ))
+    await db.workshop_stats.bulk_write(operations, ordered=False)
+    return len(documents)
+
+
+async def _claim_rebuild(db):
+    """Crear el documento meta como bloqueo de la reconstrucción perezosa (False si otro la está haciendo)"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.workshop_stats.update_one(
+            {
+                "_id": META_ID,
+                "rebuilt_at": {"$exists": False},
+                "$or": [{"locked_dt": {"$exists": False}}, {"locked_dt": {"$lt": now - REBUILD_LOCK_TIMEOUT}}]
+            },
+            {"$set": {"kind": "meta", "locked_dt": now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False  # Ya reconstruida, o bloqueada por otro proceso hace menos de REBUILD_LOCK_TIMEOUT
+    return True
+
+
+async def get_workshop_stats(db, weeks=12, months=12):
+    """Leer el rollup (recalculándolo si no existe) y darle forma para el panel"""
+    meta = await db.workshop_stats.find_one({"_id": META_ID})
+    if (not meta or not meta.get("rebuilt_at")) and await _claim_rebuild(db):
+        await rebuild_workshop_stats(db)
+
+    now = datetime.now(timezone.utc)
+    week_cutoff = _iso_week(now - timedelta(weeks=weeks))
+    month_index = now.year * 12 + now.month - 1 - months
+    month_cutoff = f"{month_index // 12}-{month_index % 12 + 1:02d}"
+
+    documents = await db.workshop_stats.find({"$or": [
+        {"kind": {"$in": ["status", "meta"]}},
+        {"kind": "technician_week", "week": {"$gt": week_cutoff}},
+        {"kind": "month", "month": {"$gt": month_cutoff}}
+    ]}).to_list(None)
+
+    stats = {
+        "status": {"pending": 0, "calibrated": 0, "delivered": 0},
+        "technician_weeks": [],
+        "monthly": [],
+        "avg_turnaround_days": None,
+        "rebuilt_at": None
+    }
+    turnaround_total = 0
+    turnaround_count = 0
+    for doc in documents:
+        kind = doc["kind"]
+        if kind == "meta":
+            stats["rebuilt_at"] = doc.get("rebuilt_at")
+        elif kind == "status":
+            stats["status"][doc["status"]] = doc.get("count", 0)
+        elif kind == "technician_week":
+            stats["technician_weeks"].append({"technician": doc["technician"], "week": doc["week"], "count": doc["count"]})
+        elif kind == "month":
+            count = doc.get("turnaround_count", 0)
+            total = doc.get("turnaround_days_total", 0)
+            turnaround_total += total
+            turnaround_count += count
+            stats["monthly"].append({
+                "month": doc["month"],
+                "delivered": doc.get("delivered", 0),
+                "avg_turnaround_days": round(total / count, 1) if count else None
+            })
+
+    stats["technician_weeks"].sort(key=lambda r: (r["week"], r["technician"]), reverse=True)
+    stats["monthly"].sort(key=lambda r: r["month"], reverse=True)
+    if turnaround_count:
+        stats["avg_turnaround_days"] = round(turnaround_total / turnaround_count, 1)
+    return stats
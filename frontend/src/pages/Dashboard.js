@@ -1,8 +1,40 @@
+import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
+import axios from "axios";
 import { Wrench, FileInput, ClipboardCheck, PackageOpen, BarChart3 } from "lucide-react";
 import Layout from "../components/Layout";
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+const getAuthHeaders = () => ({
+  headers: { Authorization: `Bearer ${localStorage.getItem('token')}` }
+});
+
 export default function Dashboard() {
+  const [stats, setStats] = useState(null);
+
+  useEffect(() => {
+    loadStats();
+  }, []);
+
+  const loadStats = async () => {
+    try {
+      const response = await axios.get(`${API}/stats`, getAuthHeaders());
+      setStats(response.data);
+    } catch (error) {
+      // Las estadísticas son informativas; el panel funciona sin ellas
+      setStats(null);
+    }
+  };
+
+  const statCards = stats ? [
+    { label: "Pendientes de revisión", value: stats.status.pending },
+    { label: "Calibrados sin entregar", value: stats.status.calibrated },
+    { label: "Entregados", value: stats.status.delivered },
+    { label: "Días medios en taller", value: stats.avg_turnaround_days ?? "-" }
+  ] : [];
+
   const modules = [
     {
       id: 1,
@@ -55,6 +87,19 @@ export default function Dashboard() {
           <p className="text-lg text-gray-600">Selecciona un módulo para comenzar</p>
         </div>
 
+        {stats && (
+          <div className="grid grid-cols-2 md:grid-cols-4 gap-4 mb-8" data-testid="dashboard-stats">
+            {statCards.map((card) => (
+              <div key={card.label} className="bg-white rounded-xl shadow p-4 border border-gray-100 text-center">
+                <p className="text-3xl font-bold text-gray-800" style={{ fontFamily: 'Space Grotesk' }}>
+                  {card.value}
+                </p>
+                <p className="text-sm text-gray-600">{card.label}</p>
+              </div>
+            ))}
+          </div>
+        )}
+
         <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
           {modules.map((module) => {
             const Icon = module.icon;
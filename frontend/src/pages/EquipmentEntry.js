@@ -154,23 +154,30 @@ export default function EquipmentEntry() {
 
     setLoading(true);
     try {
+      // Una sola petición: catálogo maestro, visita en taller y departamentos del cliente
       const response = await axios.get(
-        `${API}/equipment-master/${searchSerial}`,
+        `${API}/intake/${searchSerial}`,
         getAuthHeaders()
       );
+      const master = response.data.master;
       
-      if (response.data) {
+      if (response.data.in_workshop) {
+        toast.warning(`El equipo ya está en el taller (estado: ${response.data.in_workshop.status})`);
+      }
+      
+      if (master) {
         // Equipo encontrado en catálogo maestro
-        setEquipmentFromCatalog(response.data);
+        setEquipmentFromCatalog(master);
         setEquipmentNotFound(false);
+        setSelectedClientDepartamentos(response.data.client_departamentos || []);
         setFormData({
           ...formData,
-          serial_number: response.data.serial_number,
-          brand: response.data.brand,
-          model: response.data.model,
-          client_name: response.data.current_client_name,
-          client_cif: response.data.current_client_cif,
-          client_departamento: response.data.current_client_departamento || "",
+          serial_number: master.serial_number,
+          brand: master.brand,
+          model: master.model,
+          client_name: master.current_client_name,
+          client_cif: master.current_client_cif,
+          client_departamento: master.current_client_departamento || "",
           entry_date: new Date().toISOString().split('T')[0]
         });
         toast.success('Equipo encontrado en catálogo');
@@ -230,30 +237,11 @@ export default function EquipmentEntry() {
 
     setLoading(true);
     try {
-      // Si el equipo NO está en el catálogo maestro, primero lo registramos allí
+      // Registrar entrada al taller (el servidor crea o actualiza el equipo en el catálogo maestro)
+      await axios.post(`${API}/equipment`, formData, getAuthHeaders());
       if (equipmentNotFound || showFullForm) {
-        try {
-          await axios.post(`${API}/equipment-master`, {
-            serial_number: formData.serial_number,
-            brand: formData.brand,
-            model: formData.model,
-            current_client_name: formData.client_name,
-            current_client_cif: formData.client_cif,
-            current_client_departamento: formData.client_departamento,
-            default_sensors: [],
-            general_observations: ""
-          }, getAuthHeaders());
-          toast.success('Equipo registrado en catálogo maestro');
-        } catch (error) {
-          // Si ya existe, continuamos (puede haber sido creado entre la búsqueda y el submit)
-          if (!error.response?.data?.detail?.includes('already exists')) {
-            throw error;
-          }
-        }
+        toast.success('Equipo registrado en catálogo maestro');
       }
-
-      // Registrar entrada al taller
-      await axios.post(`${API}/equipment`, formData, getAuthHeaders());
       toast.success('Entrada al taller registrada correctamente');
       
       // Reset
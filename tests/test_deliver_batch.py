@@ -0,0 +1,80 @@
+"""
+Entrega por lotes (PUT /api/equipment/deliver) sobre una base de datos en
+memoria (mongomock-motor). mongomock no emite eventos de monitorización, así
+que el número de comandos por llamada solo se comprueba con un mongod real en
+test_round_trip_budgets.py; aquí se comprueba el resultado de la entrega.
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "deliver_batch")
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+CALIBRATION = {
+    "calibration_data": [{
+        "sensor": "CO", "pre_alarm": "20", "alarm": "35", "calibration_value": "50",
+        "valor_zero": "0", "valor_span": "100", "calibration_bottle": "B1000", "approved": True
+    }],
+    "spare_parts": [],
+    "calibration_date": "2025-10-25",
+    "technician": "Test",
+}
+
+
+@pytest.fixture
+def api():
+    from fastapi.testclient import TestClient
+    import server
+
+    original_db = server.db
+    server.db = mongomock_motor.AsyncMongoMockClient()["deliver_batch"]
+    try:
+        client = TestClient(server.app)
+        client.post("/api/auth/register", json={"username": "deliver", "password": "deliver", "full_name": "Deliver"})
+        token = client.post("/api/auth/login", json={"username": "deliver", "password": "deliver"}).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client, server.db
+    finally:
+        server.db = original_db
+
+
+def test_deliver_batch(api):
+    client, db = api
+    serials = [f"DB-{i}" for i in range(5)]
+    client.post("/api/equipment/batch", json={"equipment": [{
+        "brand": "MSA", "model": "Altair 4X", "client_name": "ACME", "client_cif": "A00000000",
+        "serial_number": serial, "entry_date": "2025-10-01"
+    } for serial in serials]})
+    for serial in serials[:4]:
+        assert client.put(f"/api/equipment/{serial}/calibrate", json=CALIBRATION).status_code == 200
+
+    # DB-4 sigue pendiente y DB-1 va repetido: se omiten
+    requested = ["DB-3", "DB-1", "DB-0", "DB-4", "DB-1", "DB-2"]
+    response = client.put("/api/equipment/deliver", json={
+        "serial_numbers": requested, "delivery_note": "ALB-1", "delivery_location": "Taller", "delivery_date": "2025-10-30"
+    })
+    assert response.status_code == 200
+
+    delivered = asyncio.run(db.equipment_delivered.find({}, {"_id": 0}).to_list(None))
+    certificates = {doc["serial_number"]: doc["certificate_number"] for doc in delivered}
+    assert set(certificates) == {"DB-0", "DB-1", "DB-2", "DB-3"}
+    # Números correlativos en el orden de la entrega
+    numbers = [int(certificates[serial].split("-")[1]) for serial in ["DB-3", "DB-1", "DB-0", "DB-2"]]
+    assert numbers == list(range(numbers[0], numbers[0] + 4))
+    assert all(doc["status"] == "delivered" and doc["delivery_note"] == "ALB-1" for doc in delivered)
+
+    assert asyncio.run(db.equipment.count_documents({"status": "delivered"})) == 0
+    assert [e["serial_number"] for e in client.get("/api/equipment/pending").json()] == ["DB-4"]
+    history = asyncio.run(db.calibration_history.find({}, {"_id": 0}).to_list(None))
+    assert {h["serial_number"]: h["certificate_number"] for h in history if h["certificate_number"]} == certificates
+    summary = asyncio.run(db.equipment_summary.find({"status": "delivered"}, {"_id": 0}).to_list(None))
+    assert {s["serial_number"]: s["last_certificate_number"] for s in summary} == certificates
+    stats = asyncio.run(db.workshop_stats.find_one({"_id": "status:delivered"}))
+    assert stats["count"] == 4
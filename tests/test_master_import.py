@@ -0,0 +1,38 @@
+"""
+Importación del catálogo maestro con update_existing sobre una base de datos
+en memoria (mongomock-motor).
+"""
+import asyncio
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from master_import import import_equipment_master  # noqa: E402
+
+
+def import_csv(db, text, update_existing=True):
+    return asyncio.run(import_equipment_master(db, io.BytesIO(text.encode()), "equipos.csv", update_existing))
+
+
+def test_partial_file_keeps_missing_and_blank_columns():
+    db = mongomock_motor.AsyncMongoMockClient()["master_import"]
+    import_csv(db, (
+        "serial_number,brand,model,cliente,cif,observaciones\n"
+        "SN1,MSA,Altair 4X,ACME,A00000000,keep\n"
+    ), update_existing=False)
+
+    # Sin columnas de cliente y con las observaciones vacías
+    report = import_csv(db, "serial_number,brand,model,observaciones\nSN1,MSA,Altair 5X,\n")
+
+    assert report["updated"] == 1 and not report["errors"]
+    doc = asyncio.run(db.equipment_master.find_one({"serial_number": "SN1"}))
+    assert doc["model"] == "Altair 5X"
+    assert doc["current_client_name"] == "ACME"
+    assert doc["current_client_cif"] == "A00000000"
+    assert doc["general_observations"] == "keep"
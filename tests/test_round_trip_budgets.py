@@ -0,0 +1,178 @@
+"""
+Presupuesto de idas y vueltas a MongoDB por endpoint.
+
+Cuenta, con la monitorización de comandos de pymongo, los comandos que emite
+cada llamada a la API y comprueba que no superan el presupuesto declarado en
+BUDGETS (incluida la consulta del usuario en get_current_user). Las rutas por
+lotes tienen un presupuesto fijo: entregar 1 o 50 equipos debe costar los
+mismos comandos, así que una regresión a un bucle con una consulta por equipo
+(N+1) hace fallar el test.
+
+Necesita un mongod local (MONGO_URL, por defecto mongodb://localhost:27017);
+sin él los tests se omiten. Cada ejecución usa una base de datos temporal que
+se borra al terminar.
+"""
+import os
+import sys
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from pymongo import MongoClient, monitoring
+from pymongo.errors import PyMongoError
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+MONGO_URL = os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "round_trip_budgets")
+TEST_DB = f"round_trip_budgets_{uuid.uuid4().hex[:8]}"
+
+# Máximo de comandos por llamada; `per_unit` es lo que puede crecer con el
+# número de equipos de la petición (0: independiente del tamaño del lote)
+BUDGETS = {
+    "POST /api/equipment": {"commands": 8},
+    "POST /api/equipment/batch": {"commands": 8, "per_unit": 0},
+    "GET /api/intake/{serial_number}": {"commands": 7},
+    "PUT /api/equipment/{serial_number}/calibrate": {"commands": 12},
+    "PUT /api/equipment/deliver": {"commands": 10, "per_unit": 0},
+    "GET /api/equipment/pending": {"commands": 3},
+    "GET /api/equipment/calibrated": {"commands": 3},
+    "GET /api/equipment/delivered": {"commands": 3},
+    "GET /api/equipment/{serial_number}/history": {"commands": 4},
+    "GET /api/equipment-summary/{serial_number}": {"commands": 3},
+}
+BATCH_SIZES = [1, 10, 50]
+CALIBRATION = {
+    "calibration_data": [{
+        "sensor": "CO", "pre_alarm": "20", "alarm": "35", "calibration_value": "50",
+        "valor_zero": "0", "valor_span": "100", "calibration_bottle": "B1000", "approved": True
+    }],
+    "spare_parts": [],
+    "calibration_date": "2025-10-25",
+    "technician": "Test",
+}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Comandos iniciados contra la base de datos de los tests"""
+
+    def __init__(self, database_name):
+        self.database_name = database_name
+        self.commands = Counter()
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.database_name == self.database_name:
+            with self._lock:
+                self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def reset(self):
+        with self._lock:
+            self.commands.clear()
+
+    @property
+    def total(self):
+        return sum(self.commands.values())
+
+
+def mongod_available():
+    try:
+        with MongoClient(MONGO_URL, serverSelectionTimeoutMS=500) as probe:
+            probe.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+@pytest.fixture(scope="module")
+def api():
+    if not mongod_available():
+        pytest.skip(f"No hay mongod disponible en {MONGO_URL}")
+
+    from fastapi.testclient import TestClient
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import server
+
+    counter = CommandCounter(TEST_DB)
+    original_db = server.db
+    server.db = AsyncIOMotorClient(MONGO_URL, event_listeners=[counter])[TEST_DB]
+    try:
+        with TestClient(server.app) as client:
+            client.post("/api/auth/register", json={"username": "budget", "password": "budget", "full_name": "Budget"})
+            token = client.post("/api/auth/login", json={"username": "budget", "password": "budget"}).json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+            yield client, counter
+    finally:
+        server.db = original_db
+        with MongoClient(MONGO_URL) as cleanup:
+            cleanup.drop_database(TEST_DB)
+
+
+def call(api, route, method, url, **kwargs):
+    """Hacer la llamada y devolver la respuesta y los comandos que ha emitido"""
+    client, counter = api
+    counter.reset()
+    response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, f"{route}: {response.status_code} {response.text}"
+    assert counter.total <= BUDGETS[route]["commands"], (
+        f"{route}: {counter.total} comandos, presupuesto {BUDGETS[route]['commands']} ({dict(counter.commands)})"
+    )
+    return response, counter.total
+
+
+def equipment(serial):
+    return {"brand": "MSA", "model": "Altair 4X", "client_name": "ACME", "client_cif": "A00000000",
+            "serial_number": serial, "entry_date": "2025-10-01"}
+
+
+def workshop_batch(api, prefix, size):
+    """Dar entrada y calibrar `size` equipos nuevos; devuelve los números de serie"""
+    serials = [f"{prefix}-{i}" for i in range(size)]
+    _, batch_commands = call(api, "POST /api/equipment/batch", "POST", "/api/equipment/batch",
+                             json={"equipment": [equipment(serial) for serial in serials]})
+    for serial in serials:
+        call(api, "PUT /api/equipment/{serial_number}/calibrate", "PUT", f"/api/equipment/{serial}/calibrate", json=CALIBRATION)
+    return serials, batch_commands
+
+
+def test_single_equipment_workflow(api):
+    serial = f"RT-{uuid.uuid4().hex[:6]}"
+    call(api, "GET /api/intake/{serial_number}", "GET", f"/api/intake/{serial}")
+    call(api, "POST /api/equipment", "POST", "/api/equipment", json=equipment(serial))
+    call(api, "GET /api/equipment/pending", "GET", "/api/equipment/pending")
+    call(api, "PUT /api/equipment/{serial_number}/calibrate", "PUT", f"/api/equipment/{serial}/calibrate", json=CALIBRATION)
+    call(api, "GET /api/equipment/calibrated", "GET", "/api/equipment/calibrated")
+    call(api, "PUT /api/equipment/deliver", "PUT", "/api/equipment/deliver", json={
+        "serial_numbers": [serial], "delivery_note": "ALB-1", "delivery_location": "Taller", "delivery_date": "2025-10-30"
+    })
+    call(api, "GET /api/equipment/delivered", "GET", "/api/equipment/delivered")
+    call(api, "GET /api/equipment/{serial_number}/history", "GET", f"/api/equipment/{serial}/history")
+    call(api, "GET /api/equipment-summary/{serial_number}", "GET", f"/api/equipment-summary/{serial}")
+
+
+def test_batch_routes_are_constant_in_batch_size(api):
+    entry_costs, delivery_costs = {}, {}
+    for size in BATCH_SIZES:
+        serials, entry_costs[size] = workshop_batch(api, f"RT{size}-{uuid.uuid4().hex[:6]}", size)
+        _, delivery_costs[size] = call(api, "PUT /api/equipment/deliver", "PUT", "/api/equipment/deliver", json={
+            "serial_numbers": serials, "delivery_note": f"ALB-{size}", "delivery_location": "Taller", "delivery_date": "2025-10-30"
+        })
+        delivered = api[0].get("/api/equipment/delivered").json()
+        certificates = {e["serial_number"]: e["certificate_number"] for e in delivered if e["serial_number"] in serials}
+        assert len(certificates) == size
+        assert len(set(certificates.values())) == size, "números de certificado repetidos"
+
+    smallest, largest = BATCH_SIZES[0], BATCH_SIZES[-1]
+    for route, costs in (("POST /api/equipment/batch", entry_costs), ("PUT /api/equipment/deliver", delivery_costs)):
+        growth = costs[largest] - costs[smallest]
+        allowed = BUDGETS[route]["per_unit"] * (largest - smallest)
+        assert growth <= allowed, f"{route}: {costs} comandos por tamaño de lote (crece {growth}, permitido {allowed})"